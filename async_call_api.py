@@ -0,0 +1,525 @@
+# -*- coding: UTF-8 -*-
+import time
+import asyncio
+import logging
+import random
+
+import aiohttp
+import requests
+
+from config import Config
+from configuration.async_custom_session import AsyncCustomSession
+from configuration.circuit_breaker import CircuitBreaker
+from configuration.metrics import MetricsRegistry
+from configuration.retry_policy import RetryPolicy
+from configuration.tracer import traced_methods
+from configuration.token_cache import TokenCache
+from configuration.traffic_stats import TrafficStats
+from pojo.account_context import AccountContext
+from pojo.api_error_set import APIErrorSet
+from pojo.graph_batch import BatchEnvelope
+from utils import Utils
+from errorInfo import ErrorCode
+from errorInfo import BasicException
+
+
+@traced_methods
+class AsyncCallAPI(object):
+    """
+    CallAPI 的异步版本
+    所有等待（启动延迟、轮次延迟、API 间隔）均为 asyncio.sleep，单个事件循环即可驱动全部账号；
+    数据库操作仍为同步实现，通过 asyncio.to_thread 放到默认线程池执行，避免阻塞事件循环
+    """
+
+    def __init__(self, job_detail_service, account_service, run_plan=None, account_snapshot=None, run_report=None):
+        super().__init__()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self.session = None
+        self.job_detail_service = job_detail_service
+        self.account_service = account_service
+        self.run_plan = run_plan
+        self.account_snapshot = account_snapshot
+        # 分片模式下的运行结果汇总，为 None 时每个账号单独发送通知
+        self.run_report = run_report
+
+    async def __aenter__(self):
+        # aiohttp 会话必须在事件循环内创建
+        self.session = AsyncCustomSession()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.logger.info("关闭异步连接池")
+        await self.session.close()
+
+    async def get_account_record(self, account_key):
+        """
+        读取账号记录，优先使用本次任务的账号快照
+        """
+        if self.account_snapshot is not None and account_key in self.account_snapshot:
+            return self.account_snapshot.get(account_key)
+        return await asyncio.to_thread(self.account_service.get_by_env_name, account_key)
+
+    async def get_user_data(self, account_context: AccountContext):
+        """
+        补充发送API所需的上下文信息
+        :param account_context:
+        :return:
+        """
+        user_agent = None
+        proxy = None
+        if Config.DATABASE_URL is None:
+            user_agent = Config.USER_AGENT_LIST[0] if Config.USER_AGENT_LIST else None
+            proxy = Config.PROXIES[0] if Config.PROXIES else None
+        else:
+            db_rec = await self.get_account_record(account_context.account_key)
+            user_agent = db_rec.user_agent
+            proxy = db_rec.proxy
+        account_context.user_agent = user_agent
+        account_context.proxy = proxy
+        self.logger.info(f"已获取用户上下文信息：User-Agent:{user_agent}, proxy:{proxy}.")
+
+    async def get_ms_token(self, client_id, client_secret, refresh_token, proxy, user_agent):
+        """
+        调用 OAuth2 刷新接口，返回 dict 中至少包含:
+          - access_token
+          - refresh_token (可能更新；若没有则继续使用旧的)
+          - expires_in (秒)
+        """
+        data = {
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'redirect_uri': Config.REDIRECT_URI,
+            "scope": "https://graph.microsoft.com/.default"
+        }
+
+        resp = await self.session.post(
+            Config.ACCESS_TOKEN_URI,
+            data=data,
+            timeout=10,
+            proxy=proxy,
+            # refresh_token 换取 token 可安全重发
+            retry=True,
+            headers = {
+                "User-Agent": user_agent,
+                "Content-Type": "application/x-www-form-urlencoded",
+            }
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def fetch_user_info(self, access_token, user_agent):
+        """
+        用 access_token 调用用户信息接口，例如 Microsoft Graph /me
+        返回 JSON dict；若失败抛异常或返回 None
+        """
+        resp = await self.session.get(
+            Config.USER_INFO_URL,
+            headers = {
+                "Authorization": f"Bearer {access_token}",
+                "User-Agent": user_agent,
+            },
+            timeout=10
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def request_token(self, account_context: AccountContext):
+        """
+        以账号上下文请求 token 端点，供 TokenCache 刷新时调用
+        """
+        return await self.get_ms_token(
+            Config.CLIENT_ID,
+            Config.CLIENT_SECRET,
+            account_context.refresh_token,
+            account_context.proxy,
+            account_context.user_agent
+        )
+
+    async def ensure_token(self, account_context: AccountContext):
+        """
+        获取账号当前的 token 记录，优先取进程级缓存，缓存未命中时才读取数据库；
+        数据库中不存在的账号请求新 token 并插入
+        """
+        account_key = account_context.account_key
+        refresh_token = account_context.refresh_token
+        token_cache = TokenCache.get_instance()
+        db_url = Config.DATABASE_URL
+
+        entry = token_cache.get(account_key)
+        if entry is None:
+            db_rec = None
+            if db_url is not None:
+                db_rec = await self.get_account_record(account_key)
+            if db_rec is None or not db_rec.access_token or db_rec.expires_at is None:
+                # 账号尚无 token；记录已存在（如批量预取时补齐的账号）时写穿透到数据库
+                entry = await token_cache.refresh_async(account_key, lambda: self.request_token(account_context), write_through=db_rec is not None)
+            else:
+                entry = token_cache.put(account_key, db_rec.access_token, Utils.add_beijing_timezone(db_rec.expires_at))
+
+            # 存储本次获取的信息
+            if db_url is not None and db_rec is None:
+                self.logger.info("数据库模式，插入用户token信息")
+                from pojo.account import Account
+                new_account = Account(
+                    env_name = account_key,
+                    access_token = entry.access_token,
+                    refresh_token = refresh_token,
+                    expires_at = entry.expires_at,
+                    create_time = Utils.get_beijing_time()
+                )
+                await asyncio.to_thread(self.account_service.insert, new_account)
+        return entry
+
+    async def prewarm_token(self, account_context: AccountContext):
+        """
+        预热阶段：补充上下文并确保 token 在刷新余量之后仍然有效
+        """
+        await self.get_user_data(account_context)
+        entry = await self.ensure_token(account_context)
+        if entry.expires_within(Config.TOKEN_REFRESH_MARGIN):
+            entry = await TokenCache.get_instance().refresh_async(
+                account_context.account_key,
+                lambda: self.request_token(account_context),
+                stale_token=entry.access_token
+            )
+        account_context.account_token = entry.access_token
+
+    async def get_access_and_userinfo(self, account_context: AccountContext):
+        """
+        account_key: "MS_TOKEN" 或 "MS_TOKEN_01" 等
+        refresh_token: 初始 refresh_token（从 Config.USER_TOKEN_DICT 取）
+        返回 (access_token, user_info_dict)
+        """
+        account_key = account_context.account_key
+        user_agent = account_context.user_agent
+        token_cache = TokenCache.get_instance()
+
+        user_info = None
+
+        # 获取token
+        entry = await self.ensure_token(account_context)
+
+        # 判断是否有有效 access_token
+        valid_access = False
+        if entry.access_token and entry.expires_at:
+            # 若在未来且剩余时间>10秒，视为有效；否则视为过期
+            if not entry.expires_within(10):
+                # 尝试获取用户信息
+                try:
+                    user_info = await self.fetch_user_info(entry.access_token, user_agent)
+                    valid_access = True
+                except requests.exceptions.HTTPError as e:
+                    response = e.response
+                    if response is None or response.status_code != 401:
+                        raise BasicException(ErrorCode.INVOKE_API_ERROR, extra=e)
+        if not valid_access:
+            self.logger.info("access_token 失效，尝试刷新")
+            # 刷新，并发刷新同一账号时共享一次请求，数据库模式下写穿透
+            entry = await token_cache.refresh_async(account_key, lambda: self.request_token(account_context), stale_token=entry.access_token)
+            self.logger.info("刷新成功")
+            # 重新获取用户信息
+            try:
+                user_info = await self.fetch_user_info(entry.access_token, user_agent)
+            except Exception as e:
+                raise BasicException(ErrorCode.INVOKE_API_ERROR, extra=e)
+
+        return entry.access_token, user_info
+
+    async def check_token_deadline(self, account_context: AccountContext) -> bool:
+        """
+        检查token是否过期并刷新
+        token 状态取自进程级缓存，其他线程已刷新时直接复用
+        """
+        token_cache = TokenCache.get_instance()
+        entry = token_cache.get(account_context.account_key)
+        if entry is None and Config.DATABASE_URL is not None \
+                and token_cache.find_account(account_context.account_token) is None:
+            # 本进程未缓存该 token 时，按指纹索引回查数据库
+            db_rec = await asyncio.to_thread(self.account_service.get_by_access_token, account_context.account_token)
+            if db_rec is not None and db_rec.expires_at is not None:
+                entry = token_cache.put(db_rec.env_name, db_rec.access_token, Utils.add_beijing_timezone(db_rec.expires_at))
+        if entry is not None and entry.access_token != account_context.account_token:
+            self.logger.info("token已被其他任务刷新")
+            account_context.account_token = entry.access_token
+            return True
+        # 判断是否存在数据库
+        if Config.DATABASE_URL is None:
+            self.logger.info("未配置数据库模式下刷新token")
+        else:
+            self.logger.info("数据库模式下刷新token")
+            if entry is not None and not entry.expires_within(0):
+                self.logger.info("缓存中token未过期！")
+                return False
+        entry = await token_cache.refresh_async(
+            account_context.account_key,
+            lambda: self.request_token(account_context),
+            stale_token=account_context.account_token
+        )
+        account_context.account_token = entry.access_token
+        return True
+
+    def get_template(self, api_index, account_context: AccountContext):
+        """
+        账号对单个接口的请求模板，首次调用时生成，之后每轮复用
+        """
+        template = account_context.templates.get(api_index)
+        if template is None:
+            template = self.session.prepare_template(
+                "GET",
+                Config.API_LIST[api_index],
+                headers={"User-Agent": account_context.user_agent},
+                proxy=account_context.proxy,
+                timeout=10,
+                probe=Config.ENABLE_PROBE_MODE
+            )
+            account_context.templates[api_index] = template
+        return template
+
+    async def call_api_once(self, api_index, account_context: AccountContext, err_set):
+        """
+        调用单个API并处理失败情况
+        """
+        breaker = CircuitBreaker.get_instance()
+        if not breaker.allow(api_index, account_context.account_key):
+            self.logger.info(f"第 {str(api_index)} 号api熔断中，跳过")
+            return
+        # 使用缓存中的最新 token，后台刷新后无需经历一次 401
+        entry = TokenCache.get_instance().get(account_context.account_key)
+        if entry is not None:
+            account_context.account_token = entry.access_token
+        try:
+            resp = await self.session.send_template(
+                self.get_template(api_index, account_context),
+                account_context.account_token
+            )
+            TrafficStats.get_instance().record(api_index, resp.wire_bytes, resp.memory_bytes)
+
+            if resp.status_code == 200:
+                self.logger.info('第' + str(api_index) + "号api调用成功")
+                breaker.record_success(api_index, account_context.account_key)
+            else:
+                self.logger.info(f"第 {str(api_index)} 号api调用失败, Detail: {resp.text}")
+                if resp.status_code == 401:
+                    if await self.check_token_deadline(account_context):
+                        self.logger.info("token过期导致失败，已刷新")
+                    else:
+                        err_set.add_error(api_index)
+                        raise ValueError("token刷新过程出错，function 'check_token_deadline' return false")
+                else:
+                    self.logger.error(f"API调用失败，且状态码超出预期，response:{resp.text}")
+                    err_set.add_error(api_index)
+                    breaker.record_failure(api_index, account_context.account_key)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 重试后仍连接失败或超时，计入接口熔断
+            breaker.record_failure(api_index, account_context.account_key)
+            self.logger.error(f"API 调用失败 - {Config.API_LIST[api_index]}, Detail: [{e}]")
+        except Exception as e:
+            self.logger.error(f"核心逻辑错误：API 调用失败 - {Config.API_LIST[api_index]}, Detail: [{e}]")
+        finally:
+            breaker.release_trial(api_index, account_context.account_key)
+
+    async def call_batch_once(self, envelope: BatchEnvelope, account_context: AccountContext, err_set):
+        """
+        以一个 $batch 请求调用一组API，并按子请求结果逐项处理
+        401 的子请求在刷新 token 后、429 的子请求按 RetryPolicy 等待（遵循 Retry-After）后重新打包发送
+        """
+        breaker = CircuitBreaker.get_instance()
+        allowed = [item for item in envelope.items if breaker.allow(item.api_index, account_context.account_key)]
+        if len(allowed) < len(envelope.items):
+            self.logger.info(f"{len(envelope.items) - len(allowed)} 个子请求熔断中，跳过")
+        if not allowed:
+            return
+        pending = allowed
+        retry_policy = self.session.retry_policy
+        throttle_attempt = 0
+        try:
+            for attempt in range(1, Config.MAX_RETRIES + 1):
+                # 使用缓存中的最新 token，后台刷新后无需经历一次 401
+                entry = TokenCache.get_instance().get(account_context.account_key)
+                if entry is not None:
+                    account_context.account_token = entry.access_token
+                resp = await self.session.post(
+                    envelope.batch_url,
+                    json=BatchEnvelope.payload(pending),
+                    # $batch 中均为 GET 子请求，可安全重发
+                    retry=True,
+                    headers={
+                        "Authorization": account_context.account_token,
+                        "User-Agent": account_context.user_agent,
+                    },
+                    proxy=account_context.proxy,
+                    timeout=10
+                )
+                if resp.status_code == 200:
+                    results = BatchEnvelope.split_responses(resp.json())
+                elif resp.status_code == 401:
+                    # 整个 $batch 被拒绝时，每个子请求按相同状态处理
+                    results = {item.request_id: (resp.status_code, dict(resp.headers)) for item in pending}
+                else:
+                    # 整个 $batch 的 429/5xx 已由会话按 RetryPolicy 重试，不再重复发送
+                    self.logger.error(f"$batch 调用失败，状态码 {resp.status_code}，response:{resp.text}")
+                    for item in pending:
+                        err_set.add_error(item.api_index)
+                    return
+
+                unauthorized, throttled, wait_seconds = [], [], 0
+                for item in pending:
+                    status, headers = results.get(item.request_id, (0, {}))
+                    if 200 <= status < 300:
+                        self.logger.info('第' + str(item.api_index) + "号api调用成功")
+                        breaker.record_success(item.api_index, account_context.account_key)
+                    elif status == 401:
+                        unauthorized.append(item)
+                    elif status == 429:
+                        throttled.append(item)
+                        wait_seconds = max(wait_seconds, BatchEnvelope.retry_after(headers, Config.BASE_BACKOFF))
+                    else:
+                        self.logger.error(f"第 {str(item.api_index)} 号api调用失败，状态码 {status}")
+                        err_set.add_error(item.api_index)
+                        breaker.record_failure(item.api_index, account_context.account_key)
+
+                if unauthorized:
+                    self.logger.info(f"{len(unauthorized)} 个子请求 token 失效")
+                    if await self.check_token_deadline(account_context):
+                        self.logger.info("token过期导致失败，已刷新")
+                    else:
+                        self.logger.error("token刷新过程出错，function 'check_token_deadline' return false")
+                        for item in unauthorized:
+                            err_set.add_error(item.api_index)
+                        unauthorized = []
+
+                delay = None
+                if throttled:
+                    # 子请求的 429 同样按 RetryPolicy 等待：不超过 RETRY_MAX_BACKOFF 与运行截止时刻，并消耗重试预算
+                    delay = retry_policy.next_delay(
+                        RetryPolicy.endpoint_of(envelope.batch_url), throttle_attempt, {"Retry-After": str(wait_seconds)}
+                    )
+                    throttle_attempt += 1
+                    if delay is None:
+                        self.logger.error(f"{len(throttled)} 个子请求被限流，已无重试次数或预算")
+                        for item in throttled:
+                            err_set.add_error(item.api_index)
+                        throttled = []
+
+                pending = unauthorized + throttled
+                if not pending or attempt == Config.MAX_RETRIES:
+                    break
+                if throttled:
+                    self.logger.warning(f"{len(throttled)} 个子请求被限流，{delay:.2f}s 后重试")
+                    await asyncio.sleep(delay)
+
+            for item in pending:
+                self.logger.error(f"第 {str(item.api_index)} 号api重试 {Config.MAX_RETRIES} 次后仍失败")
+                err_set.add_error(item.api_index)
+        except Exception as e:
+            self.logger.error(f"核心逻辑错误：$batch 调用失败 - {envelope.batch_url}, Detail: [{e}]")
+        finally:
+            for item in allowed:
+                breaker.release_trial(item.api_index, account_context.account_key)
+
+    async def run_api(self, api_list, account_context: AccountContext, err_set):
+        """
+        按照设定的轮次循环调用API
+        """
+        if Config.ENABLE_GRAPH_BATCH:
+            # 打包为 $batch 请求，API 调用延迟作用于每个 $batch
+            for envelope in Utils.build_batch_envelopes(api_list):
+                if Config.ENABLE_API_DELAY:
+                    await asyncio.sleep(random.randint(Config.API_DELAY_MIN, Config.API_DELAY_MAX))
+                await self.call_batch_once(envelope, account_context, err_set)
+            return
+        for a in range(len(api_list)):
+            if Config.ENABLE_API_DELAY:
+                await asyncio.sleep(random.randint(Config.API_DELAY_MIN, Config.API_DELAY_MAX))
+            await self.call_api_once(api_list[a], account_context, err_set)
+
+    async def run_planned_api(self, account_context: AccountContext, err_set):
+        """
+        按运行计划中的时间线调用API，超出截止时刻后放弃剩余调用
+        """
+        calls = account_context.plan.calls
+        current_round = None
+        done = 0
+        for offset, round_no, api_list in Utils.group_planned_calls(calls):
+            wait_seconds = self.run_plan.seconds_until(offset)
+            if wait_seconds > 0:
+                await asyncio.sleep(wait_seconds)
+            if self.run_plan.is_past_deadline():
+                self.logger.warning(
+                    f"应用/账号[{account_context.account_key}]已超出运行截止时刻，放弃剩余 {len(calls) - done} 次调用"
+                )
+                break
+            if round_no != current_round:
+                current_round = round_no
+                self.logger.info(f"应用/账号[{account_context.account_key}]的第[{str(current_round)}]轮开始")
+            if Config.ENABLE_GRAPH_BATCH:
+                for envelope in Utils.build_batch_envelopes(api_list):
+                    await self.call_batch_once(envelope, account_context, err_set)
+            else:
+                await self.call_api_once(api_list[0], account_context, err_set)
+            done += len(api_list)
+
+    async def core(self, account_context: AccountContext):
+        begin_time = time.time()  # 统计时间开始
+
+        # 错误集合
+        err_set = APIErrorSet()
+
+        self.logger.info('共' + str(Config.ROUNDS_PER_RUN) + '轮')
+        if account_context.plan is not None and self.run_plan is not None:
+            # 按运行计划执行，轮次与调用间隔已包含在时间线中
+            self.logger.info(f"按运行计划执行,共 {len(account_context.plan.calls)} 次调用")
+            await self.run_planned_api(account_context, err_set)
+        else:
+            for c in range(1, Config.ROUNDS_PER_RUN + 1):
+                # 运行轮次循环
+                if Config.ENABLE_RANDOM_START_DELAY:
+                    await asyncio.sleep(random.randint(
+                        Config.ROUNDS_PER_DELAY_MIN, Config.ROUNDS_PER_DELAY_MAX))
+                for a in range(1, Utils.api_lists_per_round() + 1):
+                    self.logger.info(f"应用/账号[{account_context.account_key}]的第[{str(c)}]轮开始")
+                    if Config.ENABLE_RANDOM_API_ORDER:
+                        api_list = Utils.fix_list(account_context.account_key)
+                        self.logger.info(f"已开启随机顺序,共 {len(api_list)} 个api")
+                        await self.run_api(api_list, account_context, err_set)
+                    else:
+                        self.logger.info("原版顺序,共10个api")
+                        api_list = [5, 9, 8, 1, 20, 24, 23, 6, 21, 22]
+                        await self.run_api(api_list, account_context, err_set)
+                self.logger.info("本轮结束，等待启动下一轮")
+
+        end_time = time.time()  # 统计时间结束
+        MetricsRegistry.get_instance().account_run_seconds.observe(end_time - begin_time)
+        run_time = round(end_time - begin_time)
+        hour = run_time // 3600
+        minute = (run_time - 3600 * hour) // 60
+        second = run_time - 3600 * hour - 60 * minute
+
+        run_times = [hour, minute, second]
+
+        if self.run_report is not None:
+            self.run_report.record(err_set, end_time - begin_time)
+        elif err_set.has_error:
+            try:
+                await asyncio.to_thread(Utils.send_message, 1, run_times, err_set)
+            except Exception as e:
+                self.logger.error(ErrorCode.SEND_NOTICE_ERROR)
+
+    async def run(self, account_context: AccountContext, *args):
+        try:
+            # 获取必要信息
+            await self.get_user_data(account_context)
+            # 1.登陆
+            self.logger.info("用户登陆")
+            access_token, user_info = await self.get_access_and_userinfo(account_context)
+            self.logger.info(f"已获取用户信息：access_token: ******, user_info: ******")
+
+            account_context.account_token = access_token
+
+            await self.core(account_context)
+            self.logger.info("核心正常结束")
+        except Exception as e:
+            raise BasicException(ErrorCode.MAIN_LOGICAL_ERROR, extra=e)
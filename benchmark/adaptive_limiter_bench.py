@@ -0,0 +1,72 @@
+# -*- coding: UTF-8 -*-
+"""
+基准：自适应并发限制器在多个事件循环中的表现
+账号租约按批运行时，异步模式每批各自执行一次 asyncio.run，同一个限制器须在先后多个事件循环中正常工作。
+在 --loops 个连续的事件循环中各启动 --tasks 个协程争用并发上限为 --limit 的限制器，输出每个事件循环的耗时；
+任一事件循环中出现异常、完成数不足或并发超出上限时以非零状态码退出，可在 CI 中作为回归检查
+
+运行方式：
+    python -m benchmark.adaptive_limiter_bench --loops 3 --tasks 50 --limit 1
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from configuration.adaptive_limiter import AdaptiveLimiter
+
+
+async def run_loop(limiter: AdaptiveLimiter, tasks: int, hold_seconds: float):
+    """
+    :return: (完成数, 异常列表, 观察到的最大并发)
+    """
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        await limiter.acquire_async()
+        peak = max(peak, limiter.in_flight)
+        begin = time.monotonic()
+        try:
+            await asyncio.sleep(hold_seconds)
+        finally:
+            await limiter.release_async(time.monotonic() - begin, False)
+
+    results = await asyncio.gather(*(call() for _ in range(tasks)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    return tasks - len(errors), errors, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loops', type=int, default=3, help='连续执行 asyncio.run 的次数')
+    parser.add_argument('--tasks', type=int, default=50, help='每个事件循环中争用限制器的协程数')
+    parser.add_argument('--limit', type=int, default=1, help='并发上限（初始值与最大值）')
+    parser.add_argument('--hold-ms', type=float, default=1.0, help='每次持有名额的时间（ms）')
+    args = parser.parse_args()
+
+    # 目标延迟足够大，持有期间并发上限保持不变
+    limiter = AdaptiveLimiter("bench", args.limit, 1, args.limit, latency_target=60)
+    failures = []
+    print(f"{'事件循环':<8}{'完成':>8}{'异常':>8}{'最大并发':>10}{'耗时(ms)':>12}")
+    for loop_no in range(1, args.loops + 1):
+        begin = time.perf_counter()
+        completed, errors, peak = asyncio.run(run_loop(limiter, args.tasks, args.hold_ms / 1000))
+        elapsed_ms = (time.perf_counter() - begin) * 1000
+        print(f"{loop_no:<8}{completed:>8}{len(errors):>8}{peak:>10}{elapsed_ms:>12.1f}")
+        if errors:
+            failures.append(f"第 {loop_no} 个事件循环出现 {len(errors)} 个异常，如 {errors[0]!r}")
+        if peak > args.limit:
+            failures.append(f"第 {loop_no} 个事件循环的并发 {peak} 超出上限 {args.limit}")
+    if limiter.in_flight != 0:
+        failures.append(f"结束后仍有 {limiter.in_flight} 个名额未归还")
+
+    if failures:
+        for failure in failures:
+            print(f"未通过：{failure}")
+        sys.exit(1)
+    print("通过：限制器在连续多个事件循环中均正常工作")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# -*- coding: UTF-8 -*-
+"""
+端到端压测：本地替身 OAuth/Graph 服务器 + SQLite（或本地 MySQL）+ 完整的 entrance() 流程
+每个账号规模在独立的子进程中运行（关闭启动延迟、轮次延迟与 API 调用延迟），输出：
+    账号/s、请求/s（Graph）、Graph 请求耗时 p50/p99、峰值 RSS，以及替身服务器统计的 401/429 次数
+
+运行方式：
+    python -m benchmark.e2e_bench --accounts 10 100 1000
+    python -m benchmark.e2e_bench --accounts 100 --mode async --latency-ms 80 --latency-dist lognormal \\
+        --unauthorized-rate 0.01 --throttle-rate 0.02 --body-bytes 4096 --output result.json
+在客户端注入故障（局部故障下的降级表现）：
+    python -m benchmark.e2e_bench --accounts 100 --fault-rules '[{"match": "api:0-9", "status": {"503": 0.5}}]'
+本机多进程分片：
+    python -m benchmark.e2e_bench --accounts 1000 --shard-processes 4
+使用本地 MySQL（表需已存在，可先执行 python utils.py --task Migrate）：
+    python -m benchmark.e2e_bench --database-url user:password@127.0.0.1:3306/office365
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/_bench/counters", timeout=1) as resp:
+                return json.load(resp)
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("替身服务器启动超时")
+
+
+def start_server(args, port):
+    command = [
+        sys.executable, "-m", "benchmark.fake_ms_server",
+        "--port", str(port),
+        "--latency-ms", str(args.latency_ms),
+        "--token-latency-ms", str(args.token_latency_ms),
+        "--latency-dist", args.latency_dist,
+        "--latency-sigma", str(args.latency_sigma),
+        "--unauthorized-rate", str(args.unauthorized_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after),
+        "--body-bytes", str(args.body_bytes),
+        "--page-size", str(args.page_size),
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def worker_env(args, accounts, base_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_ROOT,
+        "CLIENT_ID": "bench-client",
+        "CLIENT_SECRET": "bench-secret",
+        "GH_TOKEN": "bench",
+        "USER_EMAIL": "bench@example.com",
+        "TELEGRAM_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "0",
+        "ENV_MODE": "PROD",
+        "APP_NUM": str(accounts),
+        "API_LISTS_PER_ROUND": str(args.lists_per_round),
+        "EXECUTION_MODE": args.mode,
+        "ACCESS_TOKEN_URI": f"{base_url}/common/oauth2/v2.0/token",
+        "GRAPH_BASE_URL": base_url,
+        "GITHUB_ENV": os.path.join(workdir, "github_env"),
+        "MS_TOKEN": "bench-refresh-0",
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "SHARD_PROCESSES": str(args.shard_processes),
+    })
+    if args.fault_rules:
+        env.update({
+            "ENABLE_FAULT_INJECTION": "true",
+            "FAULT_INJECTION_RULES": args.fault_rules,
+            "FAULT_INJECTION_SEED": str(args.fault_seed),
+        })
+    for i in range(1, accounts):
+        env[f"MS_TOKEN_{i:02d}"] = f"bench-refresh-{i}"
+    return env
+
+
+def run_scale(args, accounts):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(args, port)
+    try:
+        wait_ready(base_url)
+        with tempfile.TemporaryDirectory(prefix="e2e_bench_") as workdir:
+            # 通知模板按相对路径读取
+            os.symlink(os.path.join(REPO_ROOT, "resource"), os.path.join(workdir, "resource"))
+            result_file = os.path.join(workdir, "result.json")
+            command = [
+                sys.executable, "-m", "benchmark.e2e_bench", "--worker",
+                "--rounds", str(args.rounds), "--result-file", result_file,
+            ]
+            if args.database_url is None:
+                command.append("--sqlite")
+            with open(os.path.join(workdir, "worker.log"), "w") as log:
+                code = subprocess.call(
+                    command, cwd=workdir, env=worker_env(args, accounts, base_url, workdir),
+                    stdout=log, stderr=subprocess.STDOUT,
+                )
+            if code != 0 or not os.path.exists(result_file):
+                with open(os.path.join(workdir, "worker.log")) as log:
+                    tail = log.read()[-2000:]
+                raise RuntimeError(f"N={accounts} 压测进程异常退出（{code}）：\n{tail}")
+            with open(result_file) as f:
+                result = json.load(f)
+        result["server"] = wait_ready(base_url)
+        result["accounts"] = accounts
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def setup_sqlite(database_url):
+    """压测进程内预先建立 SQLite 引擎与表结构"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from configuration.base_db_session import BaseDBSession
+    from pojo.account import Base as AccountBase
+    from pojo.account_lease import Base as AccountLeaseBase
+    from pojo.endpoint_health import Base as EndpointHealthBase
+    from pojo.job_detail import Base as JobDetailBase
+
+    engine = create_engine(database_url, connect_args={"check_same_thread": False, "timeout": 30})
+    for base in (AccountBase, JobDetailBase, EndpointHealthBase, AccountLeaseBase):
+        base.metadata.create_all(engine)
+    BaseDBSession._engine = engine
+    BaseDBSession._SessionFactory = sessionmaker(bind=engine)
+
+
+def is_graph_endpoint(endpoint):
+    """Graph 接口（不含 token 端点与通知、IP 查询）"""
+    return "/" in endpoint and not endpoint.endswith("/oauth2/v2.0/token")
+
+
+def graph_latency(metrics):
+    """合并 Graph 接口的请求耗时"""
+    histogram = metrics.http_request_seconds
+    counts, total, count = [0] * len(histogram.buckets), 0.0, 0
+    for (endpoint,), (bucket_counts, bucket_sum, bucket_count) in histogram.items().items():
+        if not is_graph_endpoint(endpoint):
+            continue
+        counts = [a + b for a, b in zip(counts, bucket_counts)]
+        total += bucket_sum
+        count += bucket_count
+    state = (counts, total, count)
+    return count, histogram.quantile(0.5, state), histogram.quantile(0.99, state)
+
+
+def shard_graph_latency(metrics, metrics_files):
+    """
+    本机分片时请求发生在子进程中：从各分片写出的 OpenMetrics 文件合并 Graph 接口的耗时分桶
+    """
+    histogram = metrics.http_request_seconds
+    bounds = {bound: index for index, bound in enumerate(histogram.buckets)}
+    cumulative = {}
+    for path in metrics_files:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                match = re.match(r'office365_http_request_seconds_bucket\{endpoint="(.*)",le="(.*)"\} (\d+)', line)
+                if match is None or not is_graph_endpoint(match.group(1)):
+                    continue
+                bound = float("inf") if match.group(2) == "+Inf" else float(match.group(2))
+                key = (path, match.group(1))
+                cumulative.setdefault(key, [0] * len(histogram.buckets))[bounds[bound]] = int(match.group(3))
+    counts = [0] * len(histogram.buckets)
+    for series in cumulative.values():
+        # 文本中的分桶为累计值，还原为各桶计数
+        counts = [total + value - (series[index - 1] if index else 0) for index, (total, value) in enumerate(zip(counts, series))]
+    state = (counts, 0.0, sum(counts))
+    return state[2], histogram.quantile(0.5, state), histogram.quantile(0.99, state)
+
+
+def run_worker(args):
+    """在子进程中运行一次完整的 entrance()"""
+    from config import Config
+    from configuration.logger_config import CLogger
+    from configuration.metrics import MetricsRegistry
+
+    CLogger.setup_logger()
+    Config.load()
+    CLogger.apply_config()
+    # 压测只关心吞吐，关闭全部人为延迟
+    Config.ROUNDS_PER_RUN = args.rounds
+    Config.ENABLE_RANDOM_START_DELAY = False
+    Config.ENABLE_API_DELAY = False
+    Config.MIN_START_DELAY = 0
+    Config.MAX_START_DELAY = 0
+    base_url = Config.GRAPH_BASE_URL
+    Config.IP_INFO_URL = f"{base_url}/_bench/ipinfo"
+    Config.TELEGRAM_URL = f"{base_url}/_bench/bot"
+    if args.sqlite:
+        setup_sqlite(Config.DATABASE_URL)
+    if Config.SHARD_PROCESSES > 1:
+        Config.METRICS_FILE = os.path.abspath("bench.metrics")
+
+    import index
+    begin = time.perf_counter()
+    try:
+        index.entrance()
+    except SystemExit:
+        pass
+    elapsed = time.perf_counter() - begin
+
+    metrics = MetricsRegistry.get_instance()
+    if Config.SHARD_PROCESSES > 1:
+        requests_count, p50, p99 = shard_graph_latency(metrics, glob.glob(f"{Config.METRICS_FILE}.shard*"))
+    else:
+        requests_count, p50, p99 = graph_latency(metrics)
+    accounts = int(Config.APP_NUM)
+    result = {
+        "mode": Config.EXECUTION_MODE,
+        "elapsed_s": round(elapsed, 3),
+        "accounts_per_s": round(accounts / elapsed, 2),
+        "graph_requests": requests_count,
+        "requests_per_s": round(requests_count / elapsed, 2),
+        "p50_ms": None if p50 is None else round(p50 * 1000, 2),
+        "p99_ms": None if p99 is None else round(p99 * 1000, 2),
+        # Linux 下 ru_maxrss 的单位为 KB；本机分片时取主进程与最大的子进程中较大者
+        "peak_rss_mb": round(max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        ) / 1024, 1),
+        "shard_processes": Config.SHARD_PROCESSES,
+        "summary": metrics.summary(),
+    }
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+def print_table(results):
+    header = f"{'N':>6}{'耗时(s)':>10}{'账号/s':>10}{'请求/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'RSS(MB)':>10}{'401':>7}{'429':>7}"
+    print(header)
+    for r in results:
+        print(
+            f"{r['accounts']:>6}{r['elapsed_s']:>10.2f}{r['accounts_per_s']:>10.2f}{r['requests_per_s']:>10.1f}"
+            f"{r['p50_ms'] or 0:>10.2f}{r['p99_ms'] or 0:>10.2f}{r['peak_rss_mb']:>10.1f}"
+            f"{r['server']['unauthorized']:>7}{r['server']['throttled']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 100, 1000], help='账号规模，可指定多个')
+    parser.add_argument('--mode', default="thread", choices=("thread", "async"), help='执行引擎')
+    parser.add_argument('--rounds', type=int, default=1, help='每个账号的调用轮数')
+    parser.add_argument('--lists-per-round', type=int, default=1,
+                        help='每轮调用的 API 列表数（生产默认与账号数相同，压测时固定以保持每账号工作量不变）')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Graph 平均响应延迟（ms）')
+    parser.add_argument('--token-latency-ms', type=float, default=100.0, help='token 端点平均响应延迟（ms）')
+    parser.add_argument('--latency-dist', default="lognormal", choices=("fixed", "uniform", "exp", "lognormal"))
+    parser.add_argument('--latency-sigma', type=float, default=0.8, help='lognormal 分布的 sigma')
+    parser.add_argument('--unauthorized-rate', type=float, default=0.0, help='Graph 请求返回 401 的概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Graph 请求返回 429 的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应的 Retry-After（s）')
+    parser.add_argument('--body-bytes', type=int, default=2048, help='Graph 响应体填充字节数')
+    parser.add_argument('--page-size', type=int, default=10, help='Graph 响应中的数据条数')
+    parser.add_argument('--shard-processes', type=int, default=1, help='本机分片进程数（SHARD_PROCESSES）')
+    parser.add_argument('--fault-rules', default=None,
+                        help='客户端故障注入规则（JSON，见 configuration/fault_injector.py），如 \'[{"match": "api:0-9", "drop": 0.5}]\'')
+    parser.add_argument('--fault-seed', default="0", help='故障注入随机种子')
+    parser.add_argument('--database-url', default=None, help='本地 MySQL 连接串（user:password@host:port/db），默认使用 SQLite')
+    parser.add_argument('--output', default=None, help='结果输出文件（JSON），便于前后对比')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--sqlite', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = []
+    for accounts in args.accounts:
+        print(f"运行 N={accounts} ...", flush=True)
+        results.append(run_scale(args, accounts))
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ("worker", "sqlite", "result_file")},
+                       "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# -*- coding: UTF-8 -*-
+"""
+本地替身服务器：模拟 OAuth2 token 端点与 Graph 接口，用于离线运行与压测
+
+启动方式：
+    python -m benchmark.fake_ms_server --port 8765
+
+配合以下环境变量运行 index.py 即可不访问微软服务：
+    ACCESS_TOKEN_URI=http://127.0.0.1:8765/common/oauth2/v2.0/token
+    GRAPH_BASE_URL=http://127.0.0.1:8765
+
+压测相关参数：
+    --latency-ms / --latency-dist   Graph 响应延迟（fixed/uniform/exp/lognormal，均值为 latency-ms）
+    --token-latency-ms              token 端点响应延迟（分布同上）
+    --unauthorized-rate             Graph 请求吊销当前 token 并返回 401 的概率
+    --throttle-rate                 Graph 请求返回 429 的概率
+    --body-bytes                    Graph 响应体的填充字节数
+    --log-dir / --upload-kbps       PUT /_bench/logs/<文件名> 收到的日志分块的保存目录与模拟上传带宽（KB/s）
+另提供 /_bench/ipinfo、/_bench/bot*（通知）与 /_bench/counters（请求统计），供端到端压测替代外部服务
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeMSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 压测时不输出逐条访问日志
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _token(self):
+        token = self.headers.get("Authorization", "")
+        if token.startswith("Bearer "):
+            token = token[len("Bearer "):]
+        return token
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        path = urlsplit(self.path).path
+        if path.startswith("/_bench/bot"):
+            self.server.count("notifications")
+            self._send_json(200, {"ok": True})
+            return
+        if path in ("/v1.0/$batch", "/beta/$batch"):
+            self.server.delay(self.server.latency_ms)
+            self._handle_batch(body)
+            return
+        if not path.endswith("/oauth2/v2.0/token"):
+            self._send_json(404, {"error": "not_found"})
+            return
+        self.server.delay(self.server.token_latency_ms)
+        self._send_json(200, self.server.issue_token())
+
+    def do_PUT(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        path = urlsplit(self.path).path
+        if not path.startswith("/_bench/logs/"):
+            self._send_json(404, {"error": "not_found"})
+            return
+        self.server.receive_log(path.rsplit("/", 1)[-1], body)
+        self._send_json(201, {"ok": True})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/_bench/ipinfo":
+            self._send_json(200, {"ip": "127.0.0.1", "city": "Local", "timezone": "Asia/Shanghai", "org": "fake-ms-server"})
+            return
+        if path == "/_bench/counters":
+            self._send_json(200, self.server.snapshot())
+            return
+        if path.startswith("/_bench/bot"):
+            self.server.count("notifications")
+            self._send_json(200, {"ok": True})
+            return
+        if not (path.startswith("/v1.0/") or path.startswith("/beta/") or path == "/v1.0"):
+            self._send_json(404, {"error": "not_found"})
+            return
+        self.server.delay(self.server.latency_ms)
+        self.server.count("graph_requests")
+        status, headers, payload = self.server.graph_response(self.path, self._token())
+        self._send_json(status, payload, headers)
+
+    def _handle_batch(self, body):
+        """
+        JSON $batch：逐个子请求校验 token 并返回各自的状态，最多 20 个子请求
+        """
+        self.server.count("batch_requests")
+        try:
+            requests = json.loads(body or b"{}").get("requests", [])
+        except ValueError:
+            self._send_json(400, {"error": {"code": "BadRequest"}})
+            return
+        if not requests or len(requests) > 20:
+            self._send_json(400, {"error": {"code": "BadRequest", "message": "1~20 requests per batch"}})
+            return
+        token = self._token()
+        responses = []
+        for sub_request in requests:
+            self.server.count("graph_requests")
+            status, headers, payload = self.server.graph_response(sub_request.get("url", ""), token)
+            responses.append({"id": sub_request.get("id"), "status": status, "headers": headers, "body": payload})
+        self._send_json(200, {"responses": responses})
+
+
+class FakeMSServer(ThreadingHTTPServer):
+    """
+    在后台线程运行的替身服务器
+    """
+    daemon_threads = True
+
+    LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exp", "lognormal")
+
+    def __init__(self, host="127.0.0.1", port=0, expires_in=3600, throttle_rate=0.0, retry_after=1, page_size=0,
+                 latency_ms=0.0, token_latency_ms=0.0, latency_dist="fixed", latency_sigma=1.0,
+                 unauthorized_rate=0.0, body_bytes=0, log_dir=None, upload_kbps=0.0):
+        super().__init__((host, port), FakeMSHandler)
+        self.expires_in = expires_in
+        self.page_size = page_size
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.latency_ms = latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.unauthorized_rate = unauthorized_rate
+        self.body_bytes = body_bytes
+        self.log_dir = log_dir
+        self.upload_kbps = upload_kbps
+        self._counter = itertools.count(1)
+        self._tokens = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {
+            "token_requests": 0, "graph_requests": 0, "batch_requests": 0,
+            "unauthorized": 0, "throttled": 0, "notifications": 0, "log_chunks": 0, "log_bytes": 0,
+        }
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def receive_log(self, name: str, body: bytes):
+        """接收上传的日志分块，按 upload_kbps 模拟上传耗时"""
+        if self.upload_kbps > 0:
+            time.sleep(len(body) / (self.upload_kbps * 1024))
+        if self.log_dir:
+            with open(os.path.join(self.log_dir, os.path.basename(name)), "wb") as f:
+                f.write(body)
+        with self._lock:
+            self.counters["log_chunks"] += 1
+            self.counters["log_bytes"] += len(body)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def delay(self, mean_ms):
+        """按配置的分布模拟服务端处理耗时，均值为 mean_ms"""
+        if mean_ms <= 0:
+            return
+        if self.latency_dist == "uniform":
+            ms = random.uniform(0, 2 * mean_ms)
+        elif self.latency_dist == "exp":
+            ms = random.expovariate(1 / mean_ms)
+        elif self.latency_dist == "lognormal":
+            # 均值保持为 mean_ms，sigma 越大长尾越重
+            mu = math.log(mean_ms) - self.latency_sigma ** 2 / 2
+            ms = random.lognormvariate(mu, self.latency_sigma)
+        else:
+            ms = mean_ms
+        time.sleep(ms / 1000)
+
+    def graph_response(self, url, token):
+        """
+        单个 Graph 请求的结果
+        响应包含 page_size 条模拟数据，遵循 $top 与 $select=id
+        :return: (status, headers, body)
+        """
+        if not self.is_valid_token(token):
+            return 401, {}, {"error": {"code": "InvalidAuthenticationToken"}}
+        if self.unauthorized_rate and random.random() < self.unauthorized_rate:
+            # 模拟 token 提前失效：吊销后该 token 的后续请求均返回 401，直到客户端刷新
+            with self._lock:
+                self._tokens.discard(token)
+                self.counters["unauthorized"] += 1
+            return 401, {}, {"error": {"code": "InvalidAuthenticationToken"}}
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            self.count("throttled")
+            return 429, {"Retry-After": str(self.retry_after)}, {"error": {"code": "TooManyRequests"}}
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        count = self.page_size
+        if query.get("$top", [""])[0].isdigit():
+            count = min(count, int(query["$top"][0]))
+        items = []
+        for i in range(count):
+            item = {"id": f"item-{i:06d}"}
+            if query.get("$select") != ["id"]:
+                item.update({"displayName": f"Item {i}", "description": "x" * 400})
+            items.append(item)
+        payload = {"@odata.context": parts.path, "value": items}
+        if self.body_bytes and query.get("$select") != ["id"]:
+            payload["padding"] = "x" * self.body_bytes
+        return 200, {}, payload
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def token_url(self):
+        return f"{self.base_url}/common/oauth2/v2.0/token"
+
+    def issue_token(self):
+        with self._lock:
+            self.counters["token_requests"] += 1
+            token = f"fake-access-token-{next(self._counter)}"
+            self._tokens.add(token)
+        return {
+            "token_type": "Bearer",
+            "access_token": token,
+            "refresh_token": "fake-refresh-token",
+            "expires_in": self.expires_in,
+        }
+
+    def is_valid_token(self, token):
+        with self._lock:
+            return token in self._tokens
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ms-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default="127.0.0.1", help='监听地址')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口')
+    parser.add_argument('--expires-in', type=int, default=3600, help='签发 token 的有效期（s）')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Graph 请求返回 429 的概率')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应的 Retry-After（s）')
+    parser.add_argument('--page-size', type=int, default=0, help='Graph 响应中的数据条数')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Graph 响应的平均延迟（ms）')
+    parser.add_argument('--token-latency-ms', type=float, default=0.0, help='token 端点的平均延迟（ms）')
+    parser.add_argument('--latency-dist', default="fixed", choices=FakeMSServer.LATENCY_DISTRIBUTIONS, help='延迟分布')
+    parser.add_argument('--latency-sigma', type=float, default=1.0, help='lognormal 分布的 sigma')
+    parser.add_argument('--unauthorized-rate', type=float, default=0.0, help='Graph 请求返回 401 的概率')
+    parser.add_argument('--body-bytes', type=int, default=0, help='Graph 响应体的填充字节数')
+    parser.add_argument('--log-dir', default=None, help='上传日志分块的保存目录，为空则只计数')
+    parser.add_argument('--upload-kbps', type=float, default=0.0, help='模拟日志上传带宽（KB/s），0 表示不限速')
+    args = parser.parse_args()
+
+    server = FakeMSServer(
+        args.host, args.port, args.expires_in, args.throttle_rate, args.retry_after, args.page_size,
+        latency_ms=args.latency_ms, token_latency_ms=args.token_latency_ms, latency_dist=args.latency_dist,
+        latency_sigma=args.latency_sigma, unauthorized_rate=args.unauthorized_rate, body_bytes=args.body_bytes,
+        log_dir=args.log_dir, upload_kbps=args.upload_kbps,
+    )
+    logging.info(f"替身服务器已启动：token 端点 {server.token_url}，Graph 根地址 {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        logging.info(f"请求统计：{server.counters}")
@@ -0,0 +1,120 @@
+# -*- coding: UTF-8 -*-
+"""
+基准：文本日志结束后整体上传 vs JSON-lines 压缩分块边写边上传
+多个线程按 run_api 的日志模式写出日志，上传目标为本地替身服务器的 PUT /_bench/logs/（按 --upload-kbps 限速），对比：
+    - 文本日志：与 CLogger 默认格式相同，运行结束后整体上传（对应工作流中的 scp）
+    - gzip / zstd 分块：CompressedLogSink 写满一个分块即在后台上传，运行结束时只剩最后一个分块
+“结束后上传耗时”为日志写完到全部上传完成的时间，即运行结束后还需等待的时间
+
+运行方式：
+    python -m benchmark.log_sink_bench --threads 8 --calls 20000 --upload-kbps 2048
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmark.fake_ms_server import FakeMSServer
+from configuration.log_sink import CompressedLogSink
+from configuration.tracer import current_account
+
+
+def simulate_calls(account: str, calls: int):
+    current_account.set(account)
+    call_logger = logging.getLogger("CallAPI")
+    error_logger = logging.getLogger("APIErrorSet")
+    for i in range(calls):
+        api_index = i % 40
+        if i % 40 == 0:
+            call_logger.info(f"应用/账号[{account}]的第[{i // 40 + 1}]轮开始")
+        if i % 10:
+            call_logger.info('第' + str(api_index) + "号api调用成功")
+        else:
+            call_logger.info(f"第 {str(api_index)} 号api调用失败, Detail: {{'error': {{'code': 'TooManyRequests'}}}}")
+            error_logger.info("插入API调用错误集合")
+
+
+def run_logging(handler, threads: int, calls: int):
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(handler)
+    workers = [
+        threading.Thread(target=simulate_calls, args=(f"MS_TOKEN_{i:02d}", calls), name=f"account-{i}")
+        for i in range(threads)
+    ]
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    root_logger.removeHandler(handler)
+    return elapsed
+
+
+def measure_text(work_dir: str, upload_url: str, threads: int, calls: int):
+    log_file = os.path.join(work_dir, "bench.log")
+    handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    write_seconds = run_logging(handler, threads, calls)
+    handler.close()
+    begin = time.perf_counter()
+    with open(log_file, "rb") as f:
+        requests.put(f"{upload_url}/bench.log", data=f, timeout=600).raise_for_status()
+    tail_seconds = time.perf_counter() - begin
+    size = os.path.getsize(log_file)
+    return "文本日志", size, write_seconds, tail_seconds, 1
+
+
+def measure_sink(work_dir: str, upload_url: str, threads: int, calls: int, compression: str, chunk_bytes: int):
+    sink_dir = os.path.join(work_dir, compression)
+    sink = CompressedLogSink(sink_dir, compression, upload_url, chunk_bytes=chunk_bytes, chunk_seconds=3600)
+    write_seconds = run_logging(sink, threads, calls)
+    begin = time.perf_counter()
+    sink.finish(timeout=600)
+    tail_seconds = time.perf_counter() - begin
+    stats = sink.stats()
+    sink.close()
+    size = sum(os.path.getsize(os.path.join(sink_dir, name)) for name in os.listdir(sink_dir))
+    return f"{compression} 分块", size, write_seconds, tail_seconds, stats["chunks"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8, help='模拟账号线程数')
+    parser.add_argument('--calls', type=int, default=20000, help='每个线程的 API 调用次数')
+    parser.add_argument('--upload-kbps', type=float, default=2048, help='模拟上传带宽（KB/s）')
+    parser.add_argument('--chunk-bytes', type=int, default=1048576, help='LOG_SINK_CHUNK_BYTES（压缩前）')
+    args = parser.parse_args()
+
+    try:
+        import zstandard  # noqa: F401
+        compressions = ["gzip", "zstd"]
+    except ImportError:
+        compressions = ["gzip"]
+
+    server = FakeMSServer(upload_kbps=args.upload_kbps).start()
+    upload_url = f"{server.base_url}/_bench/logs"
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = [measure_text(work_dir, upload_url, args.threads, args.calls)]
+            for compression in compressions:
+                results.append(
+                    measure_sink(work_dir, upload_url, args.threads, args.calls, compression, args.chunk_bytes)
+                )
+    finally:
+        server.stop()
+
+    baseline_size, baseline_tail = results[0][1], results[0][3]
+    print(f"{'方式':<12}{'存储(KB)':>12}{'相对文本':>10}{'写出耗时(s)':>14}{'结束后上传(s)':>16}{'相对文本':>10}{'分块数':>8}")
+    for label, size, write_seconds, tail_seconds, chunks in results:
+        print(f"{label:<12}{size / 1024:>12.1f}{size / baseline_size:>10.3f}{write_seconds:>14.2f}"
+              f"{tail_seconds:>16.2f}{tail_seconds / baseline_tail:>10.3f}{chunks:>8}")
+
+
+if __name__ == "__main__":
+    main()
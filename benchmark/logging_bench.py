@@ -0,0 +1,101 @@
+# -*- coding: UTF-8 -*-
+"""
+微基准：每次 API 调用的日志开销
+多个线程模拟 run_api 热点循环，每次调用记录与 CallAPI.run_api / APIErrorSet.add_error 相同的日志，对比：
+    - 直接写出：根 logger 挂 FileHandler + StreamHandler（CLogger 默认方式），调用线程持锁做 I/O
+    - 队列：ENABLE_LOG_QUEUE，调用线程只入队，后台线程批量写出
+    - 队列 + 限流：在队列基础上按代码位置限流（LOG_RATE_LIMIT）
+“单次开销”为调用线程上每次 API 调用花在日志上的时间，“写完耗时”为调用结束后写出剩余日志所需的时间
+
+运行方式：
+    python -m benchmark.logging_bench --threads 8 --calls 20000 --rate-limit 50
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from configuration.logger_config import CLogger
+
+
+def simulate_calls(calls: int, barrier: threading.Barrier):
+    call_logger = logging.getLogger("CallAPI")
+    error_logger = logging.getLogger("APIErrorSet")
+    barrier.wait()
+    for i in range(calls):
+        api_index = i % 40
+        if i % 10:
+            call_logger.info('第' + str(api_index) + "号api调用成功")
+        else:
+            call_logger.info(f"第 {str(api_index)} 号api调用失败, Detail: {{'error': 'TooManyRequests'}}")
+            error_logger.info("插入API调用错误集合")
+
+
+def install_handlers(log_file: str, devnull):
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+        handler.close()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for handler in (logging.FileHandler(log_file, mode='w', encoding='utf-8'), logging.StreamHandler(devnull)):
+        handler.setFormatter(formatter)
+        root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
+
+
+def measure(label, threads: int, calls: int, log_file: str, devnull, queue_args=None):
+    install_handlers(log_file, devnull)
+    if queue_args is not None:
+        CLogger.start_queue(*queue_args)
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=simulate_calls, args=(calls, barrier)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    begin = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - begin
+    stats = CLogger.stats()
+    CLogger.stop_queue()
+    drained = time.perf_counter() - begin - elapsed
+    with open(log_file, encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    # 各线程并行执行相同次数的调用，单个线程上每次调用的平均耗时即日志开销
+    return label, elapsed / calls * 1e6, drained * 1000, lines, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8, help='模拟账号线程数')
+    parser.add_argument('--calls', type=int, default=20000, help='每个线程的 API 调用次数')
+    parser.add_argument('--batch-size', type=int, default=256, help='LOG_BATCH_SIZE')
+    parser.add_argument('--queue-size', type=int, default=100000, help='LOG_QUEUE_SIZE')
+    parser.add_argument('--rate-limit', type=int, default=50, help='LOG_RATE_LIMIT')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as devnull:
+        log_file = os.path.join(tmp_dir, "bench.log")
+        results = [
+            measure("直接写出", args.threads, args.calls, log_file, devnull),
+            measure("队列", args.threads, args.calls, log_file, devnull,
+                    (args.batch_size, args.queue_size, None)),
+            measure("队列 + 限流", args.threads, args.calls, log_file, devnull,
+                    (args.batch_size, args.queue_size, args.rate_limit)),
+        ]
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+            handler.close()
+
+    baseline = results[0][1]
+    print(f"{'方式':<14}{'单次开销(us)':>14}{'相对直接写出':>14}{'写完耗时(ms)':>14}{'写出行数':>10}{'丢弃':>8}{'限流省略':>10}")
+    for label, micros, drained, lines, stats in results:
+        print(f"{label:<14}{micros:>14.2f}{micros / baseline:>14.2f}{drained:>14.1f}{lines:>10}"
+              f"{stats['dropped']:>8}{stats['suppressed']:>10}")
+
+
+if __name__ == "__main__":
+    main()
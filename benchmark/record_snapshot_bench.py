@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+"""
+微基准：账号读接口的对象构造开销
+对比旧实现（ORM 查询后逐列 setattr 复制到新的 Account）与只读快照（按列查询直接构造 AccountRecord），
+输出单次调用耗时与单个返回对象的内存占用。数据库使用内存 SQLite，不需要 MySQL。
+
+运行方式：
+    python -m benchmark.record_snapshot_bench --accounts 200 --rounds 20
+"""
+import argparse
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from configuration.base_db_session import BaseDBSession
+from dao.account_service import AccountService
+from pojo.account import Account, Base
+
+
+class SqliteAccountService(AccountService):
+    """SQLite 不支持 SET TRANSACTION READ ONLY，只读会话退化为普通会话"""
+
+    def get_readonly_session(self):
+        return self.get_session()
+
+
+def setup(accounts):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    BaseDBSession._engine = engine
+    BaseDBSession._SessionFactory = sessionmaker(bind=engine)
+    service = SqliteAccountService()
+    with service.get_session() as session:
+        session.add_all([
+            Account(
+                env_name=f"MS_{i:04d}",
+                access_token="a" * 250,
+                refresh_token="r" * 250,
+                user_agent="Mozilla/5.0",
+                proxy=None,
+            )
+            for i in range(accounts)
+        ])
+    return service
+
+
+def legacy_get_by_env_name(service, env_name):
+    """旧实现：ORM 对象 + 逐列复制"""
+    with service.get_readonly_session() as session:
+        result = session.query(Account).filter(Account.env_name == env_name).first()
+        if result:
+            account = Account()
+            for column in Account.__table__.columns:
+                setattr(account, column.name, getattr(result, column.name))
+            return account
+        return None
+
+
+def legacy_get_by_env_names(service, env_names):
+    with service.get_readonly_session() as session:
+        results = session.query(Account).filter(Account.env_name.in_(list(env_names))).all()
+        copies = {}
+        for result in results:
+            account = Account()
+            for column in Account.__table__.columns:
+                setattr(account, column.name, getattr(result, column.name))
+            copies[result.env_name] = account
+        return copies
+
+
+def measure(label, func, calls):
+    func()
+    begin = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = (time.perf_counter() - begin) / calls
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = func()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del kept
+    return label, elapsed * 1e6, retained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--accounts', type=int, default=200, help='账号数量')
+    parser.add_argument('--rounds', type=int, default=20, help='每项测量的调用次数')
+    args = parser.parse_args()
+
+    service = setup(args.accounts)
+    env_names = [f"MS_{i:04d}" for i in range(args.accounts)]
+
+    results = [
+        measure("get_by_env_name  旧实现", lambda: legacy_get_by_env_name(service, env_names[0]), args.rounds * 50),
+        measure("get_by_env_name  快照  ", lambda: service.get_by_env_name(env_names[0]), args.rounds * 50),
+        measure("get_by_env_names 旧实现", lambda: legacy_get_by_env_names(service, env_names), args.rounds),
+        measure("get_by_env_names 快照  ", lambda: service.get_by_env_names(env_names), args.rounds),
+    ]
+    print(f"账号数 {args.accounts}")
+    print(f"{'接口':<24}{'单次耗时(us)':>14}{'返回对象内存(B)':>18}")
+    for label, micros, retained in results:
+        print(f"{label:<24}{micros:>14.1f}{retained:>18}")
+
+
+if __name__ == "__main__":
+    main()
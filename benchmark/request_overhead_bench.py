@@ -0,0 +1,99 @@
+# -*- coding: UTF-8 -*-
+"""
+微基准：单次请求的客户端开销（不含网络）
+挂载一个直接返回固定响应的 Adapter，对比：
+    - 旧实现：每次调用 deepcopy 默认 headers、重建 Authorization/User-Agent 与 proxies
+    - CustomSession.get：每次调用浅拷贝 headers，仍经过 Session.request 的完整合并流程
+    - 请求模板：每个账号、每个接口预解析一次，发送时仅替换 Authorization
+
+运行方式：
+    python -m benchmark.request_overhead_bench --calls 20000
+"""
+import argparse
+import copy
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from config import Config
+from configuration.custom_session import CustomSession
+
+
+class CannedAdapter(BaseAdapter):
+    """不发起网络请求，直接返回 200 的 Adapter"""
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"value": []}'
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+class LegacySession(CustomSession):
+    """旧版 CustomSession.request：每次调用 deepcopy 默认 headers"""
+
+    def request(self, method, url, **kwargs):
+        proxy = kwargs.pop('proxy', None)
+        headers = kwargs.pop('headers', {})
+        final_headers = copy.deepcopy(self.default_headers)
+        final_headers.update(headers)
+        kwargs['headers'] = final_headers
+        if proxy:
+            kwargs.setdefault('proxies', {'http': proxy, 'https': proxy})
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+def mount_canned(session):
+    adapter = CannedAdapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def measure(label, func, calls):
+    for _ in range(min(calls, 200)):
+        func()
+    begin = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - begin
+    return label, elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=20000, help='每项测量的请求次数')
+    parser.add_argument('--proxy', default=None, help='模拟账号代理地址（不会实际连接）')
+    args = parser.parse_args()
+
+    url = Config.API_LIST[5]
+    token = "Bearer " + "x" * 1200
+    user_agent = Config.USER_AGENT_LIST[0]
+
+    legacy = mount_canned(LegacySession())
+    current = mount_canned(CustomSession())
+    template = current.prepare_template("GET", url, headers={"User-Agent": user_agent}, proxy=args.proxy, timeout=10)
+
+    results = [
+        measure("旧实现 deepcopy", lambda: legacy.get(
+            url, headers={"Authorization": token, "User-Agent": user_agent}, proxy=args.proxy, timeout=10
+        ), args.calls),
+        measure("CustomSession.get", lambda: current.get(
+            url, headers={"Authorization": token, "User-Agent": user_agent}, proxy=args.proxy, timeout=10
+        ), args.calls),
+        measure("请求模板", lambda: current.send_template(template, token), args.calls),
+    ]
+    baseline = results[0][1]
+    print(f"{'路径':<20}{'单次开销(us)':>14}{'相对旧实现':>12}")
+    for label, micros in results:
+        print(f"{label:<20}{micros:>14.1f}{micros / baseline:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -*- coding: UTF-8 -*-
+"""
+基准：冷启动导入耗时（python -X importtime）与本地模式的导入约束
+每个入口模块在全新的子进程中导入 --repeat 次，取累计导入耗时的中位数，并检查：
+    - 未配置 DATABASE_URL 时不得导入 SQLAlchemy / PyMySQL / dao / 数据库模型
+    - 线程模式下不得导入 aiohttp；不得导入未使用的 apscheduler
+    - 本地模式执行 PostProcess 后仍不得导入上述模块
+超出 --budget-ms 或违反约束时以非零状态码退出，可在 CI 中作为启动耗时的门禁
+
+运行方式：
+    python -m benchmark.startup_bench --repeat 5 --budget-ms 300
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_MODULES = ("index", "utils")
+FORBIDDEN_PACKAGES = ("sqlalchemy", "pymysql", "aiohttp", "apscheduler", "dao")
+FORBIDDEN_MODULES = {"pojo.account", "pojo.job_detail", "pojo.endpoint_health", "pojo.account_lease",
+                     "configuration.base_db_session", "configuration.async_custom_session", "async_call_api"}
+# 本地模式下执行 PostProcess，输出执行后已加载的模块
+POST_PROCESS_SCRIPT = "import sys; from utils import Utils; Utils.post_process(); print('\\n'.join(sys.modules))"
+
+
+def local_env():
+    env = dict(os.environ)
+    env.pop("DATABASE_URL", None)
+    return env
+
+
+def forbidden(module_names):
+    return sorted({
+        name for name in module_names
+        if name in FORBIDDEN_MODULES or name.split(".", 1)[0] in FORBIDDEN_PACKAGES
+    })
+
+
+def import_time(module: str):
+    """
+    :return: (累计导入耗时 ms, 导入的模块名列表, 自身耗时最高的模块 [(ms, 模块名)])
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=local_env(), capture_output=True, text=True, check=True,
+    )
+    total_us, names, self_times = 0, [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        names.append(name.strip())
+        self_times.append((int(self_us) / 1000, name.strip()))
+        if name.strip() == module:
+            total_us = int(cumulative_us)
+    return total_us / 1000, names, sorted(self_times, reverse=True)[:5]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='每个入口模块的导入次数，取中位数')
+    parser.add_argument('--budget-ms', type=float, default=300, help='每个入口模块的累计导入耗时上限（ms）')
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'入口模块':<10}{'中位数(ms)':>12}{'最小(ms)':>12}{'预算(ms)':>12}  自身耗时最高的模块")
+    for module in ENTRY_MODULES:
+        runs = [import_time(module) for _ in range(args.repeat)]
+        totals = [total for total, _, _ in runs]
+        median = statistics.median(totals)
+        _, names, top = runs[-1]
+        top_text = ", ".join(f"{name} {ms:.1f}" for ms, name in top)
+        print(f"{module:<10}{median:>12.1f}{min(totals):>12.1f}{args.budget_ms:>12.1f}  {top_text}")
+        if median > args.budget_ms:
+            failures.append(f"{module} 导入耗时 {median:.1f}ms 超出预算 {args.budget_ms:.0f}ms")
+        loaded = forbidden(names)
+        if loaded:
+            failures.append(f"{module} 在本地模式下导入了 {', '.join(loaded)}")
+
+    result = subprocess.run(
+        [sys.executable, "-c", POST_PROCESS_SCRIPT],
+        cwd=REPO_ROOT, env=local_env(), capture_output=True, text=True, check=True,
+    )
+    loaded = forbidden(result.stdout.splitlines())
+    if loaded:
+        failures.append(f"本地模式 PostProcess 导入了 {', '.join(loaded)}")
+
+    if failures:
+        for failure in failures:
+            print(f"未通过：{failure}")
+        sys.exit(1)
+    print("通过：导入耗时在预算内，本地模式未导入数据库与异步相关模块")
+
+
+if __name__ == "__main__":
+    main()
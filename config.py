@@ -39,6 +39,7 @@ class Config:
 
 
     ROUNDS_PER_RUN = 6              # 调用轮数
+    API_LISTS_PER_ROUND = None      # 每个账号每轮调用的 API 列表数，默认与账号数量（APP_NUM）相同
     ENABLE_RANDOM_API_ORDER = True  # 随机API调用顺序
 
     ENABLE_RANDOM_START_DELAY = True  # 每轮启动延时
@@ -48,16 +49,89 @@ class Config:
     ENABLE_API_DELAY = True         # API调用延迟（防止API同一时间大量连续被访问）
     API_DELAY_MIN = 5
     API_DELAY_MAX = 20
+
+    EXECUTION_MODE = "thread"       # 执行引擎：thread（线程池）/ async（单事件循环驱动全部账号）
+    ASYNC_MAX_CONNECTIONS = 100     # 异步模式下 HTTP 连接池的最大连接数
+    GRAPH_BASE_URL = None           # Graph 接口根地址覆盖（用于本地替身服务器），格式:http://host:port
+    HTTP_POOL_MAXSIZE = 10          # 线程模式下每个主机（直连/每个代理）保持的最大长连接数，启动时按线程数自动放大
+    HTTP_POOL_HOSTS = 10            # 线程模式下缓存的主机连接池数量
+
+    RUN_TIME_BUDGET = None          # 运行时间预算（s），配置后预先生成完整调用时间线，总耗时不超过预算
+    PLAN_SAFETY_MARGIN = 0.1        # 预算安全余量比例，为请求耗时与收尾工作预留
+    PLAN_JITTER_RATIO = 0.3         # 调用时间点在所属时间槽内的随机抖动比例（0~1）
+    PLAN_MAX_THREADS = 200          # 线程模式下按计划执行时的最大线程数
+
+    ENABLE_TOKEN_PREWARM = True     # 启动前预热全部账号 token，并在到期前后台刷新
+    TOKEN_PREWARM_CONCURRENCY = 8   # token 预热并发数
+    TOKEN_REFRESH_MARGIN = 300      # token 到期前提前刷新的时间（s）
+
+    ENABLE_WRITE_BEHIND = False     # 数据库写入入队后由单个写线程合并、批量提交（write-behind）
+    WRITE_BEHIND_FLUSH_INTERVAL = 1 # write-behind 合并窗口（s）
+    WRITE_BEHIND_BATCH_SIZE = 200   # write-behind 单次提交的最大写入数
+
+    ENABLE_GRAPH_BATCH = False      # 将同一账号一轮内的调用打包为 Graph JSON $batch 请求
+    GRAPH_BATCH_SIZE = 20           # 单个 $batch 请求的子请求数上限（Graph 最多 20）
+
+    ENABLE_PROBE_MODE = False       # 探活模式：接口只请求最少数据（$top=1/$select=id），不解析、不缓存响应体
+    PROBE_DRAIN_LIMIT = 65536       # 探活模式下丢弃读取的响应体上限（B），超出后直接关闭连接而不归还连接池
+
+    REQUEST_TIMEOUT = 10            # 请求超时秒数
+    MAX_RETRIES = 3                 # 最大重试次数
+    BASE_BACKOFF = 5                # 基础退避（s），重试等待在 [0, BASE_BACKOFF * 2^n] 内随机取值
+    RETRY_MAX_BACKOFF = 60          # 单次重试等待上限（s），Retry-After 超出时同样截断
+    RETRY_BUDGET = 500              # 整次运行的重试总次数上限
+
+    ENABLE_ADAPTIVE_CONCURRENCY = False  # 按服务端实际表现自适应调整并发（AIMD），开启后不再使用固定的 API 调用延迟
+    GRAPH_CONCURRENCY_INITIAL = 10  # Graph 请求的初始并发上限
+    GRAPH_CONCURRENCY_MAX = 100     # Graph 请求的最大并发上限
+    TOKEN_CONCURRENCY_INITIAL = 4   # token 端点的初始并发上限
+    TOKEN_CONCURRENCY_MAX = 20      # token 端点的最大并发上限
+    CONCURRENCY_LATENCY_TARGET_MS = 2000  # 目标延迟（ms），超出时不再增加并发
+
+    ENABLE_CIRCUIT_BREAKER = False  # 按接口熔断（默认关闭）：连续失败的接口暂时跳过，由其他可用接口替补
+    CIRCUIT_SCOPE = "account"       # 熔断范围：account（按账号分别统计）/ global（所有账号共用）
+    CIRCUIT_FAILURE_THRESHOLD = 3   # 连续失败多少次后熔断
+    CIRCUIT_OPEN_SECONDS = 21600    # 熔断持续时间（s），到期后进入半开状态放行试探调用
+    CIRCUIT_HALF_OPEN_TRIALS = 1    # 半开状态下允许的试探调用数
+
+    METRICS_FILE = None             # 运行结束时写出 OpenMetrics 指标文本的文件路径
+    METRICS_PORT = None             # 运行期间在本地端口提供 /metrics（OpenMetrics 文本），供长时间运行时抓取
+
+    ENABLE_TRACING = False          # 记录运行过程的 span 追踪，输出 Chrome trace-event JSON
+    TRACE_FILE = None               # 追踪输出文件，默认为 <LOG_FILENAME>.trace.json（与日志文件一同上传）
+
+    ENABLE_FAULT_INJECTION = False  # HTTP 故障与延迟注入（离线压测用），生产环境勿开启
+    FAULT_INJECTION_SEED = 0        # 故障注入随机种子，相同种子下各账号的注入结果可复现
+    FAULT_INJECTION_RULES = None    # 故障注入规则（JSON 列表），未配置时按下列两项概率作用于全部 Graph 接口
+    FAILURE_SIMULATION_PROB = 0.08  # 失败模拟概率（整体），控制在 0.05~0.1
+    TIMEOUT_SIMULATION_PROB = 0.03  # 超时模拟概率
+
+    SHARD_PROCESSES = 1             # 本机分片进程数，大于 1 时按账号键哈希将启用账号分配到多个子进程运行
+    SHARD_INDEX = None              # 多 runner 分片：本 runner 负责的分片序号（0 起），需同时配置 SHARD_COUNT
+    SHARD_COUNT = 1                 # 多 runner 分片：分片总数
+    SHARD_RESULT_FILE = None        # 多 runner 分片的结果文件，默认为 <LOG_FILENAME>.shard<SHARD_INDEX>.json
+    JOB_ID = None                   # 指定任务 ID，多 runner 分片时各 runner 共用同一条任务记录
+
+    ENABLE_ACCOUNT_LEASE = False    # 多个 runner 共用数据库时按租约分批认领账号，各账号只由一个 runner 运行
+    LEASE_BATCH_SIZE = 50           # 每次认领的账号数；配置 RUN_TIME_BUDGET 时各批依次运行，建议不小于 账号数/runner 数
+    LEASE_SECONDS = 600             # 租约时长（s），持有期间每 1/3 时长续约一次，runner 崩溃后到期由其他 runner 回收
+    LEASE_COOLDOWN = 1800           # 账号运行完成后不再被认领的时间（s），应小于任务触发间隔
+
+    ENABLE_LOG_QUEUE = False        # 日志经队列由后台线程批量写出，工作线程记录日志时不做文件 I/O
+    LOG_BATCH_SIZE = 256            # 后台线程每次合并写出的最大日志条数
+    LOG_QUEUE_SIZE = 100000         # 日志队列容量，写出跟不上时丢弃 INFO 及以下级别的日志
+    LOG_RATE_LIMIT = None           # 同一代码位置每秒最多输出的 INFO 及以下级别日志条数，为空不限流（开启 ENABLE_LOG_QUEUE 时生效）
+
+    LOG_SINK_DIR = None             # JSON-lines 压缩日志的分块目录，配置后在文本日志之外另写压缩日志
+    LOG_SINK_COMPRESSION = "gzip"   # 压缩格式：gzip / zstd（需安装 zstandard）
+    LOG_SINK_CHUNK_BYTES = 4194304  # 单个分块压缩前的大小上限（字节），写满后开始下一个分块
+    LOG_SINK_CHUNK_SECONDS = 60     # 单个分块的最长写入时间（s），到期后开始下一个分块
+    LOG_SINK_UPLOAD_URL = None      # 分块完成后立即上传的地址：http(s):// 地址按文件名 PUT，其他值视为目录并复制
     # ---------------------------------------------------------------
 
     # ------------------------- 未启用配置区域 -------------------------
     REQUEST_DELAY_MIN = 1           # 最小请求延迟时间（s）
     REQUEST_DELAY_MAX = 5           # 最大请求延迟时间（s）
-    FAILURE_SIMULATION_PROB = 0.08  # 失败模拟概率（整体），控制在 0.05~0.1
-    TIMEOUT_SIMULATION_PROB = 0.03  # 超时模拟概率
-    REQUEST_TIMEOUT = 10            # 请求超时秒数
-    MAX_RETRIES = 3                 # 最大重试次数
-    BASE_BACKOFF = 5                # 基础退避
     # ---------------------------------------------------------------
 
     # ------------------------- 自动配置区域 ---------------------------
@@ -69,8 +143,34 @@ class Config:
     REDIRECT_URI = "http://localhost:53682/"
     # 获取access_token的请求端点
     ACCESS_TOKEN_URI = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
+    # Graph 接口默认根地址
+    GRAPH_DEFAULT_BASE_URL = "https://graph.microsoft.com"
+    # 获取用户信息的请求端点
+    USER_INFO_URL = "https://graph.microsoft.com/v1.0/me"
     # telegram发送通知地址
     TELEGRAM_URL = "https://api.telegram.org/bot"
+    # 探活模式下各接口追加的查询参数（按版本根地址之后的路径匹配，已有同名参数时不追加）
+    PROBE_QUERIES = {
+        '/me/': '$select=id',
+        '/users': '$top=1&$select=id',
+        '/me/people': '$top=1&$select=id',
+        '/groups': '$top=1&$select=id',
+        '/me/contacts': '$top=1&$select=id',
+        '/me/drive/root': '$select=id',
+        '/me/drive/root/children': '$top=1&$select=id',
+        '/drive/root': '$select=id',
+        '/me/drive': '$select=id',
+        '/me/calendars': '$top=1&$select=id',
+        '/me/events': '$top=1&$select=id',
+        '/sites/root': '$select=id',
+        '/sites/root/sites': '$top=1&$select=id',
+        '/me/onenote/notebooks': '$top=1&$select=id',
+        '/me/onenote/sections': '$top=1&$select=id',
+        '/me/onenote/pages': '$top=1&$select=id',
+        '/me/messages': '$top=1&$select=id',
+        '/me/mailFolders': '$top=1&$select=id',
+        '/me/mailFolders/Inbox/messages/delta': '$select=id',
+    }
 
 
     REQUEST_COMMON_HEADERS = {
@@ -216,6 +316,137 @@ class Config:
                     extra="无法启用通知功能，Tel & Email 均未配置"
                 )
 
+        # 执行引擎配置
+        cls.EXECUTION_MODE = os.getenv("EXECUTION_MODE", cls.EXECUTION_MODE).lower()
+        if cls.EXECUTION_MODE not in ("thread", "async"):
+            raise BasicException(
+                ErrorCode.INIT_ENVIRONMENT_ERROR,
+                extra=f"环境变量 EXECUTION_MODE 配置错误，仅支持 thread/async，当前为 {cls.EXECUTION_MODE}"
+            )
+        cls._load_positive_int("ASYNC_MAX_CONNECTIONS")
+        cls._load_positive_int("HTTP_POOL_MAXSIZE")
+        cls._load_positive_int("HTTP_POOL_HOSTS")
+
+        cls._load_positive_int("API_LISTS_PER_ROUND")
+
+        # 运行时间预算
+        cls._load_positive_int("RUN_TIME_BUDGET")
+
+        # token 预热与后台刷新
+        cls._load_bool("ENABLE_TOKEN_PREWARM")
+        cls._load_positive_int("TOKEN_PREWARM_CONCURRENCY")
+        cls._load_positive_int("TOKEN_REFRESH_MARGIN")
+
+        # 数据库 write-behind
+        cls._load_bool("ENABLE_WRITE_BEHIND")
+        cls._load_positive_int("WRITE_BEHIND_FLUSH_INTERVAL")
+        cls._load_positive_int("WRITE_BEHIND_BATCH_SIZE")
+
+        # Graph $batch
+        cls._load_bool("ENABLE_GRAPH_BATCH")
+        cls._load_positive_int("GRAPH_BATCH_SIZE")
+
+        # 探活模式
+        cls._load_bool("ENABLE_PROBE_MODE")
+        cls._load_positive_int("PROBE_DRAIN_LIMIT")
+
+        # 请求重试
+        cls._load_positive_int("REQUEST_TIMEOUT")
+        cls._load_positive_int("MAX_RETRIES")
+        cls._load_positive_int("BASE_BACKOFF")
+        cls._load_positive_int("RETRY_MAX_BACKOFF")
+        cls._load_positive_int("RETRY_BUDGET")
+
+        # 自适应并发
+        cls._load_bool("ENABLE_ADAPTIVE_CONCURRENCY")
+        cls._load_positive_int("GRAPH_CONCURRENCY_INITIAL")
+        cls._load_positive_int("GRAPH_CONCURRENCY_MAX")
+        cls._load_positive_int("TOKEN_CONCURRENCY_INITIAL")
+        cls._load_positive_int("TOKEN_CONCURRENCY_MAX")
+        cls._load_positive_int("CONCURRENCY_LATENCY_TARGET_MS")
+        if cls.ENABLE_ADAPTIVE_CONCURRENCY:
+            # 由并发限制器决定请求节奏，不再叠加固定的随机延迟
+            cls.ENABLE_API_DELAY = False
+
+        # 接口熔断
+        cls._load_bool("ENABLE_CIRCUIT_BREAKER")
+        cls.CIRCUIT_SCOPE = os.getenv("CIRCUIT_SCOPE", cls.CIRCUIT_SCOPE).lower()
+        if cls.CIRCUIT_SCOPE not in ("account", "global"):
+            raise BasicException(
+                ErrorCode.INIT_ENVIRONMENT_ERROR,
+                extra=f"环境变量 CIRCUIT_SCOPE 配置错误，仅支持 account/global，当前为 {cls.CIRCUIT_SCOPE}"
+            )
+        cls._load_positive_int("CIRCUIT_FAILURE_THRESHOLD")
+        cls._load_positive_int("CIRCUIT_OPEN_SECONDS")
+        cls._load_positive_int("CIRCUIT_HALF_OPEN_TRIALS")
+
+        # 运行指标导出
+        cls.METRICS_FILE = os.getenv("METRICS_FILE", cls.METRICS_FILE)
+        cls._load_positive_int("METRICS_PORT")
+
+        # 运行追踪
+        cls._load_bool("ENABLE_TRACING")
+        cls.TRACE_FILE = os.getenv("TRACE_FILE", cls.TRACE_FILE)
+        if cls.ENABLE_TRACING and not cls.TRACE_FILE:
+            cls.TRACE_FILE = f"{cls.LOG_FILENAME}.trace.json"
+
+        # 故障注入
+        cls._load_bool("ENABLE_FAULT_INJECTION")
+        cls.FAULT_INJECTION_SEED = os.getenv("FAULT_INJECTION_SEED", cls.FAULT_INJECTION_SEED)
+        cls.FAULT_INJECTION_RULES = os.getenv("FAULT_INJECTION_RULES", cls.FAULT_INJECTION_RULES)
+        cls._load_probability("FAILURE_SIMULATION_PROB")
+        cls._load_probability("TIMEOUT_SIMULATION_PROB")
+        if cls.ENABLE_FAULT_INJECTION:
+            logging.warning("已开启 HTTP 故障注入，请勿在生产环境中使用")
+
+        # 账号分片
+        cls._load_positive_int("SHARD_PROCESSES")
+        cls._load_positive_int("SHARD_COUNT")
+        shard_index = os.getenv("SHARD_INDEX")
+        if shard_index:
+            if not shard_index.isdigit() or int(shard_index) >= cls.SHARD_COUNT:
+                raise BasicException(
+                    ErrorCode.INIT_ENVIRONMENT_ERROR,
+                    extra=f"环境变量 SHARD_INDEX 配置错误，应为 0 ~ SHARD_COUNT-1，当前为 {shard_index}"
+                )
+            cls.SHARD_INDEX = int(shard_index)
+            cls.SHARD_RESULT_FILE = os.getenv("SHARD_RESULT_FILE", f"{cls.LOG_FILENAME}.shard{cls.SHARD_INDEX}.json")
+        cls.JOB_ID = os.getenv("JOB_ID", cls.JOB_ID)
+        if cls.JOB_ID is not None and not cls.JOB_ID.isdigit():
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra="环境变量 JOB_ID 须为纯数字")
+
+        # 账号租约
+        cls._load_bool("ENABLE_ACCOUNT_LEASE")
+        cls._load_positive_int("LEASE_BATCH_SIZE")
+        cls._load_positive_int("LEASE_SECONDS")
+        cls._load_positive_int("LEASE_COOLDOWN")
+
+        # 队列日志
+        cls._load_bool("ENABLE_LOG_QUEUE")
+        cls._load_positive_int("LOG_BATCH_SIZE")
+        cls._load_positive_int("LOG_QUEUE_SIZE")
+        cls._load_positive_int("LOG_RATE_LIMIT")
+
+        # 压缩日志
+        cls.LOG_SINK_DIR = os.getenv("LOG_SINK_DIR", cls.LOG_SINK_DIR)
+        cls.LOG_SINK_COMPRESSION = os.getenv("LOG_SINK_COMPRESSION", cls.LOG_SINK_COMPRESSION).lower()
+        if cls.LOG_SINK_COMPRESSION not in ("gzip", "zstd"):
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra="环境变量 LOG_SINK_COMPRESSION 仅支持 gzip / zstd")
+        cls._load_positive_int("LOG_SINK_CHUNK_BYTES")
+        cls._load_positive_int("LOG_SINK_CHUNK_SECONDS")
+        cls.LOG_SINK_UPLOAD_URL = os.getenv("LOG_SINK_UPLOAD_URL", cls.LOG_SINK_UPLOAD_URL)
+
+        if cls.GRAPH_BATCH_SIZE > 20:
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra="环境变量 GRAPH_BATCH_SIZE 不能超过 20")
+
+        # 请求端点覆盖（本地替身服务器）
+        cls.ACCESS_TOKEN_URI = os.getenv("ACCESS_TOKEN_URI", cls.ACCESS_TOKEN_URI)
+        cls.GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL", cls.GRAPH_BASE_URL)
+        if cls.GRAPH_BASE_URL:
+            cls.apply_graph_base_url(cls.GRAPH_BASE_URL)
+        if cls.ENABLE_PROBE_MODE:
+            cls.apply_probe_mode()
+
         # 配置调试环境
         cls.ENV_MODE = os.getenv("ENV_MODE")
         # 设置 SQLAlchemy 的日志等级
@@ -239,3 +470,93 @@ class Config:
             cls.HIDE_SQL_PARAMETERS = False
 
         cls._initialized = True
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        """
+        :return: 全部配置项的副本，传给分片子进程，使子进程与主进程的配置（含运行期修改）一致
+        """
+        return {key: getattr(cls, key) for key in dir(cls) if key.isupper()}
+
+    @classmethod
+    def restore(cls, snapshot: dict):
+        """以 snapshot() 的结果初始化配置，代替 load()"""
+        for key, value in snapshot.items():
+            setattr(cls, key, value)
+        cls._initialized = True
+
+    @classmethod
+    def _load_positive_int(cls, key: str):
+        """
+        从环境变量读取正整数配置项，未配置时保留默认值
+        """
+        val = os.getenv(key)
+        if not val:
+            return
+        if not val.isdigit() or int(val) <= 0:
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra=f"环境变量 {key} 配置错误，请检查配置项并重新启动")
+        setattr(cls, key, int(val))
+
+    @classmethod
+    def _load_probability(cls, key: str):
+        """
+        从环境变量读取 0~1 之间的概率配置项，未配置时保留默认值
+        """
+        val = os.getenv(key)
+        if not val:
+            return
+        try:
+            prob = float(val)
+        except ValueError:
+            prob = -1
+        if not 0 <= prob <= 1:
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra=f"环境变量 {key} 配置错误，请检查配置项并重新启动")
+        setattr(cls, key, prob)
+
+    @classmethod
+    def _load_bool(cls, key: str):
+        """
+        从环境变量读取布尔配置项（1/true/yes 为真），未配置时保留默认值
+        """
+        val = os.getenv(key)
+        if val:
+            setattr(cls, key, val.lower() in ("1", "true", "yes"))
+
+    @classmethod
+    def apply_graph_base_url(cls, base_url: str):
+        """
+        将 API_LIST、API_PREFIXES、USER_INFO_URL 中的 Graph 根地址替换为指定地址
+        :param base_url: 新的根地址，如 http://127.0.0.1:8765
+        """
+        base_url = base_url.rstrip("/")
+        default = cls.GRAPH_DEFAULT_BASE_URL
+
+        def _replace(url):
+            return base_url + url[len(default):] if url.startswith(default) else url
+
+        cls.API_LIST = [_replace(url) for url in cls.API_LIST]
+        cls.API_PREFIXES = [_replace(url) for url in cls.API_PREFIXES]
+        cls.USER_INFO_URL = _replace(cls.USER_INFO_URL)
+        logging.warning(f"Graph 接口根地址已替换为 {base_url}")
+
+    @classmethod
+    def apply_probe_mode(cls):
+        """
+        按 PROBE_QUERIES 为 API_LIST 中的接口追加 $top/$select，只请求最少的数据
+        """
+        def _rewrite(url):
+            prefix = next((p for p in cls.API_PREFIXES if url.startswith(p)), None)
+            if prefix is None:
+                return url
+            path, _, query = url[len(prefix):].partition("?")
+            probe = cls.PROBE_QUERIES.get(path)
+            if probe is None:
+                return url
+            existing = {param.split("=", 1)[0] for param in query.split("&") if param}
+            extra = [param for param in probe.split("&") if param.split("=", 1)[0] not in existing]
+            if not extra:
+                return url
+            return url + ("&" if query else "?") + "&".join(extra)
+
+        cls.API_LIST = [_rewrite(url) for url in cls.API_LIST]
+        logging.warning("已开启探活模式，接口只请求最少的数据")
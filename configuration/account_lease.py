@@ -0,0 +1,133 @@
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+from config import Config
+
+
+def _now():
+    # 与数据库中其他时间字段一致，使用不带时区的北京时间
+    return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=8)
+
+
+class AccountLeaseManager:
+    """
+    基于数据库租约的账号认领，多个 runner 共用同一数据库时各账号只由一个 runner 运行
+    - 每次认领 LEASE_BATCH_SIZE 个账号，运行完成后记录完成时间，LEASE_COOLDOWN 内不再被认领
+    - 后台线程每 LEASE_SECONDS/3 续约一次持有中的租约；runner 崩溃后租约到期，由其他 runner 回收
+    - 退出时释放尚未完成的租约
+    """
+
+    def __init__(self, lease_service, owner, lease_seconds: int = None, batch_size: int = None, cooldown: int = None):
+        """
+        :param lease_service: AccountLeaseService
+        :param owner: 本次任务的 job_id
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.lease_service = lease_service
+        self.owner = int(owner)
+        self.lease_seconds = lease_seconds or Config.LEASE_SECONDS
+        self.batch_size = batch_size or Config.LEASE_BATCH_SIZE
+        self.cooldown = Config.LEASE_COOLDOWN if cooldown is None else cooldown
+        self._candidates = []
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {"claimed": 0, "completed": 0, "renewals": 0, "lost": 0}
+
+    def register(self, env_names):
+        """登记本 runner 可运行的账号，并为其补齐租约记录"""
+        self._candidates = list(env_names)
+        inserted = self.lease_service.ensure(self._candidates)
+        if inserted:
+            self.logger.info(f"新增 {inserted} 条账号租约记录")
+
+    def claim(self):
+        """
+        认领下一批账号
+        :return: env_name 列表，没有可认领的账号时为空
+        """
+        with self._lock:
+            candidates = [env_name for env_name in self._candidates if env_name not in self._held]
+        if not candidates:
+            return []
+        now = _now()
+        claimed = self.lease_service.claim(
+            self.owner,
+            candidates,
+            self.batch_size,
+            now,
+            now + timedelta(seconds=self.lease_seconds),
+            now - timedelta(seconds=self.cooldown),
+        )
+        with self._lock:
+            self._held.update(claimed)
+            self._stats["claimed"] += len(claimed)
+        self.logger.info(f"认领账号租约 {len(claimed)} 个，当前持有 {len(self._held)} 个")
+        return claimed
+
+    def pending(self) -> int:
+        """本 runner 尚未完成的账号数（不知道其他 runner 已完成哪些账号，为上限估计）"""
+        with self._lock:
+            return len(self._candidates)
+
+    def complete(self, env_names):
+        """账号运行完成，释放租约并记录完成时间"""
+        completed = self.lease_service.complete(self.owner, env_names, _now())
+        with self._lock:
+            self._held.difference_update(env_names)
+            # 完成后不再参与本 runner 的后续认领
+            done = set(env_names)
+            self._candidates = [env_name for env_name in self._candidates if env_name not in done]
+            self._stats["completed"] += completed
+        if completed < len(env_names):
+            self.logger.warning(f"{len(env_names) - completed} 个账号的租约在完成前已被其他任务回收，可能被重复运行")
+
+    def renew(self):
+        with self._lock:
+            held = list(self._held)
+        if not held:
+            return
+        renewed = self.lease_service.renew(self.owner, held, _now() + timedelta(seconds=self.lease_seconds))
+        with self._lock:
+            self._stats["renewals"] += 1
+            self._stats["lost"] += len(held) - renewed
+        if renewed < len(held):
+            self.logger.warning(f"{len(held) - renewed} 个账号的租约已过期并被其他任务回收")
+
+    def _run(self):
+        interval = self.lease_seconds / 3
+        while not self._stop_event.wait(interval):
+            try:
+                self.renew()
+            except Exception as e:
+                self.logger.error(f"账号租约续约失败，{interval:.0f}s 后重试: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="lease-renewer", daemon=True)
+        self._thread.start()
+        self.logger.info(f"账号租约续约线程已启动，租约时长 {self.lease_seconds}s，每批认领 {self.batch_size} 个")
+        return self
+
+    def stop(self):
+        """停止续约，并释放尚未完成的租约"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            held = list(self._held)
+            self._held.clear()
+        if held:
+            try:
+                released = self.lease_service.release(self.owner, held)
+                self.logger.info(f"已释放未完成的账号租约 {released} 个")
+            except Exception as e:
+                self.logger.error(f"账号租约释放失败，将在到期后由其他任务回收: {e}")
+
+    def stats(self):
+        """
+        :return: {"claimed", "completed", "renewals", "lost"}
+        """
+        with self._lock:
+            return dict(self._stats)
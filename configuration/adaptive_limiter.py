@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import threading
+import time
+
+from config import Config
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器
+    - 请求成功且耗时不超过目标延迟时加性增长：每个窗口（约 limit 次成功）并发上限 +1
+    - 被限流（429/503）或超时时乘性减半，同一窗口内的多次限流只减一次
+    - 耗时超过目标延迟但未被限流时保持不变
+    线程模式使用 acquire/release，异步模式使用 acquire_async/release_async，同一实例只在一种模式下使用
+    异步模式下可跨多个事件循环使用（如账号租约每批各自 asyncio.run），但同一时刻只在一个事件循环中使用
+    """
+    THROTTLE_STATUS = frozenset({429, 503})
+
+    def __init__(self, name: str, initial_limit: int, min_limit: int, max_limit: int,
+                 latency_target: float, decrease_factor: float = 0.5):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_cond = None
+        self._async_loop = None
+        self._last_decrease = 0.0
+        self._stats = {"requests": 0, "throttled": 0, "slow": 0, "increases": 0, "decreases": 0,
+                       "peak_limit": self.limit, "lowest_limit": self.limit}
+
+    def _adjust(self, latency: float, throttled: bool):
+        """须在持有锁时调用"""
+        self._stats["requests"] += 1
+        if throttled:
+            self._stats["throttled"] += 1
+            now = time.monotonic()
+            # 同一窗口内的并发请求往往同时被限流，只减一次
+            if now - self._last_decrease >= max(latency, self.latency_target):
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self._stats["decreases"] += 1
+                self._stats["lowest_limit"] = min(self._stats["lowest_limit"], self.limit)
+                self.logger.warning(f"[{self.name}] 请求被限流，并发上限降至 {int(self.limit)}")
+        elif latency > self.latency_target:
+            self._stats["slow"] += 1
+        elif self.limit < self.max_limit:
+            previous = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self._stats["increases"] += 1
+                self._stats["peak_limit"] = max(self._stats["peak_limit"], self.limit)
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, throttled: bool):
+        with self._cond:
+            self.in_flight -= 1
+            self._adjust(latency, throttled)
+            self._cond.notify_all()
+
+    def _async_condition(self) -> asyncio.Condition:
+        """asyncio.Condition 绑定首次等待时的事件循环，事件循环变化后重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_cond = asyncio.Condition()
+            self._async_loop = loop
+        return self._async_cond
+
+    async def acquire_async(self):
+        cond = self._async_condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release_async(self, latency: float, throttled: bool):
+        cond = self._async_condition()
+        async with cond:
+            self.in_flight -= 1
+            self._adjust(latency, throttled)
+            cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["limit"] = int(self.limit)
+            stats["in_flight"] = self.in_flight
+        stats["peak_limit"] = int(stats["peak_limit"])
+        stats["lowest_limit"] = int(stats["lowest_limit"])
+        return stats
+
+
+class ConcurrencyController:
+    """
+    按请求目标选择并发限制器：token 端点与 Graph 分别限流，其他请求（如通知、IP 查询）不受限制
+    未开启 ENABLE_ADAPTIVE_CONCURRENCY 时不做任何限制
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        latency_target = Config.CONCURRENCY_LATENCY_TARGET_MS / 1000
+        self.token_limiter = AdaptiveLimiter(
+            "token", Config.TOKEN_CONCURRENCY_INITIAL, 1, Config.TOKEN_CONCURRENCY_MAX, latency_target
+        )
+        self.graph_limiter = AdaptiveLimiter(
+            "graph", Config.GRAPH_CONCURRENCY_INITIAL, 1, Config.GRAPH_CONCURRENCY_MAX, latency_target
+        )
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def limiter_for(self, url: str):
+        """
+        :return: 对应的 AdaptiveLimiter，不需要限制时返回 None
+        """
+        if not Config.ENABLE_ADAPTIVE_CONCURRENCY:
+            return None
+        if url.startswith(Config.ACCESS_TOKEN_URI):
+            return self.token_limiter
+        if any(url.startswith(prefix) for prefix in Config.API_PREFIXES):
+            return self.graph_limiter
+        return None
+
+    def stats(self):
+        return {"token": self.token_limiter.stats(), "graph": self.graph_limiter.stats()}
@@ -0,0 +1,228 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+
+import aiohttp
+import requests
+
+from config import Config
+from configuration.adaptive_limiter import AdaptiveLimiter, ConcurrencyController
+from configuration.fault_injector import FaultInjector
+from configuration.metrics import MetricsRegistry
+from configuration.retry_policy import RetryPolicy
+
+
+class AsyncResponse(object):
+    """
+    异步请求的响应结果
+    响应体在连接归还连接池前读取完毕，接口与 requests.Response 保持一致，便于复用同步模式的判断逻辑
+    """
+
+    def __init__(self, method, url, status_code, headers, content: bytes, wire_bytes: int = None, memory_bytes: int = None):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # 响应体线上字节数（有 Content-Length 时取其值，否则为解压后的长度）与占用内存字节数
+        self.wire_bytes = len(content) if wire_bytes is None else wire_bytes
+        self.memory_bytes = len(content) if memory_bytes is None else memory_bytes
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Error for url: {self.url}", response=self
+            )
+
+
+class AsyncRequestTemplate:
+    """
+    预解析的请求模板（每个账号、每个接口一个），与 CustomSession.RequestTemplate 对应
+    """
+    __slots__ = ("method", "url", "headers", "proxy", "timeout", "authorization", "probe")
+
+    def __init__(self, method, url, headers: dict, proxy, timeout, probe: bool = False):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.proxy = proxy
+        self.timeout = timeout
+        self.authorization = None
+        self.probe = probe
+
+
+class AsyncCustomSession(object):
+    """
+    基于 aiohttp 的异步 HTTP 会话
+    所有账号共用一个连接池，须在事件循环内创建与关闭
+    """
+
+    def __init__(self, max_connections: int = None, retry_policy: RetryPolicy = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.retry_policy = retry_policy or RetryPolicy.get_instance()
+        self.default_headers = copy.deepcopy(Config.REQUEST_COMMON_HEADERS)
+        # aiohttp 自行处理压缩协商，不声明其不支持的 br 编码
+        self.default_headers.pop("Accept-Encoding", None)
+        self.default_headers.pop("Connection", None)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=max_connections or Config.ASYNC_MAX_CONNECTIONS,
+                ttl_dns_cache=300,
+            ),
+            trust_env=True,
+        )
+
+    async def _send_with_retry(self, method, url, retry, send) -> AsyncResponse:
+        """
+        按重试策略发送请求，与 CustomSession._send_with_retry 一致
+        :param send: 无参协程函数，发送一次请求并返回 AsyncResponse
+        """
+        retryable = self.retry_policy.allows(method, retry)
+        endpoint = RetryPolicy.endpoint_of(url)
+        limiter = ConcurrencyController.get_instance().limiter_for(url)
+        send = FaultInjector.get_instance().wrap_async(method, url, send)
+        attempt = 0
+        while True:
+            try:
+                resp = await self._send_limited(limiter, url, send)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                delay = self.retry_policy.next_delay(endpoint, attempt) if retryable else None
+                if delay is None:
+                    raise
+                self.logger.warning(f"请求 {method} {endpoint} 失败，{delay:.2f}s 后第 {attempt + 1} 次重试: {e!r}")
+            else:
+                if not retryable or not self.retry_policy.is_retryable_status(resp.status_code):
+                    return resp
+                delay = self.retry_policy.next_delay(endpoint, attempt, resp.headers)
+                if delay is None:
+                    return resp
+                self.logger.warning(f"请求 {method} {endpoint} 返回 {resp.status_code}，{delay:.2f}s 后第 {attempt + 1} 次重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    async def _send_limited(limiter: AdaptiveLimiter, url, send) -> AsyncResponse:
+        """
+        在并发限制器的名额内发送一次请求，以耗时与是否被限流反馈给限制器，并记录请求指标
+        """
+        metrics = MetricsRegistry.get_instance()
+        if limiter is not None:
+            await limiter.acquire_async()
+        metrics.http_in_flight.inc()
+        begin = time.monotonic()
+        status = None
+        timed_out = False
+        try:
+            resp = await send()
+            status = resp.status_code
+            return resp
+        except asyncio.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            latency = time.monotonic() - begin
+            metrics.http_in_flight.dec()
+            metrics.observe_http(url, status, latency)
+            if limiter is not None:
+                await limiter.release_async(latency, timed_out or status in AdaptiveLimiter.THROTTLE_STATUS)
+
+    async def request(self, method, url, **kwargs) -> AsyncResponse:
+        """
+        :param retry: 是否允许重试，默认仅重试幂等请求；非幂等但可安全重发的请求（如 token 端点）显式传 True
+        """
+        retry = kwargs.pop('retry', None)
+        proxy = kwargs.pop('proxy', None)
+        headers = kwargs.pop('headers', {})
+        timeout = kwargs.pop('timeout', Config.REQUEST_TIMEOUT)
+        # 合并 headers：优先使用调用方传入的 headers，值为 None 的项不发送
+        final_headers = dict(self.default_headers)
+        final_headers.update(headers)
+        final_headers = {k: v for k, v in final_headers.items() if v is not None}
+
+        async def send():
+            async with self._session.request(
+                method,
+                url,
+                headers=final_headers,
+                proxy=proxy,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                **kwargs
+            ) as resp:
+                content = await resp.read()
+                return AsyncResponse(method, str(resp.url), resp.status, resp.headers, content)
+
+        return await self._send_with_retry(method, url, retry, send)
+
+    def prepare_template(self, method, url, headers=None, proxy=None, timeout=None, probe=False) -> AsyncRequestTemplate:
+        """
+        生成请求模板，Authorization 在发送时传入
+        :param probe: 探活模式，以流式读取响应并丢弃响应体
+        """
+        final_headers = dict(self.default_headers)
+        final_headers.update(headers or {})
+        final_headers.pop("Authorization", None)
+        final_headers = {k: v for k, v in final_headers.items() if v is not None}
+        return AsyncRequestTemplate(
+            method, url, final_headers, proxy,
+            aiohttp.ClientTimeout(total=timeout or Config.REQUEST_TIMEOUT),
+            probe
+        )
+
+    async def send_template(self, template: AsyncRequestTemplate, authorization: str = None) -> AsyncResponse:
+        """
+        以模板发送请求，仅在 token 变化时修改模板中的 Authorization
+        """
+        if authorization != template.authorization:
+            if authorization is None:
+                template.headers.pop("Authorization", None)
+            else:
+                template.headers["Authorization"] = authorization
+            template.authorization = authorization
+        return await self._send_with_retry(
+            template.method,
+            template.url,
+            None,
+            lambda: self._send_template_once(template)
+        )
+
+    async def _send_template_once(self, template: AsyncRequestTemplate) -> AsyncResponse:
+        async with self._session.request(
+            template.method,
+            template.url,
+            headers=template.headers,
+            proxy=template.proxy,
+            timeout=template.timeout,
+        ) as resp:
+            if not template.probe:
+                content = await resp.read()
+                return AsyncResponse(template.method, str(resp.url), resp.status, resp.headers, content,
+                                     wire_bytes=resp.content_length)
+            # 探活模式：逐块丢弃响应体，超出上限时不再读取，连接随响应释放而关闭
+            read_bytes = 0
+            memory_bytes = 0
+            async for chunk in resp.content.iter_chunked(8192):
+                read_bytes += len(chunk)
+                memory_bytes = max(memory_bytes, len(chunk))
+                if read_bytes > Config.PROBE_DRAIN_LIMIT:
+                    break
+            wire_bytes = resp.content_length if resp.content_length is not None else read_bytes
+            return AsyncResponse(template.method, str(resp.url), resp.status, resp.headers, b"",
+                                 wire_bytes=wire_bytes, memory_bytes=memory_bytes)
+
+    async def post(self, url, **kwargs) -> AsyncResponse:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url, **kwargs) -> AsyncResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def close(self):
+        await self._session.close()
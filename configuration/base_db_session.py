@@ -1,24 +1,62 @@
+import functools
+import inspect
 import logging
+import time
 
-from sqlalchemy import create_engine, text, event
+from sqlalchemy import create_engine, text, event, update, bindparam
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import make_url
 from contextlib import contextmanager
 
 from config import Config
+from configuration.metrics import MetricsRegistry
+from configuration.tracer import Tracer
 from errorInfo import BasicException, ErrorCode
 
 
 class BaseDBSession:
     _engine = None
     _SessionFactory = None
+    # 启用 write-behind 时的写入队列，所有 DAO 共用
+    _write_behind = None
+    # Core 语句缓存：相同结构的语句只构造一次，编译结果由引擎的编译缓存复用
+    _statement_cache = {}
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        DAO 子类中新定义的公开实例方法自动记录调用耗时（office365_db_call_seconds）与追踪 span
+        """
+        super().__init_subclass__(**kwargs)
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or hasattr(BaseDBSession, name) or not inspect.isfunction(attr):
+                continue
+            setattr(cls, name, cls._timed(cls.__name__, name, attr))
+
+    @staticmethod
+    def _timed(dao: str, method: str, func):
+        histogram = MetricsRegistry.get_instance().db_call_seconds
+        tracer = Tracer.get_instance()
+        span_name = f"db.{dao}.{method}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            begin = time.monotonic()
+            try:
+                with tracer.span(span_name):
+                    return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.monotonic() - begin, dao, method)
+        return wrapper
 
     def __init__(self, database_url: str = None):
         self.logger = logging.getLogger(self.__class__.__name__)
         if not BaseDBSession._engine:
             database_url = database_url or Config.DATABASE_URL
-            db_url = make_url(f"mysql+pymysql://{database_url}")
+            # 未指定驱动时按 MySQL 处理；带驱动的完整连接串（如压测用的 sqlite:///）原样使用
+            db_url = make_url(database_url if "://" in database_url else f"mysql+pymysql://{database_url}")
             BaseDBSession._engine = create_engine(
                 db_url,
                 pool_size=5,
@@ -31,6 +69,23 @@ class BaseDBSession:
             )
             BaseDBSession._SessionFactory = sessionmaker(bind=BaseDBSession._engine)
 
+    @classmethod
+    def set_write_behind(cls, write_behind_queue):
+        """
+        启用/关闭（传 None）write-behind 写入
+        """
+        BaseDBSession._write_behind = write_behind_queue
+
+    def _defer(self, kind: str, key, fields: dict) -> bool:
+        """
+        write-behind 模式下将写入放入队列
+        :return: 已入队返回 True，未启用 write-behind 返回 False
+        """
+        if BaseDBSession._write_behind is None:
+            return False
+        BaseDBSession._write_behind.submit(kind, key, fields)
+        return True
+
     @classmethod
     def keep_alive(cls):
         logging.info("数据库保活")
@@ -43,39 +98,172 @@ class BaseDBSession:
 
     @contextmanager
     def get_session(self):
-        session = self._SessionFactory()
-        try:
-            yield session
-            session.commit()
-        except SQLAlchemyError as e:
-            session.rollback()
-            self._log_sql_error(e)
-            raise BasicException(ErrorCode.DB_ERROR, extra=e)
-        except Exception as e:
-            session.rollback()
-            raise BasicException(ErrorCode.DB_ERROR, extra=e)
-        finally:
-            session.close()
+        with Tracer.get_instance().span("db.session"):
+            session = self._SessionFactory()
+            try:
+                yield session
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                self._log_sql_error(e)
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+            except Exception as e:
+                session.rollback()
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+            finally:
+                session.close()
 
     @contextmanager
     def get_readonly_session(self):
         """只读会话优化版"""
-        session = self._SessionFactory()
-        try:
-            # 设置只读模式
-            session.execute(text("SET TRANSACTION READ ONLY"))
-            yield session
-            # 只读会话不需要commit
-        except SQLAlchemyError as e:
-            session.rollback()
-            self._log_sql_error(e)
-            raise BasicException(ErrorCode.DB_ERROR, extra=e)
-        except Exception as e:
-            session.rollback()
-            logging.error("Unexpected database error", exc_info=True)
-            raise BasicException(ErrorCode.DB_ERROR, extra=e)
-        finally:
-            session.close()
+        with Tracer.get_instance().span("db.readonly_session"):
+            session = self._SessionFactory()
+            try:
+                # 设置只读模式（SQLite 不支持，压测时跳过）
+                if self._engine.dialect.name == "mysql":
+                    session.execute(text("SET TRANSACTION READ ONLY"))
+                yield session
+                # 只读会话不需要commit
+            except SQLAlchemyError as e:
+                session.rollback()
+                self._log_sql_error(e)
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+            except Exception as e:
+                session.rollback()
+                logging.error("Unexpected database error", exc_info=True)
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+            finally:
+                session.close()
+
+    @contextmanager
+    def get_connection(self):
+        """Core 连接（单事务），绕过 ORM 会话与对象映射"""
+        with Tracer.get_instance().span("db.connection"):
+            try:
+                with self._engine.begin() as conn:
+                    yield conn
+            except SQLAlchemyError as e:
+                self._log_sql_error(e)
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+            except BasicException:
+                raise
+            except Exception as e:
+                raise BasicException(ErrorCode.DB_ERROR, extra=e)
+
+    @classmethod
+    def _update_statement(cls, table, where_columns: tuple, value_columns: tuple):
+        key = ("update", table.name, where_columns, value_columns)
+        stmt = cls._statement_cache.get(key)
+        if stmt is None:
+            stmt = update(table)
+            for column in where_columns:
+                stmt = stmt.where(table.c[column] == bindparam(f"w_{column}"))
+            stmt = stmt.values({column: bindparam(f"v_{column}") for column in value_columns})
+            cls._statement_cache[key] = stmt
+        return stmt
+
+    @classmethod
+    def _upsert_statement(cls, table, columns: tuple, update_columns: tuple):
+        key = ("upsert", table.name, columns, update_columns)
+        stmt = cls._statement_cache.get(key)
+        if stmt is None:
+            values = {column: bindparam(column) for column in columns}
+            if cls._engine.dialect.name == "sqlite":
+                # 端到端压测使用 SQLite 时以主键冲突改写为 ON CONFLICT DO UPDATE
+                stmt = sqlite_insert(table).values(values)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[column.name for column in table.primary_key.columns],
+                    set_={column: stmt.excluded[column] for column in update_columns}
+                )
+            else:
+                stmt = mysql_insert(table).values(values)
+                stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+            cls._statement_cache[key] = stmt
+        return stmt
+
+    @classmethod
+    def _insert_ignore_statement(cls, table, columns: tuple):
+        key = ("insert_ignore", table.name, columns)
+        stmt = cls._statement_cache.get(key)
+        if stmt is None:
+            values = {column: bindparam(column) for column in columns}
+            if cls._engine.dialect.name == "sqlite":
+                stmt = sqlite_insert(table).values(values).on_conflict_do_nothing()
+            else:
+                stmt = mysql_insert(table).values(values).prefix_with("IGNORE")
+            cls._statement_cache[key] = stmt
+        return stmt
+
+    @classmethod
+    def execute_update_on(cls, executor, table, where: dict, values: dict) -> int:
+        """
+        在给定的 Session/Connection 上执行单条 UPDATE ... WHERE
+        :return: 受影响行数
+        """
+        stmt = cls._update_statement(table, tuple(sorted(where)), tuple(sorted(values)))
+        params = {f"w_{column}": value for column, value in where.items()}
+        params.update({f"v_{column}": value for column, value in values.items()})
+        return executor.execute(stmt, params).rowcount
+
+    @classmethod
+    def execute_upsert_on(cls, executor, table, rows: list, update_columns) -> int:
+        """
+        在给定的 Session/Connection 上执行 INSERT ... ON DUPLICATE KEY UPDATE，各行字段可不同（按字段分组执行）
+        :param update_columns: 主键冲突时更新的字段，仅更新行中存在的字段
+        :return: 受影响行数
+        """
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        rowcount = 0
+        for columns, group in groups.items():
+            stmt = cls._upsert_statement(table, columns, tuple(sorted(set(update_columns) & set(columns))))
+            rowcount += executor.execute(stmt, group).rowcount
+        return rowcount
+
+    def execute_update(self, table, where: dict, values: dict) -> int:
+        """
+        单次往返的 UPDATE ... WHERE，不先 SELECT ORM 对象
+        :param table: 表对象，如 Account.__table__
+        :param where: 等值条件 {column: value}
+        :param values: 更新字段 {column: value}
+        :return: 受影响行数
+        """
+        if not values:
+            return 0
+        with self.get_connection() as conn:
+            rowcount = self.execute_update_on(conn, table, where, values)
+        self.logger.debug(f"UPDATE {table.name} 受影响行数: {rowcount}")
+        return rowcount
+
+    def execute_upsert(self, table, rows: list, update_columns) -> int:
+        """
+        MySQL INSERT ... ON DUPLICATE KEY UPDATE，多行经驱动合并为单条语句
+        :param rows: [{column: value}, ...]，各行字段须一致
+        :param update_columns: 主键冲突时更新的字段
+        :return: 受影响行数（MySQL 中插入计 1，更新计 2）
+        """
+        if not rows:
+            return 0
+        stmt = self._upsert_statement(table, tuple(sorted(rows[0])), tuple(sorted(update_columns)))
+        with self.get_connection() as conn:
+            rowcount = conn.execute(stmt, rows).rowcount
+        self.logger.debug(f"UPSERT {table.name} 受影响行数: {rowcount}")
+        return rowcount
+
+    def execute_insert_ignore(self, table, rows: list) -> int:
+        """
+        INSERT IGNORE：主键已存在的行跳过，其余插入
+        :param rows: [{column: value}, ...]，各行字段须一致
+        :return: 插入的行数
+        """
+        if not rows:
+            return 0
+        stmt = self._insert_ignore_statement(table, tuple(sorted(rows[0])))
+        with self.get_connection() as conn:
+            rowcount = conn.execute(stmt, rows).rowcount
+        self.logger.debug(f"INSERT IGNORE {table.name} 插入行数: {rowcount}")
+        return rowcount
 
     def _log_sql_error(self, error: SQLAlchemyError):
         """统一的SQL错误日志处理"""
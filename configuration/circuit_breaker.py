@@ -0,0 +1,186 @@
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+from config import Config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _now():
+    # 与数据库中其他时间字段一致，使用不带时区的北京时间
+    return datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=8)
+
+
+class _Circuit:
+    __slots__ = ("state", "consecutive_failures", "total_failures", "total_successes",
+                 "opened_at", "trials", "dirty")
+
+    def __init__(self, state=CLOSED, consecutive_failures=0, total_failures=0, total_successes=0, opened_at=None):
+        self.state = state
+        self.consecutive_failures = consecutive_failures
+        self.total_failures = total_failures
+        self.total_successes = total_successes
+        self.opened_at = opened_at
+        self.trials = 0
+        self.dirty = False
+
+
+class CircuitBreaker:
+    """
+    按接口（API_LIST 序号，可选按账号）熔断
+    - closed：正常调用，连续失败达到 CIRCUIT_FAILURE_THRESHOLD 次后转为 open
+    - open：跳过该接口，经过 CIRCUIT_OPEN_SECONDS 后转为 half_open
+    - half_open：放行少量试探调用，成功则 closed，失败则重新 open
+    状态与失败历史在数据库模式下持久化到 endpoint_health 表，跨任务生效
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def _key(api_index, tenant):
+        return api_index, (tenant if Config.CIRCUIT_SCOPE == "account" and tenant else "*")
+
+    def _cooled_down(self, circuit: _Circuit) -> bool:
+        return circuit.opened_at is None or \
+            _now() - circuit.opened_at >= timedelta(seconds=Config.CIRCUIT_OPEN_SECONDS)
+
+    def available(self, api_index, tenant=None) -> bool:
+        """
+        接口当前是否可被选入调用列表（不占用试探名额）
+        """
+        if not Config.ENABLE_CIRCUIT_BREAKER:
+            return True
+        with self._lock:
+            circuit = self._circuits.get(self._key(api_index, tenant))
+            return circuit is None or circuit.state != OPEN or self._cooled_down(circuit)
+
+    def allow(self, api_index, tenant=None) -> bool:
+        """
+        调用前检查是否放行；half_open 状态下占用一个试探名额
+        """
+        if not Config.ENABLE_CIRCUIT_BREAKER:
+            return True
+        key = self._key(api_index, tenant)
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN:
+                if not self._cooled_down(circuit):
+                    return False
+                circuit.state = HALF_OPEN
+                circuit.trials = 0
+                circuit.dirty = True
+                self.logger.info(f"接口[{api_index}]({key[1]}) 熔断冷却结束，进入半开状态")
+            if circuit.trials >= Config.CIRCUIT_HALF_OPEN_TRIALS:
+                return False
+            circuit.trials += 1
+            return True
+
+    def release_trial(self, api_index, tenant=None):
+        """
+        归还 allow 占用的试探名额，调用方须在每次放行的调用结束后调用
+        已记录成功/失败的调用状态已离开 half_open，此时不做处理；
+        401 刷新 token、未归类的异常等不计入熔断的结果，归还名额后由后续调用继续试探
+        """
+        if not Config.ENABLE_CIRCUIT_BREAKER:
+            return
+        with self._lock:
+            circuit = self._circuits.get(self._key(api_index, tenant))
+            if circuit is not None and circuit.state == HALF_OPEN and circuit.trials > 0:
+                circuit.trials -= 1
+
+    def record_success(self, api_index, tenant=None):
+        if not Config.ENABLE_CIRCUIT_BREAKER:
+            return
+        key = self._key(api_index, tenant)
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state != CLOSED:
+                self.logger.info(f"接口[{api_index}]({key[1]}) 调用恢复，熔断关闭")
+            circuit.state = CLOSED
+            circuit.consecutive_failures = 0
+            circuit.total_successes += 1
+            circuit.opened_at = None
+            circuit.dirty = True
+
+    def record_failure(self, api_index, tenant=None):
+        if not Config.ENABLE_CIRCUIT_BREAKER:
+            return
+        key = self._key(api_index, tenant)
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.consecutive_failures += 1
+            circuit.total_failures += 1
+            circuit.dirty = True
+            if circuit.state == HALF_OPEN or \
+                    (circuit.state == CLOSED and circuit.consecutive_failures >= Config.CIRCUIT_FAILURE_THRESHOLD):
+                circuit.state = OPEN
+                circuit.opened_at = _now()
+                self.logger.warning(
+                    f"接口[{api_index}]({key[1]}) 连续失败 {circuit.consecutive_failures} 次，"
+                    f"熔断 {Config.CIRCUIT_OPEN_SECONDS}s"
+                )
+
+    def load(self, records):
+        """
+        载入历史状态
+        :param records: [EndpointHealthRecord, ...]
+        """
+        with self._lock:
+            for record in records:
+                self._circuits[(record.api_index, record.tenant)] = _Circuit(
+                    state=record.state,
+                    consecutive_failures=record.consecutive_failures,
+                    total_failures=record.total_failures,
+                    total_successes=record.total_successes,
+                    opened_at=record.opened_at,
+                )
+        opened = sum(1 for record in records if record.state == OPEN)
+        self.logger.info(f"已载入 {len(records)} 条接口熔断历史，其中 {opened} 个处于熔断状态")
+
+    def dirty_rows(self):
+        """
+        取出本次任务中有变化的状态用于持久化
+        :return: [{column: value}, ...]
+        """
+        rows = []
+        with self._lock:
+            for (api_index, tenant), circuit in self._circuits.items():
+                if not circuit.dirty:
+                    continue
+                circuit.dirty = False
+                rows.append({
+                    "api_index": api_index,
+                    "tenant": tenant,
+                    "state": circuit.state,
+                    "consecutive_failures": circuit.consecutive_failures,
+                    "total_failures": circuit.total_failures,
+                    "total_successes": circuit.total_successes,
+                    "opened_at": circuit.opened_at,
+                    "update_time": _now(),
+                })
+        return rows
+
+    def open_endpoints(self):
+        """
+        :return: [(api_index, tenant), ...] 当前处于熔断状态的接口
+        """
+        with self._lock:
+            return sorted(key for key, circuit in self._circuits.items() if circuit.state == OPEN)
@@ -1,21 +1,235 @@
 import copy
+import logging
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from config import Config
+from configuration.adaptive_limiter import AdaptiveLimiter, ConcurrencyController
+from configuration.fault_injector import FaultInjector
+from configuration.metrics import MetricsRegistry
+from configuration.retry_policy import RetryPolicy
 
 
-class CustomSession(requests.Session):
+class PoolStats:
+    """
+    连接池统计，按 (主机, 代理) 分别计数
+    - hits：取到仍保持连接的空闲连接（keep-alive 复用）
+    - misses：没有可用的空闲连接，需要建立连接
+    - new_connections：新建的连接对象
+    - discarded：归还时连接池已满被丢弃的连接
+    """
+    FIELDS = ("hits", "misses", "new_connections", "discarded")
+
     def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, key, field: str):
+        with self._lock:
+            counters = self._counters.get(key)
+            if counters is None:
+                counters = self._counters[key] = dict.fromkeys(self.FIELDS, 0)
+            counters[field] += 1
+
+    def snapshot(self):
+        """
+        :return: {"host (via proxy)": {field: count}}
+        """
+        with self._lock:
+            return {
+                f"{host} (via {proxy})" if proxy else host: dict(counters)
+                for (host, proxy), counters in self._counters.items()
+            }
+
+
+class _CountingPoolMixin:
+    """
+    为 urllib3 连接池记录连接复用情况（依赖 _get_conn/_new_conn/_put_conn，urllib3 1.26 与 2.x 一致）
+    """
+    pool_stats = None
+    stats_key = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        if self.pool_stats is not None:
+            # 断开的空闲连接已被 urllib3 关闭，sock 为 None，需要重新建立连接
+            self.pool_stats.record(self.stats_key, "hits" if getattr(conn, "sock", None) is not None else "misses")
+        return conn
+
+    def _new_conn(self):
+        if self.pool_stats is not None:
+            self.pool_stats.record(self.stats_key, "new_connections")
+        return super()._new_conn()
+
+    def _put_conn(self, conn):
+        if self.pool_stats is not None and self.pool is not None and self.pool.full():
+            self.pool_stats.record(self.stats_key, "discarded")
+        super()._put_conn(conn)
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    显式设置连接池大小并统计连接复用的 HTTPAdapter
+    直连与每个代理各自持有独立的 PoolManager（代理由 requests 按代理地址缓存），互不挤占长连接
+    """
+
+    def __init__(self, pool_maxsize: int, pool_connections: int, pool_stats: PoolStats):
+        # init_poolmanager 在父类构造中调用，须先设置统计对象
+        self.pool_stats = pool_stats
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def _instrument(self, manager, proxy=None):
+        def factory(pool_cls):
+            def create(host, port=None, **kwargs):
+                pool = pool_cls(host, port, **kwargs)
+                pool.pool_stats = self.pool_stats
+                pool.stats_key = (host, proxy)
+                return pool
+            return create
+
+        manager.pool_classes_by_scheme = {
+            "http": factory(_CountingHTTPConnectionPool),
+            "https": factory(_CountingHTTPSConnectionPool),
+        }
+        return manager
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self._instrument(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        created = proxy not in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if created:
+            self._instrument(manager, proxy)
+        return manager
+
+
+class RequestTemplate:
+    """
+    预解析的请求模板（每个账号、每个接口一个）
+    URL、合并后的 headers、代理与会话级设置只解析一次，之后每次发送仅在 token 变化时替换 Authorization
+    同一模板只应由一个线程使用
+    """
+    __slots__ = ("prepared", "send_kwargs", "authorization", "probe")
+
+    def __init__(self, prepared: requests.PreparedRequest, send_kwargs: dict, probe: bool = False):
+        self.prepared = prepared
+        self.send_kwargs = send_kwargs
+        self.authorization = None
+        self.probe = probe
+
+
+class CustomSession(requests.Session):
+    def __init__(self, pool_maxsize: int = None, retry_policy: RetryPolicy = None):
+        """
+        :param pool_maxsize: 每个主机保持的最大长连接数，应不小于并发工作线程数，默认 Config.HTTP_POOL_MAXSIZE
+        :param retry_policy: 重试策略，默认使用整次运行共用的策略
+        """
         super().__init__()
+        self.logger = logging.getLogger(self.__class__.__name__)
         self.default_headers = copy.deepcopy(Config.REQUEST_COMMON_HEADERS)
+        self.retry_policy = retry_policy or RetryPolicy.get_instance()
+        self.stats = PoolStats()
+        self.pool_maxsize = None
+        self.resize_pool(pool_maxsize or Config.HTTP_POOL_MAXSIZE)
 
-    def request(self, method, url, **kwargs):
+    def resize_pool(self, pool_maxsize: int):
+        """
+        按并发数重建连接池，须在工作线程开始请求前调用
+        """
+        if pool_maxsize == self.pool_maxsize:
+            return
+        self.pool_maxsize = pool_maxsize
+        adapter = PooledHTTPAdapter(pool_maxsize, Config.HTTP_POOL_HOSTS, self.stats)
+        for prefix in ("https://", "http://"):
+            previous = self.adapters.get(prefix)
+            self.mount(prefix, adapter)
+            if previous is not None and previous is not adapter:
+                previous.close()
+        self.logger.info(f"HTTP 连接池大小：每主机 {pool_maxsize} 个连接")
 
+    def pool_stats(self):
+        return self.stats.snapshot()
+
+    def _send_with_retry(self, method, url, retry, send):
+        """
+        按重试策略发送请求，429/5xx、连接错误与超时在允许重试时退避后重发
+        :param retry: 是否允许重试，None 时仅重试幂等请求
+        :param send: 无参函数，发送一次请求并返回响应
+        """
+        retryable = self.retry_policy.allows(method, retry)
+        endpoint = RetryPolicy.endpoint_of(url)
+        limiter = ConcurrencyController.get_instance().limiter_for(url)
+        send = FaultInjector.get_instance().wrap(method, url, send)
+        attempt = 0
+        while True:
+            try:
+                resp = self._send_limited(limiter, url, send)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self.retry_policy.next_delay(endpoint, attempt) if retryable else None
+                if delay is None:
+                    raise
+                self.logger.warning(f"请求 {method} {endpoint} 失败，{delay:.2f}s 后第 {attempt + 1} 次重试: {e}")
+            else:
+                if not retryable or not self.retry_policy.is_retryable_status(resp.status_code):
+                    return resp
+                delay = self.retry_policy.next_delay(endpoint, attempt, resp.headers)
+                if delay is None:
+                    return resp
+                self.logger.warning(f"请求 {method} {endpoint} 返回 {resp.status_code}，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _send_limited(limiter: AdaptiveLimiter, url, send):
+        """
+        在并发限制器的名额内发送一次请求，以耗时与是否被限流反馈给限制器，并记录请求指标
+        """
+        metrics = MetricsRegistry.get_instance()
+        if limiter is not None:
+            limiter.acquire()
+        metrics.http_in_flight.inc()
+        begin = time.monotonic()
+        status = None
+        timed_out = False
+        try:
+            resp = send()
+            status = resp.status_code
+            return resp
+        except requests.Timeout:
+            timed_out = True
+            raise
+        finally:
+            latency = time.monotonic() - begin
+            metrics.http_in_flight.dec()
+            metrics.observe_http(url, status, latency)
+            if limiter is not None:
+                limiter.release(latency, timed_out or status in AdaptiveLimiter.THROTTLE_STATUS)
+
+    def request(self, method, url, **kwargs):
+        """
+        :param retry: 是否允许重试，默认仅重试幂等请求；非幂等但可安全重发的请求（如 token 端点）显式传 True
+        """
+        retry = kwargs.pop('retry', None)
+        kwargs.setdefault('timeout', Config.REQUEST_TIMEOUT)
         proxy = kwargs.pop('proxy', None)
         headers = kwargs.pop('headers', {})
-        # 合并 headers：优先使用调用方传入的 headers
-        final_headers = copy.deepcopy(self.default_headers)
+        # 合并 headers：优先使用调用方传入的 headers（均为字符串，浅拷贝即可）
+        final_headers = dict(self.default_headers)
         final_headers.update(headers)
         kwargs['headers'] = final_headers
 
@@ -26,10 +240,73 @@ class CustomSession(requests.Session):
                 'https': proxy
             })
 
-        return super().request(method, url, **kwargs)
+        return self._send_with_retry(method, url, retry, lambda: super(CustomSession, self).request(method, url, **kwargs))
+
+    def prepare_template(self, method, url, headers=None, proxy=None, timeout=None, probe=False) -> RequestTemplate:
+        """
+        生成请求模板，Authorization 在发送时传入
+        :param probe: 探活模式，以流式读取响应并丢弃响应体
+        """
+        final_headers = dict(self.default_headers)
+        final_headers.update(headers or {})
+        final_headers.pop("Authorization", None)
+        prepared = self.prepare_request(requests.Request(method, url, headers=final_headers))
+        proxies = {'http': proxy, 'https': proxy} if proxy else {}
+        send_kwargs = self.merge_environment_settings(prepared.url, proxies, None, None, None)
+        send_kwargs["timeout"] = timeout or Config.REQUEST_TIMEOUT
+        send_kwargs["allow_redirects"] = True
+        send_kwargs["stream"] = probe
+        return RequestTemplate(prepared, send_kwargs, probe)
+
+    def send_template(self, template: RequestTemplate, authorization: str = None):
+        """
+        以模板发送请求，仅在 token 变化时修改模板中的 Authorization
+        返回的响应附带 wire_bytes（响应体线上字节数）与 memory_bytes（响应体占用内存字节数）
+        """
+        if authorization != template.authorization:
+            if authorization is None:
+                template.prepared.headers.pop("Authorization", None)
+            else:
+                template.prepared.headers["Authorization"] = authorization
+            template.authorization = authorization
+        return self._send_with_retry(
+            template.prepared.method,
+            template.prepared.url,
+            None,
+            lambda: self._send_template_once(template)
+        )
+
+    def _send_template_once(self, template: RequestTemplate):
+        resp = self.send(template.prepared, **template.send_kwargs)
+        if template.probe:
+            self._discard_body(resp)
+        else:
+            raw = resp.raw
+            resp.memory_bytes = len(resp.content)
+            resp.wire_bytes = raw.tell() if hasattr(raw, "tell") else resp.memory_bytes
+        return resp
+
+    @staticmethod
+    def _discard_body(resp):
+        """
+        探活模式：读取响应头后逐块丢弃未解码的响应体
+        响应体不超过 PROBE_DRAIN_LIMIT 时读完，使连接可以归还连接池；超出则直接关闭连接
+        """
+        wire_bytes = 0
+        memory_bytes = 0
+        try:
+            for chunk in resp.raw.stream(8192, decode_content=False):
+                wire_bytes += len(chunk)
+                memory_bytes = max(memory_bytes, len(chunk))
+                if wire_bytes > Config.PROBE_DRAIN_LIMIT:
+                    break
+        finally:
+            resp.close()
+        resp.wire_bytes = wire_bytes
+        resp.memory_bytes = memory_bytes
 
     def post(self, url, **kwargs):
         return self.request("POST", url, **kwargs)
 
     def get(self, url, **kwargs):
-        return self.request("GET", url, **kwargs)
\ No newline at end of file
+        return self.request("GET", url, **kwargs)
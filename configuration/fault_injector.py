@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from config import Config
+from configuration.tracer import current_account
+from errorInfo import BasicException, ErrorCode
+
+# 规则中可注入的响应状态码及其默认错误码
+_ERROR_CODES = {
+    401: "InvalidAuthenticationToken",
+    403: "Forbidden",
+    404: "itemNotFound",
+    429: "TooManyRequests",
+    500: "InternalServerError",
+    502: "BadGateway",
+    503: "ServiceUnavailable",
+    504: "GatewayTimeout",
+}
+
+
+class FaultRule:
+    """
+    单条注入规则
+    - match：作用范围，可为列表。"*" 全部请求；"token" token 端点；"api" 全部 Graph 接口；
+      "api:3" / "api:0-5" 按 API_LIST 下标；其他值按主机名匹配（如 "graph.microsoft.com"）
+    - latency_ms / latency_jitter_ms：附加延迟及其均匀抖动
+    - drop：连接中断概率；timeout：超时概率（等待 timeout_ms，默认 REQUEST_TIMEOUT 后抛出超时）
+    - status：{状态码: 概率}，返回伪造的错误响应；429/503 附带 retry_after 秒的 Retry-After
+    """
+
+    def __init__(self, spec: dict):
+        match = spec.get("match", "*")
+        self.match = tuple(match) if isinstance(match, (list, tuple)) else (match,)
+        self.latency = float(spec.get("latency_ms", 0)) / 1000
+        self.latency_jitter = float(spec.get("latency_jitter_ms", 0)) / 1000
+        self.drop = float(spec.get("drop", 0))
+        self.timeout = float(spec.get("timeout", 0))
+        timeout_ms = spec.get("timeout_ms")
+        self.timeout_delay = Config.REQUEST_TIMEOUT if timeout_ms is None else float(timeout_ms) / 1000
+        self.status = {int(code): float(prob) for code, prob in spec.get("status", {}).items()}
+        self.retry_after = spec.get("retry_after", 1)
+        # 按累计概率划分 [0, 1) 区间：连接中断、超时、各状态码，剩余为正常请求
+        self._outcomes = []
+        cumulative = 0.0
+        for outcome, prob in [("drop", self.drop), ("timeout", self.timeout)] + list(self.status.items()):
+            if prob <= 0:
+                continue
+            cumulative += prob
+            self._outcomes.append((cumulative, outcome))
+        if cumulative > 1:
+            raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra=f"故障注入规则的概率之和超过 1：{spec}")
+        self._api_indexes = self._parse_api_indexes()
+
+    def _parse_api_indexes(self):
+        indexes = set()
+        for item in self.match:
+            if not item.startswith("api:"):
+                continue
+            start, _, end = item[4:].partition("-")
+            indexes.update(range(int(start), int(end or start) + 1))
+        return indexes
+
+    def matches(self, host: str, api_index) -> bool:
+        for item in self.match:
+            if item == "*" or item == host:
+                return True
+            if item == "token" and api_index == "token":
+                return True
+            if item == "api" and isinstance(api_index, int):
+                return True
+        return isinstance(api_index, int) and api_index in self._api_indexes
+
+    def outcome(self, value: float):
+        for bound, outcome in self._outcomes:
+            if value < bound:
+                return outcome
+        return None
+
+
+class FaultInjector:
+    """
+    HTTP 故障与延迟注入，作用于 CustomSession / AsyncCustomSession 的每次发送（含重试）
+    注入的故障与真实故障一样经过重试、并发限制、熔断与指标统计，用于离线压测降级表现
+    - 规则由 FAULT_INJECTION_RULES（JSON 列表）配置，未配置时按 FAILURE_SIMULATION_PROB /
+      TIMEOUT_SIMULATION_PROB 生成作用于全部 Graph 接口的默认规则；每个请求按顺序取第一条匹配的规则
+    - 每次请求的结果由 (种子, 账号, URL, 该账号对该 URL 的第 n 次请求) 决定，与线程调度无关，
+      相同种子下可复现
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self, rules: list = None, seed=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = Config.ENABLE_FAULT_INJECTION if rules is None else True
+        self.seed = str(Config.FAULT_INJECTION_SEED if seed is None else seed)
+        self.rules = [FaultRule(spec) for spec in (self.default_rules() if rules is None else rules)]
+        self._lock = threading.Lock()
+        self._sequence = {}
+        self._injected = {}
+        self._api_indexes = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def default_rules():
+        if Config.FAULT_INJECTION_RULES:
+            try:
+                rules = json.loads(Config.FAULT_INJECTION_RULES)
+            except ValueError as e:
+                raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra=f"环境变量 FAULT_INJECTION_RULES 不是合法的 JSON: {e}")
+            return rules if isinstance(rules, list) else [rules]
+        # 失败概率在连接中断与常见错误状态码之间平均分配
+        failure = Config.FAILURE_SIMULATION_PROB / 5
+        return [{
+            "match": "api",
+            "drop": failure,
+            "timeout": Config.TIMEOUT_SIMULATION_PROB,
+            "status": {401: failure, 429: failure, 500: failure, 503: failure},
+        }]
+
+    def _api_index(self, url: str):
+        if url.startswith(Config.ACCESS_TOKEN_URI):
+            return "token"
+        if self._api_indexes is None:
+            self._api_indexes = {api: index for index, api in enumerate(Config.API_LIST)}
+        return self._api_indexes.get(url)
+
+    def _decide(self, url: str):
+        """
+        :return: (附加延迟 s, 匹配的规则, 注入结果)；不注入时返回 None
+        """
+        host = urlsplit(url).hostname
+        api_index = self._api_index(url)
+        rule = next((r for r in self.rules if r.matches(host, api_index)), None)
+        if rule is None:
+            return None
+        account = current_account.get()
+        with self._lock:
+            key = (account, url)
+            sequence = self._sequence[key] = self._sequence.get(key, 0) + 1
+        digest = hashlib.blake2b(f"{self.seed}|{account}|{url}|{sequence}".encode(), digest_size=8).digest()
+        rng = random.Random(int.from_bytes(digest, "big"))
+        outcome = rule.outcome(rng.random())
+        latency = rule.latency + (rng.uniform(0, rule.latency_jitter) if rule.latency_jitter else 0)
+        if outcome is None and latency <= 0:
+            return None
+        name = "latency" if outcome is None else str(outcome)
+        with self._lock:
+            self._injected[name] = self._injected.get(name, 0) + 1
+        return latency, rule, outcome
+
+    @staticmethod
+    def _error_body(status: int) -> bytes:
+        code = _ERROR_CODES.get(status, "UnknownError")
+        return json.dumps({"error": {"code": code, "message": "fault injected"}}).encode()
+
+    @staticmethod
+    def _error_headers(rule: FaultRule, status: int) -> dict:
+        headers = {"Content-Type": "application/json"}
+        if status in (429, 503) and rule.retry_after is not None:
+            headers["Retry-After"] = str(rule.retry_after)
+        return headers
+
+    def wrap(self, method: str, url: str, send):
+        """
+        为同步发送函数加上故障注入，未开启时原样返回
+        """
+        if not self.enabled:
+            return send
+
+        def injected_send():
+            decision = self._decide(url)
+            if decision is None:
+                return send()
+            latency, rule, outcome = decision
+            if latency > 0:
+                time.sleep(latency)
+            if outcome is None:
+                return send()
+            if outcome == "drop":
+                raise requests.ConnectionError(f"故障注入：连接中断 {method} {url}")
+            if outcome == "timeout":
+                time.sleep(rule.timeout_delay)
+                raise requests.ReadTimeout(f"故障注入：请求超时 {method} {url}")
+            return self._response(method, url, rule, outcome)
+        return injected_send
+
+    def wrap_async(self, method: str, url: str, send):
+        """
+        为异步发送函数加上故障注入，未开启时原样返回
+        """
+        if not self.enabled:
+            return send
+        # 仅异步模式用到 aiohttp，线程模式下不导入
+        import aiohttp
+
+        async def injected_send():
+            decision = self._decide(url)
+            if decision is None:
+                return await send()
+            latency, rule, outcome = decision
+            if latency > 0:
+                await asyncio.sleep(latency)
+            if outcome is None:
+                return await send()
+            if outcome == "drop":
+                raise aiohttp.ClientConnectionError(f"故障注入：连接中断 {method} {url}")
+            if outcome == "timeout":
+                await asyncio.sleep(rule.timeout_delay)
+                raise asyncio.TimeoutError(f"故障注入：请求超时 {method} {url}")
+            # 避免 async_custom_session 与本模块循环导入
+            from configuration.async_custom_session import AsyncResponse
+            body = self._error_body(outcome)
+            return AsyncResponse(method, url, outcome, self._error_headers(rule, outcome), body,
+                                 wire_bytes=len(body), memory_bytes=len(body))
+        return injected_send
+
+    def _response(self, method: str, url: str, rule: FaultRule, status: int) -> requests.Response:
+        """构造伪造的 requests 错误响应"""
+        body = self._error_body(status)
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers.update(self._error_headers(rule, status))
+        resp.url = url
+        resp.request = requests.Request(method, url).prepare()
+        resp._content = body
+        resp._content_consumed = True
+        resp.encoding = "utf-8"
+        resp.reason = "Fault Injected"
+        resp.wire_bytes = len(body)
+        resp.memory_bytes = len(body)
+        return resp
+
+    def stats(self):
+        """
+        :return: {注入结果: 次数}，结果为 latency / drop / timeout / 状态码
+        """
+        with self._lock:
+            return dict(self._injected)
@@ -1,4 +1,7 @@
 import logging
+import re
+import threading
+import time
 
 
 class NoParamsFilter(logging.Filter):
@@ -11,7 +14,49 @@ class NoParamsFilter(logging.Filter):
         '[cached since',
         '[raw sql]'
     ]
+    # 预编译为一个忽略大小写的正则，避免每条日志都转小写并逐个关键词查找
+    _PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in FILTER_KEYWORDS), re.IGNORECASE)
 
     def filter(self, record):
-        msg = record.getMessage().lower()
-        return not any(keyword in msg for keyword in self.FILTER_KEYWORDS)
\ No newline at end of file
+        # 仅检查 SQLAlchemy 的日志，其他日志不格式化消息直接放行
+        if not record.name.startswith('sqlalchemy'):
+            return True
+        return self._PATTERN.search(record.getMessage()) is None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按调用位置（文件 + 行号）限流：同一位置每秒最多输出 limit 条 INFO 及以下级别的日志
+    run_api 等热点循环中的逐次调用日志在大量账号时被限流，WARNING 及以上级别不受影响
+    被省略的条数附加在该位置下一条输出的日志末尾
+    """
+
+    def __init__(self, limit: int, window: float = 1.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._sites = {}
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                dropped = site[2] if site is not None else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                dropped = 0
+            else:
+                site[2] += 1
+                self.suppressed += 1
+                return False
+        if dropped:
+            record.msg = f"{record.getMessage()}（此前 {self.window:g}s 内同位置日志省略 {dropped} 条）"
+            record.args = None
+        return True
@@ -0,0 +1,246 @@
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+import requests
+
+from config import Config
+from configuration.tracer import current_account
+from errorInfo import BasicException, ErrorCode
+
+_SUFFIXES = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+# 同步刷新压缩流的最短间隔（s）：逐条刷新会降低压缩率并成倍增加写出耗时
+_FLUSH_INTERVAL = 1.0
+
+
+class AccountContextFilter(logging.Filter):
+    """在产生日志的线程上记录当前账号（经队列写出时后台线程取不到调用方的上下文）"""
+
+    def filter(self, record):
+        if not hasattr(record, "account"):
+            record.account = current_account.get()
+        return True
+
+
+class _ChunkWriter:
+    """单个压缩分块：写入 .part 文件，完成后去掉后缀，上传线程只处理已完成的分块"""
+
+    def __init__(self, path: str, compression: str, level: int):
+        self.path = path
+        self.part_path = path + ".part"
+        self._raw = open(self.part_path, "wb")
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                self._raw.close()
+                os.remove(self.part_path)
+                raise BasicException(ErrorCode.INIT_ENVIRONMENT_ERROR, extra="LOG_SINK_COMPRESSION=zstd 需要安装 zstandard")
+            self._flush_mode = zstandard.FLUSH_BLOCK
+            self._stream = zstandard.ZstdCompressor(level=level).stream_writer(self._raw, closefd=False)
+        else:
+            self._flush_mode = None
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=level)
+        self.raw_bytes = 0
+        self.created = self.flushed = time.monotonic()
+
+    def write(self, data: bytes):
+        self._stream.write(data)
+        self.raw_bytes += len(data)
+
+    def flush(self):
+        """
+        同步刷新压缩流：进程被强制结束时，.part 文件中已刷新的内容仍可解压
+        """
+        if self._flush_mode is None:
+            self._stream.flush()
+        else:
+            self._stream.flush(self._flush_mode)
+        self._raw.flush()
+        self.flushed = time.monotonic()
+
+    def close(self):
+        self._stream.close()
+        self._raw.close()
+        os.replace(self.part_path, self.path)
+        return self.path
+
+
+class _ChunkUploader:
+    """
+    后台线程逐个上传已完成的分块，失败时按指数退避重试
+    - http(s):// 地址：PUT <地址>/<分块文件名>
+    - 其他值：视为目录（可带 file:// 前缀），复制到该目录
+    """
+
+    def __init__(self, target: str, retries: int = 3):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.target = target
+        self.retries = retries
+        self._queue = queue.Queue()
+        self.stats = {"uploaded": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
+        self._thread = threading.Thread(target=self._run, name="log-uploader", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str):
+        self._queue.put(path)
+
+    def join(self, timeout: float = None):
+        """等待已提交的分块上传完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _upload(self, path: str):
+        name = os.path.basename(path)
+        if self.target.startswith(("http://", "https://")):
+            with open(path, "rb") as f:
+                resp = requests.put(
+                    f"{self.target.rstrip('/')}/{name}", data=f,
+                    headers={"Content-Type": "application/octet-stream"}, timeout=Config.REQUEST_TIMEOUT,
+                )
+            resp.raise_for_status()
+            return
+        directory = self.target[len("file://"):] if self.target.startswith("file://") else self.target
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再改名，目标目录中不会出现写了一半的分块
+        temp_path = os.path.join(directory, name + ".part")
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, os.path.join(directory, name))
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                begin = time.perf_counter()
+                for attempt in range(self.retries + 1):
+                    try:
+                        self._upload(path)
+                        break
+                    except Exception:
+                        if attempt == self.retries:
+                            raise
+                        time.sleep(2 ** attempt)
+                self.stats["uploaded"] += 1
+                self.stats["bytes"] += os.path.getsize(path)
+                self.stats["seconds"] += time.perf_counter() - begin
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.logger.error(f"日志分块上传失败，保留在本地 {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+class CompressedLogSink(logging.Handler):
+    """
+    JSON-lines 压缩日志：每行一条 {"ts", "level", "logger", "thread", "account", "shard", "msg"}
+    - 写满 LOG_SINK_CHUNK_BYTES（压缩前）或 LOG_SINK_CHUNK_SECONDS 后完成当前分块并开始下一个，
+      配置 LOG_SINK_UPLOAD_URL 时完成的分块立即在后台上传，运行结束时只需上传最后一个分块
+    - 每秒至多同步刷新一次压缩流，运行中途被结束时此前写出的日志仍可从 .part 文件中解压
+    - 分块文件名：<LOG_FILENAME>_<启动时间>_<进程号>_<序号>.jsonl.gz（zstd 为 .jsonl.zst）
+    """
+
+    def __init__(self, directory: str, compression: str = None, upload_url: str = None, shard: str = None,
+                 chunk_bytes: int = None, chunk_seconds: int = None, level: int = None):
+        super().__init__()
+        self.directory = directory
+        self.compression = compression or Config.LOG_SINK_COMPRESSION
+        self.compress_level = level or (3 if self.compression == "zstd" else 6)
+        self.shard = shard
+        self.chunk_bytes = chunk_bytes or Config.LOG_SINK_CHUNK_BYTES
+        self.chunk_seconds = chunk_seconds or Config.LOG_SINK_CHUNK_SECONDS
+        os.makedirs(directory, exist_ok=True)
+        self._prefix = os.path.join(
+            directory,
+            f"{os.path.basename(Config.LOG_FILENAME)}_{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}"
+        )
+        self._sequence = 0
+        self._chunk = None
+        self._uploader = _ChunkUploader(upload_url) if upload_url else None
+        self.addFilter(AccountContextFilter())
+
+    def _line(self, record) -> bytes:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.account is not None:
+            entry["account"] = record.account
+        if self.shard is not None:
+            entry["shard"] = self.shard
+        if record.exc_info:
+            entry["exc"] = logging.Formatter().formatException(record.exc_info)
+        return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def _current_chunk(self) -> _ChunkWriter:
+        chunk = self._chunk
+        if chunk is not None and (chunk.raw_bytes >= self.chunk_bytes or
+                                  time.monotonic() - chunk.created >= self.chunk_seconds):
+            self._finish_chunk()
+            chunk = None
+        if chunk is None:
+            self._sequence += 1
+            chunk = self._chunk = _ChunkWriter(
+                f"{self._prefix}_{self._sequence:05d}{_SUFFIXES[self.compression]}", self.compression, self.compress_level
+            )
+        return chunk
+
+    def _finish_chunk(self):
+        if self._chunk is None:
+            return
+        path = self._chunk.close()
+        self._chunk = None
+        if self._uploader is not None:
+            self._uploader.submit(path)
+
+    def emit(self, record):
+        self.handle_batch([record])
+
+    def handle_batch(self, records):
+        """
+        写入一批日志，队列日志的后台线程按批调用
+        """
+        try:
+            data = b"".join(self._line(record) for record in records)
+            with self.lock:
+                chunk = self._current_chunk()
+                chunk.write(data)
+                if time.monotonic() - chunk.flushed >= _FLUSH_INTERVAL:
+                    chunk.flush()
+        except Exception:
+            self.handleError(records[0])
+
+    def finish(self, timeout: float = 60):
+        """
+        完成当前分块并等待已完成的分块上传结束；之后的日志写入新的分块
+        """
+        with self.lock:
+            self._finish_chunk()
+        if self._uploader is not None and not self._uploader.join(timeout):
+            logging.getLogger(self.__class__.__name__).warning(f"日志分块上传 {timeout}s 内未完成，未上传的分块保留在本地")
+
+    def stats(self):
+        """
+        :return: {"chunks", "uploaded", "failed", "bytes", "seconds"}
+        """
+        stats = {"chunks": self._sequence}
+        if self._uploader is not None:
+            stats.update(self._uploader.stats)
+        return stats
+
+    def close(self):
+        self.finish()
+        super().close()
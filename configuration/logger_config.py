@@ -1,22 +1,123 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
 from config import Config
-from configuration.filter import NoParamsFilter
+from configuration.filter import NoParamsFilter, RateLimitFilter
+from configuration.log_sink import AccountContextFilter, CompressedLogSink
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    调用线程只负责入队，不获取文件锁、不做 I/O
+    队列已满时丢弃 INFO 及以下级别的日志并计数，WARNING 及以上级别等待入队
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 无参数、无异常信息的日志（本项目多为 f-string）消息已是最终文本，无需复制与预格式化
+        if record.args or record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BatchQueueListener(QueueListener):
+    """
+    后台线程一次取出至多 batch_size 条日志，每个 handler 合并为一次写入与一次 flush
+    """
+
+    def __init__(self, log_queue, handlers, batch_size: int):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # 有界队列已满时等待，不能丢弃结束标记
+        self.queue.put(self._sentinel)
+
+    def _monitor(self):
+        log_queue = self.queue
+        while True:
+            records = [self.dequeue(True)]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stopped = self._sentinel in records
+            batch = [record for record in records if record is not self._sentinel]
+            if batch:
+                self._write(batch)
+            for _ in records:
+                log_queue.task_done()
+            if stopped:
+                break
+
+    def _write(self, records):
+        for handler in self.handlers:
+            accepted = [
+                record for record in records
+                if record.levelno >= handler.level and handler.filter(record)
+            ]
+            if not accepted:
+                continue
+            if isinstance(handler, CompressedLogSink):
+                handler.handle_batch(accepted)
+                continue
+            if not isinstance(handler, logging.StreamHandler):
+                for record in accepted:
+                    handler.handle(record)
+                continue
+            try:
+                text = ''.join(handler.format(record) + handler.terminator for record in accepted)
+                with handler.lock:
+                    if handler.stream is None and isinstance(handler, logging.FileHandler):
+                        # FileHandler 延迟打开时 stream 为空
+                        handler.stream = handler._open()
+                    handler.stream.write(text)
+                    handler.flush()
+            except Exception:
+                handler.handleError(accepted[0])
 
 
 class CLogger(object):
     _initialized = False
+    _shard = None
+    _sink = None
+    _listener = None
+    _queue_handler = None
+    _rate_limit_filter = None
 
     @classmethod
-    def setup_logger(cls):
+    def setup_logger(cls, shard: str = None):
+        """
+        :param shard: 分片子进程的分片标识，子进程追加写入主进程的日志文件，并在每行标注分片
+        """
         if cls._initialized:
             return
+        prefix = '' if shard is None else f'[shard {shard}] '
+        log_file = f"{Config.LOG_FILENAME}.log"
+        if shard is None:
+            # 先清空再以追加模式打开：分片子进程同时追加写入时，各进程的写入都落在文件末尾，不会相互覆盖
+            open(log_file, 'w').close()
         logging.basicConfig(
             level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            format=prefix + '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             handlers=[
-                logging.FileHandler(f"{Config.LOG_FILENAME}.log", mode='w', encoding='utf-8'),
+                logging.FileHandler(log_file, mode='a', encoding='utf-8'),
                 logging.StreamHandler(sys.stdout)
             ]
         )
@@ -26,4 +127,93 @@ class CLogger(object):
         #     handler.addFilter(NoParamsFilter())
         # logging.info("日志初始化配置完成")
         logging.getLogger('sqlalchemy.engine').propagate = False
+        cls._shard = shard
         cls._initialized = True
+        # 分片子进程在恢复配置后初始化日志，此时即可按配置切换
+        cls.apply_config()
+
+    @classmethod
+    def apply_config(cls):
+        """
+        按配置开启压缩日志与队列日志，须在 Config.load 之后调用；已开启时不重复处理
+        """
+        if Config.LOG_SINK_DIR and cls._sink is None:
+            cls.start_sink()
+        if Config.ENABLE_LOG_QUEUE and cls._listener is None:
+            cls.start_queue(Config.LOG_BATCH_SIZE, Config.LOG_QUEUE_SIZE, Config.LOG_RATE_LIMIT)
+
+    @classmethod
+    def start_sink(cls):
+        """
+        在文本日志之外另写 JSON-lines 压缩日志，分块完成后按配置上传
+        不接管 SIGTERM：进程被结束时最后一个分块保留为 .part 文件，其中已同步刷新的内容仍可解压
+        """
+        cls._sink = CompressedLogSink(
+            Config.LOG_SINK_DIR, Config.LOG_SINK_COMPRESSION, Config.LOG_SINK_UPLOAD_URL, cls._shard
+        )
+        if cls._listener is not None:
+            cls._listener.handlers += (cls._sink,)
+        else:
+            logging.getLogger().addHandler(cls._sink)
+
+    @classmethod
+    def start_queue(cls, batch_size: int, queue_size: int, rate_limit: int = None):
+        """
+        将根 logger 现有的 handler 移交给后台线程，根 logger 只保留入队的 QueueHandler
+        :param rate_limit: 同一调用位置每秒最多输出的 INFO 及以下级别日志条数，为空不限流
+        """
+        root_logger = logging.getLogger()
+        handlers = list(root_logger.handlers)
+        log_queue = queue.Queue(queue_size)
+        queue_handler = _NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(NoParamsFilter())
+        if cls._sink is not None:
+            queue_handler.addFilter(AccountContextFilter())
+        cls._rate_limit_filter = None
+        if rate_limit:
+            cls._rate_limit_filter = RateLimitFilter(rate_limit)
+            queue_handler.addFilter(cls._rate_limit_filter)
+        for handler in handlers:
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(queue_handler)
+        cls._queue_handler = queue_handler
+        cls._listener = _BatchQueueListener(log_queue, handlers, batch_size)
+        cls._listener.start()
+        atexit.register(cls.stop_queue)
+
+    @classmethod
+    def flush(cls):
+        """等待队列中的日志全部写出，并完成、上传当前的压缩日志分块（分片子进程退出时不执行 atexit，须显式调用）"""
+        if cls._listener is not None:
+            cls._listener.queue.join()
+        if cls._sink is not None:
+            cls._sink.finish()
+
+    @classmethod
+    def stop_queue(cls):
+        """写出剩余日志并停止后台线程，根 logger 恢复为直接写出"""
+        listener, queue_handler = cls._listener, cls._queue_handler
+        if listener is None:
+            return
+        root_logger = logging.getLogger()
+        root_logger.removeHandler(queue_handler)
+        listener.stop()
+        for handler in listener.handlers:
+            root_logger.addHandler(handler)
+        cls._listener = None
+        cls._queue_handler = None
+        atexit.unregister(cls.stop_queue)
+        stats = cls.stats(queue_handler)
+        if stats["dropped"] or stats["suppressed"]:
+            logging.info(f"队列日志统计：队列满丢弃 {stats['dropped']} 条，限流省略 {stats['suppressed']} 条")
+
+    @classmethod
+    def stats(cls, queue_handler=None):
+        """
+        :return: {"dropped": 队列满丢弃条数, "suppressed": 限流省略条数}
+        """
+        queue_handler = queue_handler or cls._queue_handler
+        return {
+            "dropped": queue_handler.dropped if queue_handler is not None else 0,
+            "suppressed": cls._rate_limit_filter.suppressed if cls._rate_limit_filter is not None else 0,
+        }
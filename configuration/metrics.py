@@ -0,0 +1,325 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from config import Config
+
+# 默认的耗时分桶（s）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _header(self):
+        return [f"# TYPE {self.name} {self.type_name}", f"# HELP {self.name} {_escape(self.documentation)}"]
+
+    def render(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增计数，按标签值分别累计"""
+    type_name = "counter"
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def items(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for labelvalues, value in sorted(self.items().items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """瞬时值；set_function 登记的回调在导出时取值"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, func, *labelvalues):
+        with self._lock:
+            self._functions[labelvalues] = func
+
+    def items(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for labelvalues, func in functions.items():
+            try:
+                values[labelvalues] = func()
+            except Exception:
+                continue
+        return values
+
+    def render(self):
+        lines = self._header()
+        for labelvalues, value in sorted(self.items().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """分桶直方图，分位数按桶内线性插值估算"""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # [各桶计数（非累计）, 总和, 次数]
+                state = self._values[labelvalues] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def items(self):
+        with self._lock:
+            return {labelvalues: (list(state[0]), state[1], state[2]) for labelvalues, state in self._values.items()}
+
+    def merged(self):
+        """
+        合并全部标签的观测值
+        :return: (各桶计数, 总和, 次数)
+        """
+        counts, total, count = [0] * len(self.buckets), 0.0, 0
+        for bucket_counts, bucket_sum, bucket_count in self.items().values():
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+            total += bucket_sum
+            count += bucket_count
+        return counts, total, count
+
+    def quantile(self, q: float, state=None):
+        """
+        :param state: (各桶计数, 总和, 次数)，默认为全部标签合并后的结果
+        :return: 分位数估算值（s），无观测值时返回 None
+        """
+        counts, _, count = state or self.merged()
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                upper = self.buckets[index]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-2]
+
+    def render(self):
+        lines = self._header()
+        for labelvalues, (counts, total, count) in sorted(self.items().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_count{labels} {count}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    进程级指标注册表，导出为 OpenMetrics 文本
+    - 运行结束时写出到 METRICS_FILE
+    - 配置 METRICS_PORT 时在本地端口提供 /metrics，供长时间运行时抓取
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._metrics = []
+        self._server = None
+
+        self.http_request_seconds = self.register(Histogram(
+            "office365_http_request_seconds", "HTTP 请求耗时（单次发送，不含重试等待）", ("endpoint",)
+        ))
+        self.http_responses = self.register(Counter(
+            "office365_http_responses", "HTTP 响应数，连接错误与超时的状态码记为 error", ("endpoint", "status")
+        ))
+        self.http_in_flight = self.register(Gauge(
+            "office365_http_in_flight_requests", "正在进行中的 HTTP 请求数"
+        ))
+        self.token_refresh = self.register(Counter(
+            "office365_token_refresh", "token 刷新次数", ("result",)
+        ))
+        self.token_refresh_seconds = self.register(Histogram(
+            "office365_token_refresh_seconds", "token 刷新耗时"
+        ))
+        self.db_call_seconds = self.register(Histogram(
+            "office365_db_call_seconds", "DAO 方法调用耗时", ("dao", "method")
+        ))
+        self.thread_pool_queue_depth = self.register(Gauge(
+            "office365_thread_pool_queue_depth", "线程池中等待执行的任务数", ("pool",)
+        ))
+        self.account_run_seconds = self.register(Histogram(
+            "office365_account_run_seconds", "单个账号全部轮次的运行耗时",
+            buckets=(60, 300, 600, 1800, 3600, 7200, 14400, 21600)
+        ))
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    @staticmethod
+    def endpoint_label(url: str) -> str:
+        """
+        HTTP 指标的 endpoint 标签：token 端点与 Graph 接口取主机 + 路径，其他请求只取主机
+        （通知等地址的路径中可能包含密钥，不写入指标）
+        """
+        parts = urlsplit(url)
+        if url.startswith(Config.ACCESS_TOKEN_URI) or any(url.startswith(prefix) for prefix in Config.API_PREFIXES):
+            return f"{parts.netloc}{parts.path}"
+        return parts.netloc
+
+    def observe_http(self, url: str, status, latency: float):
+        endpoint = self.endpoint_label(url)
+        self.http_request_seconds.observe(latency, endpoint)
+        self.http_responses.inc(endpoint, str(status) if status is not None else "error")
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        self.logger.info(f"运行指标已写入 {path}")
+
+    def summary(self):
+        """
+        :return: 写入 job_detail 的指标摘要
+        """
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000)
+
+        http_state = self.http_request_seconds.merged()
+        token_state = self.token_refresh_seconds.merged()
+        db_state = self.db_call_seconds.merged()
+        responses = self.http_responses.items()
+        return {
+            "http": {
+                "requests": http_state[2],
+                "errors": sum(count for (_, status), count in responses.items() if not status.startswith("2")),
+                "p50_ms": ms(self.http_request_seconds.quantile(0.5, http_state)),
+                "p99_ms": ms(self.http_request_seconds.quantile(0.99, http_state)),
+            },
+            "token": {
+                "refresh": self.token_refresh.value("success"),
+                "failed": self.token_refresh.value("failure"),
+                "p50_ms": ms(self.token_refresh_seconds.quantile(0.5, token_state)),
+            },
+            "db": {
+                "calls": db_state[2],
+                "total_ms": ms(db_state[1]),
+                "p99_ms": ms(self.db_call_seconds.quantile(0.99, db_state)),
+            },
+        }
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """在本地端口以后台线程提供 /metrics"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        self.logger.info(f"运行指标已在 http://{host}:{port}/metrics 提供")
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,122 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from config import Config
+
+
+class RetryPolicy:
+    """
+    HTTP 请求重试策略，由 CustomSession / AsyncCustomSession 共用
+    - 仅重试幂等请求（GET）与显式声明可重试的请求（如 token 端点的 POST）
+    - 429/5xx 与连接错误、超时可重试，优先遵循 Retry-After，否则使用 full-jitter 指数退避
+    - 整次运行共享重试预算，预算耗尽后不再重试，避免故障时重试放大流量
+    - 设置截止时刻（运行计划的调用截止时刻）后，超出截止时刻不再重试，等待时间不超过剩余时间
+    """
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self, max_retries: int = None, base_backoff: float = None, max_backoff: float = None, budget: int = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_retries = Config.MAX_RETRIES if max_retries is None else max_retries
+        self.base_backoff = Config.BASE_BACKOFF if base_backoff is None else base_backoff
+        self.max_backoff = Config.RETRY_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.budget = Config.RETRY_BUDGET if budget is None else budget
+        self._lock = threading.Lock()
+        self._used = 0
+        self._budget_exhausted_logged = False
+        self._endpoints = {}
+        self._deadline = None
+
+    @classmethod
+    def get_instance(cls):
+        """整次运行共用的重试策略（共享重试预算）"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def set_deadline(self, deadline: float = None):
+        """
+        :param deadline: 重试等待的截止时刻（time.monotonic），为空不限制
+        """
+        self._deadline = deadline
+
+    def allows(self, method: str, retry: bool = None) -> bool:
+        """请求是否允许重试，retry 为 None 时按方法是否幂等判断"""
+        if retry is not None:
+            return retry
+        return method.upper() in self.IDEMPOTENT_METHODS
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.RETRY_STATUS
+
+    @staticmethod
+    def endpoint_of(url: str) -> str:
+        """统计用的接口标识：主机 + 路径，不含查询参数"""
+        parts = urlsplit(url)
+        return f"{parts.netloc}{parts.path}"
+
+    def _retry_after(self, headers):
+        """解析 Retry-After（秒数或 HTTP 日期），无法解析时返回 None"""
+        if not headers:
+            return None
+        value = headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def next_delay(self, endpoint: str, attempt: int, headers=None):
+        """
+        登记一次重试并返回等待秒数
+        :param attempt: 已重试次数（首次请求失败时为 0）
+        :param headers: 失败响应的 headers，用于读取 Retry-After；连接错误时为 None
+        :return: 等待秒数；超出重试次数、预算耗尽或已过截止时刻时返回 None
+        """
+        if attempt >= self.max_retries:
+            return None
+        remaining = None if self._deadline is None else self._deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            return None
+        with self._lock:
+            if self._used >= self.budget:
+                if not self._budget_exhausted_logged:
+                    self._budget_exhausted_logged = True
+                    self.logger.warning(f"本次运行的重试预算（{self.budget} 次）已耗尽，后续失败不再重试")
+                return None
+            self._used += 1
+            self._endpoints[endpoint] = self._endpoints.get(endpoint, 0) + 1
+
+        retry_after = self._retry_after(headers)
+        if retry_after is not None:
+            delay = min(retry_after, self.max_backoff)
+        else:
+            # full jitter：在 [0, min(上限, 基础退避 * 2^attempt)] 内均匀取值
+            delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        return delay if remaining is None else min(delay, remaining)
+
+    def stats(self):
+        """
+        :return: {"budget", "used", "endpoints": {endpoint: 重试次数}}
+        """
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "used": self._used,
+                "endpoints": dict(sorted(self._endpoints.items(), key=lambda item: -item[1])),
+            }
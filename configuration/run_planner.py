@@ -0,0 +1,77 @@
+import logging
+import random
+
+from config import Config
+from errorInfo import BasicException, ErrorCode
+from pojo.run_plan import AccountPlan, PlannedCall, RunPlan
+from utils import Utils
+
+
+class RunPlanner:
+    """
+    截止时间感知的运行规划器
+    在任务开始前为所有启用账号生成完整的调用时间线：
+      - 预算扣除安全余量与最后一次请求的超时时间后，得到调用截止时刻
+      - 账号登陆在前导窗口内错开，调用在剩余窗口内均匀分布
+      - 各账号按相位错开，使整个集群的请求速率保持平稳
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @staticmethod
+    def call_window(budget: float) -> float:
+        """预算扣除安全余量与最后一次请求的超时时间后可用于调用的时间（s），不大于 0 时无法生成计划"""
+        return budget * (1 - Config.PLAN_SAFETY_MARGIN) - Config.REQUEST_TIMEOUT
+
+    def build(self, enabled_indices, budget: float) -> RunPlan:
+        """
+        :param enabled_indices: USER_TOKEN_DICT keys 的索引列表
+        :param budget: 从现在起可用的总时间（s）
+        :return: RunPlan
+        """
+        deadline = self.call_window(budget)
+        if deadline <= 0:
+            raise BasicException(
+                ErrorCode.RUN_PLAN_ERROR,
+                extra=f"运行预算 {budget:.0f}s 不足以容纳请求超时与安全余量，请调大 RUN_TIME_BUDGET"
+            )
+        # 登陆前导窗口：不超过原有的启动延迟上限，也不挤占过多调用时间
+        lead = min(Config.MAX_START_DELAY, deadline * 0.2)
+
+        keys = list(Config.USER_TOKEN_DICT.keys())
+        total = len(enabled_indices)
+        run_plan = RunPlan(budget=budget, deadline=deadline)
+
+        for idx_pos, idx in enumerate(enabled_indices):
+            account_key = keys[idx]
+            # 账号相位 ∈ [0, 1)，决定其在每个时间槽内的位置
+            phase = idx_pos / total
+            account_plan = AccountPlan(
+                account_key=account_key,
+                refresh_token=Config.USER_TOKEN_DICT[account_key],
+                start_offset=phase * lead,
+            )
+
+            api_indices = []
+            for round_no in range(1, Config.ROUNDS_PER_RUN + 1):
+                for api_list in Utils.build_round_api_lists(account_key):
+                    api_indices.extend((round_no, api_index) for api_index in api_list)
+            if not api_indices:
+                run_plan.accounts.append(account_plan)
+                continue
+
+            # 每个账号的调用间隔；各账号在间隔内按相位错开，抖动不超过单个账号所占的槽宽
+            spacing = (deadline - lead) / len(api_indices)
+            slot = spacing / total
+            for k, (round_no, api_index) in enumerate(api_indices):
+                offset = lead + (k + phase) * spacing + random.uniform(0, Config.PLAN_JITTER_RATIO * slot)
+                account_plan.calls.append(PlannedCall(offset=offset, round_no=round_no, api_index=api_index))
+            run_plan.accounts.append(account_plan)
+
+        summary = run_plan.summary()
+        self.logger.info(
+            f"运行计划已生成：{summary['accounts']} 个账号，共 {summary['total_calls']} 次调用，"
+            f"调用截止 {deadline:.0f}s，平均 {summary['avg_calls_per_second']} 次/秒"
+        )
+        return run_plan
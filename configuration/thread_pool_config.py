@@ -38,6 +38,12 @@ class ThreadPoolManager:
             self.logger.error(f"任务提交失败: {e}")
             raise
 
+    def queue_depth(self) -> int:
+        """
+        等待执行的任务数
+        """
+        return self.executor._work_queue.qsize()
+
     def shutdown(self, wait=True):
         """
         主动关闭线程池（阻塞或非阻塞）。
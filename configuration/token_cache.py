@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from configuration.metrics import MetricsRegistry
+from utils import Utils
+
+
+@dataclass(frozen=True)
+class TokenEntry:
+    access_token: str
+    expires_at: datetime            # 带时区的北京时间
+
+    def expires_within(self, seconds: float) -> bool:
+        """token 是否会在指定秒数内过期"""
+        return self.expires_at <= Utils.get_beijing_time(seconds)
+
+
+class _InFlight:
+    """
+    一次进行中的刷新，后到的调用方等待其结果而非重复请求
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class TokenCache:
+    """
+    进程级 access_token 缓存，以 account_key 为键
+    - 同一账号的并发刷新合并为一次请求（single-flight），其余调用方共享结果
+    - 数据库仅作为写穿透的持久化存储，检查 token 时不再读取数据库
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._entries = {}
+        # access_token → account_key 反查表
+        self._token_index = {}
+        self._inflight = {}
+        self._async_inflight = {}
+        self._store = None
+        self._listeners = []
+        self.refresh_count = 0
+        self.shared_count = 0
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def bind_store(self, account_service):
+        """
+        绑定持久化存储，刷新后的 token 写穿透到 Account 表
+        :param account_service: AccountService 实例，本地模式为 None
+        """
+        self._store = account_service
+
+    def add_listener(self, listener):
+        """
+        登记 token 更新监听，每次写入缓存后以 (account_key, entry) 回调
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, account_key, entry):
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(account_key, entry)
+
+    def get(self, account_key: str):
+        with self._lock:
+            return self._entries.get(account_key)
+
+    def find_account(self, access_token: str):
+        """
+        按 access_token 反查所属账号，仅覆盖本进程缓存中的当前 token
+        :return: account_key 或 None
+        """
+        with self._lock:
+            return self._token_index.get(access_token)
+
+    def _set_entry(self, account_key, entry: TokenEntry):
+        """须在持有 self._lock 时调用"""
+        previous = self._entries.get(account_key)
+        if previous is not None:
+            self._token_index.pop(previous.access_token, None)
+        self._entries[account_key] = entry
+        if entry.access_token:
+            self._token_index[entry.access_token] = account_key
+
+    def put(self, account_key: str, access_token: str, expires_at: datetime) -> TokenEntry:
+        """
+        写入缓存（不写穿透），用于从数据库加载已有 token
+        """
+        entry = TokenEntry(access_token=access_token, expires_at=expires_at)
+        with self._lock:
+            self._set_entry(account_key, entry)
+        self._notify(account_key, entry)
+        return entry
+
+    def _begin(self, account_key, stale_token, inflight_map, factory):
+        """
+        判断是否需要发起刷新
+        :return: (缓存命中的 entry, 进行中的刷新, 是否由当前调用方发起刷新)
+        """
+        with self._lock:
+            entry = self._entries.get(account_key)
+            if stale_token is not None and entry is not None and entry.access_token != stale_token:
+                # 调用方持有的 token 已被其他调用方刷新
+                return entry, None, False
+            inflight = inflight_map.get(account_key)
+            if inflight is not None:
+                self.shared_count += 1
+                return None, inflight, False
+            inflight = factory()
+            inflight_map[account_key] = inflight
+            self.refresh_count += 1
+            return None, inflight, True
+
+    def _store_token(self, account_key, token_data) -> TokenEntry:
+        entry = TokenEntry(
+            access_token=token_data.get("access_token"),
+            expires_at=Utils.get_beijing_time(int(token_data.get("expires_in"))),
+        )
+        with self._lock:
+            self._set_entry(account_key, entry)
+        self._notify(account_key, entry)
+        return entry
+
+    def _write_through(self, account_key, entry: TokenEntry):
+        if self._store is None:
+            return
+        self._store.update(
+            env_name=account_key,
+            access_token=entry.access_token,
+            expires_at=entry.expires_at
+        )
+
+    @staticmethod
+    def _record_refresh(result: str, begin: float):
+        metrics = MetricsRegistry.get_instance()
+        metrics.token_refresh.inc(result)
+        metrics.token_refresh_seconds.observe(time.monotonic() - begin)
+
+    def refresh(self, account_key: str, fetch, stale_token: str = None, write_through: bool = True) -> TokenEntry:
+        """
+        刷新指定账号的 token
+        :param account_key: 账号键
+        :param fetch: 无参函数，请求 token 端点并返回包含 access_token、expires_in 的 dict
+        :param stale_token: 调用方认为已失效的 token；缓存中的 token 与之不同时直接返回缓存
+        :param write_through: 是否写穿透到数据库（账号记录尚未插入时应为 False）
+        """
+        entry, inflight, leader = self._begin(account_key, stale_token, self._inflight, _InFlight)
+        if entry is not None:
+            return entry
+        if not leader:
+            inflight.event.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.entry
+
+        begin = time.monotonic()
+        try:
+            entry = self._store_token(account_key, fetch())
+            inflight.entry = entry
+        except Exception as e:
+            inflight.error = e
+            self._record_refresh("failure", begin)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(account_key, None)
+            inflight.event.set()
+
+        self._record_refresh("success", begin)
+        self.logger.info(f"账号[{account_key}] token 已刷新")
+        if write_through:
+            self._write_through(account_key, entry)
+        return entry
+
+    async def refresh_async(self, account_key: str, fetch, stale_token: str = None, write_through: bool = True) -> TokenEntry:
+        """
+        refresh 的异步版本，fetch 为无参协程函数；同一事件循环内的并发调用共享一次刷新
+        """
+        loop = asyncio.get_running_loop()
+        entry, inflight, leader = self._begin(account_key, stale_token, self._async_inflight, loop.create_future)
+        if entry is not None:
+            return entry
+        if not leader:
+            return await asyncio.shield(inflight)
+
+        begin = time.monotonic()
+        try:
+            entry = self._store_token(account_key, await fetch())
+            inflight.set_result(entry)
+        except asyncio.CancelledError:
+            inflight.cancel()
+            raise
+        except Exception as e:
+            self._record_refresh("failure", begin)
+            inflight.set_exception(e)
+            # 没有其他等待方时避免 "exception was never retrieved" 警告
+            inflight.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_inflight.pop(account_key, None)
+
+        self._record_refresh("success", begin)
+        self.logger.info(f"账号[{account_key}] token 已刷新")
+        if write_through:
+            await asyncio.to_thread(self._write_through, account_key, entry)
+        return entry
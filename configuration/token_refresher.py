@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import logging
+import threading
+import time
+
+import requests
+
+from config import Config
+from configuration.token_cache import TokenCache
+
+
+class TokenRefresher:
+    """
+    token 到期前的后台刷新器
+    以 expires_at - margin 为键维护最小堆，到点后通过 TokenCache 刷新，使工作线程在调用路径上始终拿到有效 token。
+    堆中过时的记录（token 已被其他调用方刷新）在出堆时惰性丢弃。
+    线程模式使用 start/stop，异步模式在事件循环内运行 run_async。
+    """
+
+    def __init__(self, token_cache: TokenCache = None, margin: int = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.token_cache = token_cache or TokenCache.get_instance()
+        self.margin = Config.TOKEN_REFRESH_MARGIN if margin is None else margin
+        self._heap = []
+        self._fetchers = {}
+        self._failures = {}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._loop = None
+        self._wakeup = None
+        self.refresh_count = 0
+
+    def register(self, account_key: str, fetch):
+        """
+        登记需要后台刷新的账号
+        :param fetch: 刷新时传给 TokenCache 的 fetch（线程模式为函数，异步模式为协程函数）
+        """
+        with self._cond:
+            self._fetchers[account_key] = fetch
+        entry = self.token_cache.get(account_key)
+        if entry is not None:
+            self.schedule(account_key, entry)
+
+    def schedule(self, account_key: str, entry):
+        """
+        按 token 过期时间登记下一次刷新，同时作为 TokenCache 的监听回调
+        """
+        with self._cond:
+            if account_key not in self._fetchers:
+                return
+            refresh_at = entry.expires_at.timestamp() - self.margin
+            heapq.heappush(self._heap, (refresh_at, account_key, entry.access_token))
+            self._cond.notify()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _pop_due(self):
+        """
+        须在持有 self._cond 时调用
+        :return: ((account_key, token, fetch), None) 或 (None, 距下一次刷新的秒数/None)
+        """
+        while self._heap:
+            refresh_at, account_key, token = self._heap[0]
+            entry = self.token_cache.get(account_key)
+            # 已放弃后台刷新的账号，其残留记录同样丢弃
+            if entry is None or entry.access_token != token or account_key not in self._fetchers:
+                heapq.heappop(self._heap)
+                continue
+            wait_seconds = refresh_at - time.time()
+            if wait_seconds > 0:
+                return None, wait_seconds
+            heapq.heappop(self._heap)
+            return (account_key, token, self._fetchers[account_key]), None
+        return None, None
+
+    @staticmethod
+    def _is_permanent(error) -> bool:
+        """token 端点返回 4xx（如 refresh_token 已吊销的 invalid_grant）时重试无效；408/429 除外"""
+        response = getattr(error, "response", None)
+        if not isinstance(error, requests.HTTPError) or response is None:
+            return False
+        return 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+    def _retry_later(self, account_key, token, error):
+        """
+        按指数退避重新登记刷新；连续失败 MAX_RETRIES 次或遇到不可重试的错误时不再后台刷新该账号
+        """
+        with self._cond:
+            failures = self._failures[account_key] = self._failures.get(account_key, 0) + 1
+            if self._is_permanent(error) or failures >= Config.MAX_RETRIES:
+                self._fetchers.pop(account_key, None)
+                self._failures.pop(account_key, None)
+                give_up = True
+            else:
+                delay = Config.BASE_BACKOFF * 2 ** (failures - 1)
+                heapq.heappush(self._heap, (time.time() + delay, account_key, token))
+                give_up = False
+        if give_up:
+            self.logger.error(f"账号[{account_key}] token 后台刷新失败 {failures} 次，不再后台刷新: {error}")
+        else:
+            self.logger.error(f"账号[{account_key}] token 后台刷新失败，{delay}s 后重试: {error}")
+
+    def _refreshed(self, account_key):
+        self.refresh_count += 1
+        with self._cond:
+            self._failures.pop(account_key, None)
+
+    def start(self):
+        self.token_cache.add_listener(self.schedule)
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+        self.logger.info(f"token 后台刷新已启动，提前 {self.margin}s 刷新")
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                due, wait_seconds = self._pop_due()
+                if due is None:
+                    self._cond.wait(timeout=wait_seconds)
+                    continue
+            account_key, token, fetch = due
+            try:
+                self.token_cache.refresh(account_key, fetch, stale_token=token)
+                self._refreshed(account_key)
+            except Exception as e:
+                self._retry_later(account_key, token, e)
+
+    async def run_async(self):
+        """
+        异步模式的刷新循环，调用 stop 后结束
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.token_cache.add_listener(self.schedule)
+        self.logger.info(f"token 后台刷新已启动（异步模式），提前 {self.margin}s 刷新")
+        try:
+            while not self._stopped:
+                # 先清除唤醒标记再检查堆，避免丢失期间登记的刷新
+                self._wakeup.clear()
+                with self._cond:
+                    due, wait_seconds = self._pop_due()
+                if due is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=wait_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                account_key, token, fetch = due
+                try:
+                    await self.token_cache.refresh_async(account_key, fetch, stale_token=token)
+                    self._refreshed(account_key)
+                except Exception as e:
+                    self._retry_later(account_key, token, e)
+        finally:
+            self.token_cache.remove_listener(self.schedule)
+            self._loop = None
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        if self._thread is not None:
+            self._thread.join()
+            self.token_cache.remove_listener(self.schedule)
+        self.logger.info(f"token 后台刷新已停止，共刷新 {self.refresh_count} 次")
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+from config import Config
+
+# 当前账号，由 RunService 在启动账号时设置；线程与 asyncio 任务各自独立
+current_account = contextvars.ContextVar("current_account", default=None)
+
+
+class _NoopSpan:
+    """未开启追踪时 span() 返回的共享空对象"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "begin")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.begin = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.begin, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Tracer:
+    """
+    运行过程的 span 追踪，输出 Chrome trace-event JSON（chrome://tracing / Perfetto 可直接打开）
+    - 线程模式下每个线程一条轨道；异步模式下各账号的协程交错执行，按账号划分轨道
+    - span 附带线程名与账号；未开启 ENABLE_TRACING 时 span()/traced 只做一次布尔判断
+    """
+    MAX_EVENTS = 500000
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events = []
+        self._dropped = 0
+        self._tracks = {}
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def enable(self):
+        self.enabled = True
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name, args)
+
+    def _track(self):
+        """
+        :return: (轨道 id, 轨道名, 账号)
+        """
+        account = current_account.get()
+        try:
+            in_task = asyncio.current_task() is not None
+        except RuntimeError:
+            in_task = False
+        if in_task:
+            key = ("account", account)
+            label = f"account:{account}" if account else "event-loop"
+        else:
+            label = threading.current_thread().name
+            # 线程结束后 ident 可能被新线程复用，连同线程名区分
+            key = ("thread", threading.get_ident(), label)
+        track = self._tracks.get(key)
+        if track is None:
+            with self._lock:
+                track = self._tracks.setdefault(key, (len(self._tracks) + 1, label))
+        return track[0], track[1], account
+
+    def record(self, name: str, begin_ns: int, end_ns: int, args: dict = None):
+        if len(self._events) >= self.MAX_EVENTS:
+            self._dropped += 1
+            return
+        tid, thread_name, account = self._track()
+        args = dict(args) if args else {}
+        args["thread"] = thread_name
+        if account is not None:
+            args.setdefault("account", account)
+        # list.append 在 GIL 下是原子操作，无需加锁
+        self._events.append({
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (begin_ns - self._origin) / 1000,
+            "dur": (end_ns - begin_ns) / 1000,
+            "pid": self._pid,
+            "tid": tid,
+            "args": args,
+        })
+
+    def merge_file(self, path: str):
+        """
+        并入分片子进程写出的追踪文件（各进程以 pid 区分），合并后删除该文件
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            events = json.load(f).get("traceEvents", [])
+        self._events.extend(events)
+        os.remove(path)
+
+    def write(self, path: str, process_name: str = None):
+        with self._lock:
+            tracks = list(self._tracks.values())
+        metadata = [{"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": process_name or Config.LOG_FILENAME}}]
+        metadata.extend(
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": label}}
+            for tid, label in tracks
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        if self._dropped:
+            self.logger.warning(f"追踪事件超出上限 {self.MAX_EVENTS}，丢弃 {self._dropped} 个")
+        self.logger.info(f"运行追踪已写入 {path}，共 {len(self._events)} 个 span")
+
+
+def traced(name: str = None):
+    """
+    为函数/协程函数记录 span，默认以 类名.方法名 命名
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+        tracer = Tracer.get_instance()
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_methods(cls):
+    """
+    类装饰器：为类中定义的全部方法（不含 __init__ 等双下划线方法）记录 span
+    """
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith("__") or not inspect.isfunction(attr):
+            continue
+        setattr(cls, attr_name, traced()(attr))
+    return cls
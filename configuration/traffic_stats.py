@@ -0,0 +1,43 @@
+import threading
+
+
+class TrafficStats:
+    """
+    进程级的接口流量统计，按 API 序号分别累计
+    - wire_bytes：响应体在线路上的字节数（压缩后）
+    - memory_bytes：响应体在内存中占用的字节数（探活模式下为单个读取块的大小）
+    """
+    _instance_lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def record(self, api_index, wire_bytes: int, memory_bytes: int):
+        with self._lock:
+            stats = self._endpoints.get(api_index)
+            if stats is None:
+                stats = self._endpoints[api_index] = {"calls": 0, "wire_bytes": 0, "memory_bytes": 0}
+            stats["calls"] += 1
+            stats["wire_bytes"] += wire_bytes
+            stats["memory_bytes"] += memory_bytes
+
+    def summary(self):
+        """
+        :return: {api_index: {calls, wire_bytes, memory_bytes, avg_wire_bytes, avg_memory_bytes}}
+        """
+        with self._lock:
+            endpoints = {api_index: dict(stats) for api_index, stats in self._endpoints.items()}
+        for stats in endpoints.values():
+            stats["avg_wire_bytes"] = stats["wire_bytes"] // stats["calls"]
+            stats["avg_memory_bytes"] = stats["memory_bytes"] // stats["calls"]
+        return dict(sorted(endpoints.items()))
@@ -0,0 +1,185 @@
+import logging
+import queue
+import threading
+import time
+
+from config import Config
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    数据库写入的 write-behind 队列
+    工作线程只负责入队，单个写线程按 (类型, 主键) 合并写入（后写覆盖先写），
+    在合并窗口结束或达到批量上限时以一个事务批量提交，避免远程数据库的往返延迟阻塞 API 调用。
+    """
+
+    def __init__(self, db_session, flush_interval: float = None, batch_size: int = None):
+        """
+        :param db_session: 提供 get_session 的 BaseDBSession 实例
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.db_session = db_session
+        self.flush_interval = flush_interval or Config.WRITE_BEHIND_FLUSH_INTERVAL
+        self.batch_size = batch_size or Config.WRITE_BEHIND_BATCH_SIZE
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushed_rows": 0,
+            "flush_count": 0,
+            "failed_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def register(self, kind: str, handler):
+        """
+        登记写入类型，同一批次内按登记顺序执行（如先插入后更新）
+        :param handler: handler(session, {key: fields})
+        """
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, key, fields: dict):
+        if kind not in self._handlers:
+            raise ValueError(f"未登记的写入类型: {kind}")
+        self._queue.put((kind, key, dict(fields)))
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        self.logger.info(f"write-behind 队列已启动，合并窗口 {self.flush_interval}s，批量上限 {self.batch_size}")
+        return self
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        阻塞直到此前入队的写入全部提交
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """
+        提交剩余写入并停止写线程
+        """
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self.logger.info(f"write-behind 队列已关闭：{self.stats()}")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_flush_ms"] = round(stats["total_flush_ms"] / stats["flush_count"], 2) if stats["flush_count"] else 0.0
+        return stats
+
+    def _run(self):
+        while True:
+            pending = {}
+            waiters = []
+            stop = False
+
+            # 阻塞等待第一条写入，之后在合并窗口内继续收集
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                kind, key, fields = item
+                merged = pending.get((kind, key))
+                if merged is None:
+                    pending[(kind, key)] = fields
+                else:
+                    merged.update(fields)
+                    with self._stats_lock:
+                        self._stats["coalesced"] += 1
+                if len(pending) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if pending:
+                self._flush(pending)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _flush(self, pending):
+        batches = {kind: {} for kind in self._handlers}
+        for (kind, key), fields in pending.items():
+            batches[kind][key] = fields
+
+        begin = time.perf_counter()
+        failed = 0
+        for attempt in range(1, Config.MAX_RETRIES + 1):
+            try:
+                self._commit(batches)
+                break
+            except Exception as e:
+                if attempt == Config.MAX_RETRIES:
+                    self.logger.error(f"write-behind 批量提交失败，改为按类型、按主键逐一提交: {e}")
+                    failed = self._flush_isolated(batches)
+                    break
+                self.logger.warning(f"write-behind 批量提交失败，第 {attempt} 次重试: {e}")
+                time.sleep(Config.BASE_BACKOFF)
+
+        elapsed_ms = (time.perf_counter() - begin) * 1000
+        with self._stats_lock:
+            self._stats["failed_rows"] += failed
+            self._stats["flushed_rows"] += len(pending) - failed
+            self._stats["flush_count"] += 1
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            self._stats["total_flush_ms"] += elapsed_ms
+        self.logger.info(f"write-behind 提交 {len(pending) - failed} 条写入，耗时 {elapsed_ms:.2f}ms，队列剩余 {self._queue.qsize()}")
+
+    def _commit(self, batches):
+        """在一个事务内按登记顺序执行各类型的写入"""
+        with self.db_session.get_session() as session:
+            for kind, items in batches.items():
+                if items:
+                    self._handlers[kind](session, items)
+
+    def _flush_isolated(self, batches) -> int:
+        """
+        整批提交失败后的降级：各类型分别提交，仍失败的类型再按主键逐条提交，只丢弃出错的写入
+        避免一条坏数据连带丢弃其他账号刷新后的 token
+        :return: 丢弃的写入数
+        """
+        failed = 0
+        for kind, items in batches.items():
+            if not items:
+                continue
+            try:
+                self._commit({kind: items})
+                continue
+            except Exception as e:
+                self.logger.warning(f"write-behind 类型 {kind} 提交失败，按主键逐条提交: {e}")
+            for key, fields in items.items():
+                try:
+                    self._commit({kind: {key: fields}})
+                except Exception as e:
+                    failed += 1
+                    self.logger.error(f"write-behind 丢弃写入 [{kind}] {key}: {e}")
+        return failed
@@ -0,0 +1,96 @@
+from sqlalchemy import select, update, and_, or_, bindparam
+
+from configuration.base_db_session import BaseDBSession
+from pojo.account_lease import AccountLease, AccountLeaseRecord
+
+
+class AccountLeaseService(BaseDBSession):
+    def __init__(self, database_url: str = None):
+        super().__init__(database_url)
+
+    @staticmethod
+    def _claimable():
+        """可认领：无人持有或租约已过期，且不在完成后的冷却期内"""
+        return and_(
+            AccountLease.env_name.in_(bindparam("env_names", expanding=True)),
+            or_(AccountLease.owner.is_(None), AccountLease.lease_expires < bindparam("now")),
+            or_(AccountLease.completed_at.is_(None), AccountLease.completed_at < bindparam("completed_before")),
+        )
+
+    def get_by_env_names(self, env_names):
+        with self.get_readonly_session() as session:
+            rows = session.execute(
+                select(*AccountLeaseRecord.columns).where(AccountLease.env_name.in_(list(env_names)))
+            ).all()
+            return [AccountLeaseRecord.from_row(row) for row in rows]
+
+    def ensure(self, env_names):
+        """为尚无租约记录的账号补齐记录，已存在的记录不变"""
+        return self.execute_insert_ignore(AccountLease.__table__, [{"env_name": env_name} for env_name in env_names])
+
+    def claim(self, owner: int, env_names, limit: int, now, lease_expires, completed_before):
+        """
+        在一个事务内认领至多 limit 个账号
+        SELECT ... FOR UPDATE SKIP LOCKED 跳过其他任务正在认领的行，多个任务同时认领时互不等待、互不重叠
+        :return: 认领到的 env_name 列表
+        """
+        params = {"env_names": list(env_names), "now": now, "completed_before": completed_before}
+        with self.get_connection() as conn:
+            selected = conn.execute(
+                select(AccountLease.env_name)
+                .where(self._claimable())
+                .order_by(AccountLease.completed_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True),
+                params
+            ).scalars().all()
+            if not selected:
+                return []
+            # 更新时再次校验可认领条件：不支持行锁的数据库（如压测用的 SQLite）上同样不会重复认领
+            rowcount = conn.execute(
+                update(AccountLease)
+                .where(self._claimable())
+                .values(owner=owner, lease_expires=lease_expires),
+                dict(params, env_names=selected)
+            ).rowcount
+            if rowcount == len(selected):
+                return list(selected)
+            return list(conn.execute(
+                select(AccountLease.env_name).where(
+                    AccountLease.env_name.in_(selected), AccountLease.owner == owner
+                )
+            ).scalars().all())
+
+    def renew(self, owner: int, env_names, lease_expires) -> int:
+        """
+        续约仍由本任务持有的租约
+        :return: 续约成功的记录数，少于 env_names 数量说明部分租约已过期并被回收
+        """
+        with self.get_connection() as conn:
+            return conn.execute(
+                update(AccountLease)
+                .where(AccountLease.env_name.in_(list(env_names)), AccountLease.owner == owner)
+                .values(lease_expires=lease_expires)
+            ).rowcount
+
+    def complete(self, owner: int, env_names, completed_at) -> int:
+        """释放租约并记录完成时间"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                update(AccountLease)
+                .where(AccountLease.env_name.in_(list(env_names)), AccountLease.owner == owner)
+                .values(owner=None, lease_expires=None, completed_at=completed_at, completed_by=owner)
+            ).rowcount
+
+    def release(self, owner: int, env_names) -> int:
+        """释放未完成的租约，使其他任务可以立即认领"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                update(AccountLease)
+                .where(AccountLease.env_name.in_(list(env_names)), AccountLease.owner == owner)
+                .values(owner=None, lease_expires=None)
+            ).rowcount
+
+    def create_table(self):
+        """迁移：创建 account_lease 表（已存在时跳过）"""
+        AccountLease.__table__.create(self._engine, checkfirst=True)
@@ -1,6 +1,8 @@
+from sqlalchemy import inspect, select, text
 
 from configuration.base_db_session import BaseDBSession
-from pojo.account import Account
+from pojo.account import Account, AccountRecord
+from pojo.account_snapshot import AccountSnapshot
 
 
 class AccountService(BaseDBSession):
@@ -8,44 +10,162 @@ class AccountService(BaseDBSession):
         super().__init__(database_url)
 
     def get_by_env_name(self, env_name: str):
+        # 按列查询得到行元组，直接构造只读快照，不经过 ORM 对象
         with self.get_readonly_session() as session:
-            result = session.query(Account).filter(Account.env_name == env_name).first()
-            if result:
-                # 手动构造一个脱离 session 的 Account 对象
-                account = Account()
-                for column in Account.__table__.columns:
-                    setattr(account, column.name, getattr(result, column.name))
-                return account
-            return None
+            row = session.execute(
+                select(*AccountRecord.columns).where(Account.env_name == env_name)
+            ).first()
+            return AccountRecord.from_row(row) if row else None
+
+    def get_by_env_names(self, env_names):
+        """
+        一次 IN (...) 查询批量读取账号
+        :return: {env_name: AccountRecord}
+        """
+        if not env_names:
+            return {}
+        with self.get_readonly_session() as session:
+            rows = session.execute(
+                select(*AccountRecord.columns).where(Account.env_name.in_(list(env_names)))
+            ).all()
+            records = [AccountRecord.from_row(row) for row in rows]
+            return {record.env_name: record for record in records}
 
     def get_by_access_token(self, access_token: str):
+        # 先按带索引的定长指纹定位，再比对原 token 排除哈希碰撞
         with self.get_readonly_session() as session:
-            result = session.query(Account).filter(Account.access_token == access_token).first()
-            if result:
-                # 手动构造一个脱离 session 的 Account 对象
-                account = Account()
-                for column in Account.__table__.columns:
-                    setattr(account, column.name, getattr(result, column.name))
-                return account
-            return None
+            row = session.execute(
+                select(*AccountRecord.columns).where(
+                    Account.access_token_hash == Account.fingerprint(access_token),
+                    Account.access_token == access_token
+                )
+            ).first()
+            return AccountRecord.from_row(row) if row else None
+
+    @staticmethod
+    def _with_fingerprint(fields: dict):
+        """写入 access_token 时同步写入其指纹"""
+        if "access_token" in fields:
+            fields = dict(fields)
+            fields["access_token_hash"] = Account.fingerprint(fields["access_token"])
+        return fields
 
     def insert(self, account: Account):
+        account.access_token_hash = Account.fingerprint(account.access_token)
+        if self._defer("account_insert", account.env_name, self._to_fields(account)):
+            return
         with self.get_session() as session:
             session.add(account)
 
+    @staticmethod
+    def _to_fields(account: Account):
+        return {
+            column.name: getattr(account, column.name)
+            for column in Account.__table__.columns
+            if getattr(account, column.name) is not None
+        }
+
+    @staticmethod
+    def flush_inserts(session, items):
+        """
+        write-behind 批量提交：插入账号
+        账号已被并发任务插入时不报主键冲突，改为更新 token 字段，避免整批提交失败
+        :param items: {env_name: fields}
+        """
+        AccountService.execute_upsert_on(
+            session, Account.__table__, list(items.values()),
+            ["access_token", "access_token_hash", "refresh_token", "expires_at"]
+        )
+
+    @staticmethod
+    def flush_updates(session, items):
+        """
+        write-behind 批量提交：更新账号字段
+        :param items: {env_name: fields}
+        """
+        for env_name, fields in items.items():
+            AccountService.execute_update_on(session, Account.__table__, {"env_name": env_name}, fields)
+
+    def bulk_upsert(self, rows):
+        """
+        单条 INSERT ... ON DUPLICATE KEY UPDATE 批量写入账号
+        并发任务已插入同一账号时仅更新 refresh_token
+        :param rows: [{column: value}, ...]
+        :return: 受影响行数
+        """
+        return self.execute_upsert(Account.__table__, rows, ["refresh_token"])
+
+    def prefetch(self, env_names, refresh_tokens: dict, create_time) -> AccountSnapshot:
+        """
+        任务开始时批量加载全部启用账号，并一次性补齐数据库中缺失的账号
+        :param env_names: 启用账号列表
+        :param refresh_tokens: {env_name: refresh_token}
+        :param create_time: 新账号的创建时间
+        :return: AccountSnapshot
+        """
+        snapshot = AccountSnapshot(self.get_by_env_names(env_names))
+        missing = snapshot.missing(env_names)
+        if missing:
+            rows = [
+                {
+                    "env_name": env_name,
+                    "refresh_token": refresh_tokens[env_name],
+                    "create_time": create_time,
+                }
+                for env_name in missing
+            ]
+            self.bulk_upsert(rows)
+            for row in rows:
+                snapshot.put(row["env_name"], AccountRecord(**row))
+        return snapshot
+
     def update_access_token(self, env_name: int, access_token: str):
-        with self.get_session() as session:
-            account = session.query(Account).filter(Account.env_name == env_name).first()
-            if account:
-                account.access_token = access_token
+        fields = self._with_fingerprint({"access_token": access_token})
+        if self._defer("account_update", env_name, fields):
+            return
+        return self.execute_update(Account.__table__, {"env_name": env_name}, fields)
 
     def update(self, env_name: str, **fields):
-        with self.get_session() as session:
-            account = session.query(Account).filter(Account.env_name == env_name).first()
-            if not account:
-                return False
-
-            for field, value in fields.items():
-                if hasattr(account, field):
-                    setattr(account, field, value)
-            return True
\ No newline at end of file
+        valid_fields = self._with_fingerprint({field: value for field, value in fields.items() if hasattr(Account, field)})
+        if self._defer("account_update", env_name, valid_fields):
+            return True
+        return self.execute_update(Account.__table__, {"env_name": env_name}, valid_fields) > 0
+
+    def migrate_access_token_hash(self):
+        """
+        迁移：为 account 表添加 access_token_hash 列与索引，并回填已有记录的指纹
+        可重复执行，已存在的列与索引不会重复创建
+        :return: 回填的行数
+        """
+        inspector = inspect(self._engine)
+        columns = {column["name"] for column in inspector.get_columns(Account.__tablename__)}
+        indexes = {index["name"] for index in inspector.get_indexes(Account.__tablename__)}
+        is_mysql = self._engine.dialect.name == "mysql"
+        with self.get_connection() as conn:
+            if "access_token_hash" not in columns:
+                self.logger.info("添加 access_token_hash 列")
+                # AFTER 子句仅 MySQL 支持
+                position = " AFTER access_token" if is_mysql else ""
+                conn.execute(text(f"ALTER TABLE account ADD COLUMN access_token_hash CHAR(64) NULL{position}"))
+            if "ix_account_access_token_hash" not in indexes:
+                self.logger.info("添加 access_token_hash 索引")
+                conn.execute(text("CREATE INDEX ix_account_access_token_hash ON account (access_token_hash)"))
+            if is_mysql:
+                backfilled = conn.execute(text(
+                    "UPDATE account SET access_token_hash = SHA2(access_token, 256) "
+                    "WHERE access_token IS NOT NULL AND access_token_hash IS NULL"
+                )).rowcount
+            else:
+                # 其他数据库没有 SHA2()，在 Python 中计算指纹后逐行回填
+                rows = conn.execute(text(
+                    "SELECT env_name, access_token FROM account "
+                    "WHERE access_token IS NOT NULL AND access_token_hash IS NULL"
+                )).all()
+                for env_name, access_token in rows:
+                    self.execute_update_on(
+                        conn, Account.__table__, {"env_name": env_name},
+                        {"access_token_hash": Account.fingerprint(access_token)}
+                    )
+                backfilled = len(rows)
+        self.logger.info(f"access_token_hash 回填完成，共 {backfilled} 行")
+        return backfilled
@@ -0,0 +1,26 @@
+from sqlalchemy import select
+
+from configuration.base_db_session import BaseDBSession
+from pojo.endpoint_health import EndpointHealth, EndpointHealthRecord
+
+
+class EndpointHealthService(BaseDBSession):
+    def __init__(self, database_url: str = None):
+        super().__init__(database_url)
+
+    def get_all(self):
+        with self.get_readonly_session() as session:
+            rows = session.execute(select(*EndpointHealthRecord.columns)).all()
+            return [EndpointHealthRecord.from_row(row) for row in rows]
+
+    def save(self, rows):
+        """
+        批量写入接口熔断状态，已存在的记录整行覆盖
+        :param rows: [{column: value}, ...]
+        """
+        update_columns = [column for column in rows[0] if column not in ("api_index", "tenant")] if rows else []
+        return self.execute_upsert(EndpointHealth.__table__, rows, update_columns)
+
+    def create_table(self):
+        """迁移：创建 endpoint_health 表（已存在时跳过）"""
+        EndpointHealth.__table__.create(self._engine, checkfirst=True)
@@ -1,7 +1,9 @@
 from datetime import datetime
 
+from sqlalchemy import insert, inspect, select, text
+
 from configuration.base_db_session import BaseDBSession
-from pojo.job_detail import JobDetail
+from pojo.job_detail import JobDetail, JobDetailRecord
 
 
 class JobDetailService(BaseDBSession):
@@ -10,24 +12,31 @@ class JobDetailService(BaseDBSession):
 
     def get_by_id(self, job_id: int):
         with self.get_readonly_session() as session:
-            result = session.query(JobDetail).filter(JobDetail.id == job_id).first()
-            if result:
-                # 手动构造一个脱离 session 的 Account 对象
-                job_detail = JobDetail()
-                for column in JobDetail.__table__.columns:
-                    setattr(job_detail, column.name, getattr(result, column.name))
-                return job_detail
-            return None
+            row = session.execute(
+                select(*JobDetailRecord.columns).where(JobDetail.id == job_id)
+            ).first()
+            return JobDetailRecord.from_row(row) if row else None
 
     def create_job(self, job: JobDetail):
+        # 只写入基础列：ORM 插入会带上 metrics 列，未执行 Migrate 的库会因缺少该列而失败
         with self.get_session() as session:
-            session.add(job)
+            session.execute(
+                insert(JobDetail.__table__).values({column.name: getattr(job, column.name) for column in JobDetailRecord.columns})
+            )
 
     def update_process(self, job_id: str, process: str):
-        with self.get_session() as session:
-            job = session.query(JobDetail).filter(JobDetail.id == job_id).first()
-            if job:
-                job.process = process
+        if self._defer("job_process", job_id, {"process": process}):
+            return
+        return self.execute_update(JobDetail.__table__, {"id": job_id}, {"process": process})
+
+    @staticmethod
+    def flush_updates(session, items):
+        """
+        write-behind 批量提交：更新任务字段
+        :param items: {job_id: fields}
+        """
+        for job_id, fields in items.items():
+            JobDetailService.execute_update_on(session, JobDetail.__table__, {"id": job_id}, fields)
 
     def delete_job(self, job_id: int):
         with self.get_session() as session:
@@ -36,10 +45,29 @@ class JobDetailService(BaseDBSession):
                 session.delete(job)
 
     def post_db_process(self, job_id: int):
-        with self.get_session() as session:
-            job = session.query(JobDetail).filter(JobDetail.id == job_id).first()
-            if job:
-                job.job_status = 1
-                job.end_time = datetime.now()
-                job.process = "post_process"
-                job.status = "end"
\ No newline at end of file
+        return self.execute_update(
+            JobDetail.__table__,
+            {"id": job_id},
+            {
+                "job_status": 1,
+                "end_time": datetime.now(),
+                "process": "post_process",
+                "status": "end",
+            }
+        )
+
+    def update_metrics(self, job_id: int, metrics: str):
+        """
+        写入本次任务的运行指标摘要
+        :param metrics: JSON 字符串
+        """
+        return self.execute_update(JobDetail.__table__, {"id": job_id}, {"metrics": metrics})
+
+    def migrate_metrics_column(self):
+        """迁移：为 job_detail 表添加 metrics 列（已存在时跳过）"""
+        columns = {column["name"] for column in inspect(self._engine).get_columns(JobDetail.__tablename__)}
+        if "metrics" in columns:
+            return
+        self.logger.info("添加 job_detail.metrics 列")
+        with self.get_connection() as conn:
+            conn.execute(text("ALTER TABLE job_detail ADD COLUMN metrics TEXT NULL"))
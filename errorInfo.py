@@ -9,6 +9,7 @@ class ErrorCode:
     INVOKE_API_ERROR = 'INVOKE_API_ERROR'
     MAIN_LOGICAL_ERROR = 'MAIN_LOGICAL_ERROR'
     SEND_NOTICE_ERROR = 'SEND_NOTICE_ERROR'
+    RUN_PLAN_ERROR = 'RUN_PLAN_ERROR'
 
     FIELD_MISSING = 'FIELD_MISSING'
     PREMISSION_DENIED = 'PREMISSION_DENIED'
@@ -25,6 +26,7 @@ class ErrorCode:
         INVOKE_API_ERROR: (3100, "外部API调用失败"),
         MAIN_LOGICAL_ERROR: (3105, "主程序逻辑错误"),
         SEND_NOTICE_ERROR: (3110, "发送通知失败"),
+        RUN_PLAN_ERROR: (3115, "运行计划生成失败"),
 
         FIELD_MISSING: (2200, "字段缺失"),
         PREMISSION_DENIED: (2401, "权限拒绝")
@@ -1,28 +1,39 @@
 # -*- coding: UTF-8 -*-
 import sys
+import json
+import math
 import time
+import asyncio
+import argparse
 import logging
 import random
 import threading
-from concurrent.futures import wait
+import multiprocessing
+from concurrent.futures import wait, as_completed, ThreadPoolExecutor, ProcessPoolExecutor
 from ipaddress import ip_address
 
 import requests
 from datetime import datetime, timezone, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from pyexpat import features
 
 from config import Config
-from configuration.base_db_session import BaseDBSession
 from configuration.custom_session import CustomSession
+from configuration.fault_injector import FaultInjector
+from configuration.circuit_breaker import CircuitBreaker
+from configuration.account_lease import AccountLeaseManager
+from configuration.metrics import MetricsRegistry
+from configuration.tracer import Tracer, current_account, traced, traced_methods
+from configuration.adaptive_limiter import ConcurrencyController
+from configuration.retry_policy import RetryPolicy
+from configuration.run_planner import RunPlanner
+from configuration.token_cache import TokenCache
+from configuration.traffic_stats import TrafficStats
+from configuration.token_refresher import TokenRefresher
+from configuration.write_behind_queue import WriteBehindQueue
 from configuration.thread_pool_config import ThreadPoolManager
-from dao.account_service import AccountService
-from dao.job_detail_service import JobDetailService
-from pojo.account import Account
 from pojo.account_context import AccountContext
 from pojo.api_error_set import APIErrorSet
-from pojo.job_detail import JobDetail
+from pojo.graph_batch import BatchEnvelope
+from pojo.run_report import RunReport
 from utils import Utils
 from errorInfo import ErrorCode
 from errorInfo import BasicException
@@ -34,15 +45,46 @@ thread_local = threading.local()
 
 class RunService(object):
 
-    def __init__(self):
+    def __init__(self, shard: str = None, job_id: str = None):
+        """
+        :param shard: 分片子进程的分片标识，主进程为 None
+        :param job_id: 分片子进程沿用主进程的任务 ID
+        """
         super().__init__()
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.shard = shard
+        self.job_id = job_id
+        if Config.ENABLE_TRACING:
+            # 在 __enter__ 之前开启，使其也记录在追踪中
+            Tracer.get_instance().enable()
         self.session = CustomSession()
-
-
+        self.job_detail_service = None
+        self.accountService = None
+        # 本次任务的账号快照（数据库模式下批量预取）
+        self.account_snapshot = None
+        # 数据库 write-behind 队列（ENABLE_WRITE_BEHIND 时启用）
+        self.write_behind = None
+        # 运行计划（配置 RUN_TIME_BUDGET 时生成）
+        self.run_plan = None
+        # 接口熔断历史的持久化（数据库模式且开启 ENABLE_CIRCUIT_BREAKER 时启用）
+        self.endpoint_health_service = None
+        # 分片运行结果（分片模式下启用），各账号的失败情况汇总后统一发送一条通知
+        self.run_report = None
+        if shard is not None or Config.SHARD_INDEX is not None or Config.SHARD_PROCESSES > 1:
+            self.run_report = RunReport()
+
+
+    @property
+    def is_orchestrator(self) -> bool:
+        """本机多进程分片的主进程：只负责调度子进程与汇总结果，自身不运行账号"""
+        return self.shard is None and Config.SHARD_PROCESSES > 1
+
+    @traced()
     def __enter__(self):
-        # 生成本次任务的唯一id
-        self.job_id = Utils.generate_id()
+        if self.shard is not None:
+            return self.enter_shard()
+        # 生成本次任务的唯一id，多 runner 分片时使用共同指定的任务 ID
+        self.job_id = Config.JOB_ID or Utils.generate_id()
         self.logger.info(f"本次任务ID：{self.job_id}")
 
         # 日志文件名称写入环境变量
@@ -63,22 +105,77 @@ class RunService(object):
         except Exception as e:
             raise BasicException(ErrorCode.WRITE_FILE_ERROR, extra=e)
 
+        if Config.METRICS_PORT is not None:
+            MetricsRegistry.get_instance().serve(Config.METRICS_PORT)
+
         # 建立数据库连接
         if Config.DATABASE_URL is None:
             self.logger.warning("未配置数据库，采用本地模式")
         else:
+            # 数据库相关模块按需导入，本地模式不加载 SQLAlchemy
+            from dao.account_service import AccountService
+            from dao.job_detail_service import JobDetailService
             try:
                 self.job_detail_service = JobDetailService()
                 self.accountService = AccountService()
             except Exception as e:
                 raise BasicException(ErrorCode.DATABASE_CONNECT_ERROR, extra=e)
+            # 数据库作为 token 缓存的写穿透存储
+            TokenCache.get_instance().bind_store(self.accountService)
 
-            # 初始化本次任务的数据库
-            self.job_detail_service.create_job(self.init_job_data())
+            # 初始化本次任务的数据库（多 runner 分片时由最先启动的 runner 创建任务记录）
+            if Config.JOB_ID is None or self.job_detail_service.get_by_id(int(self.job_id)) is None:
+                self.job_detail_service.create_job(self.init_job_data())
             self.logger.info("数据库初始化完成")
+            self.setup_database()
+        return self
+
+    @traced()
+    def enter_shard(self):
+        """
+        分片子进程的初始化：沿用主进程的任务 ID 与任务记录，不写 GITHUB_ENV，不提供 /metrics
+        """
+        self.logger.info(f"分片 {self.shard} 启动，任务ID：{self.job_id}")
+        if Config.DATABASE_URL is not None:
+            from dao.account_service import AccountService
+            from dao.job_detail_service import JobDetailService
+            try:
+                self.job_detail_service = JobDetailService()
+                self.accountService = AccountService()
+            except Exception as e:
+                raise BasicException(ErrorCode.DATABASE_CONNECT_ERROR, extra=e)
+            TokenCache.get_instance().bind_store(self.accountService)
+            self.setup_database()
         return self
 
+    def setup_database(self):
+        """
+        载入接口熔断历史，按配置启动 write-behind 队列
+        """
+        from configuration.base_db_session import BaseDBSession
+        from dao.account_service import AccountService
+        from dao.endpoint_health_service import EndpointHealthService
+        from dao.job_detail_service import JobDetailService
+        if Config.ENABLE_CIRCUIT_BREAKER:
+            # 载入历史熔断状态，失败时仅记录，不影响本次任务
+            try:
+                self.endpoint_health_service = EndpointHealthService()
+                CircuitBreaker.get_instance().load(self.endpoint_health_service.get_all())
+            except Exception as e:
+                self.endpoint_health_service = None
+                self.logger.warning(f"接口熔断历史载入失败，本次任务不持久化熔断状态（可执行 Migrate 建表）: {e}")
+
+        if Config.ENABLE_WRITE_BEHIND:
+            self.write_behind = WriteBehindQueue(self.accountService)
+            # 同一批次内按登记顺序执行：先插入账号，再更新
+            self.write_behind.register("account_insert", AccountService.flush_inserts)
+            self.write_behind.register("account_update", AccountService.flush_updates)
+            self.write_behind.register("job_process", JobDetailService.flush_updates)
+            self.write_behind.start()
+            BaseDBSession.set_write_behind(self.write_behind)
+
 
+    @traced()
     def init_job_data(self):
         """
         获取运行服务器的IP相关信息
@@ -88,6 +185,7 @@ class RunService(object):
             response.raise_for_status()
 
             ip_data = response.json()
+            from pojo.job_detail import JobDetail
             new_job = JobDetail(
                 id=self.job_id,
                 start_time=datetime.now(),
@@ -106,20 +204,50 @@ class RunService(object):
         return new_job
 
 
-    def schedule_startup(self, enabled_indices, startup_func, *args, **kwargs):
+    @traced()
+    def prefetch_accounts(self, enabled_indices):
         """
-        enabled_indices: list of indices (对应 USER_TOKEN_DICT keys 的顺序)
-        startup_func: 要启动账号时调用的函数，签名如 func(account_key, refresh_token, ...)
-        args, kwargs: 额外传给 startup_func 的参数
+        数据库模式下一次性加载全部启用账号，并批量补齐缺失的账号记录
+        数据库往返次数不随账号数量增长
+        """
+        if self.accountService is None:
+            return
+        keys = list(Config.USER_TOKEN_DICT.keys())
+        env_names = [keys[idx] for idx in enabled_indices]
+        try:
+            self.account_snapshot = self.accountService.prefetch(
+                env_names,
+                Config.USER_TOKEN_DICT,
+                Utils.get_beijing_time()
+            )
+        except Exception as e:
+            raise BasicException(ErrorCode.DB_ERROR, extra=e)
+        self.logger.info(f"账号快照已加载，共 {len(self.account_snapshot)} 个账号")
 
-        调度所有账号在 Config.MAX_START_TIME 内启动，使用 threading.Timer。
+    def update_job_process(self, process: str):
         """
-        self.logger.info("进入任务调用")
+        更新任务进度，本地模式与分片子进程中跳过（由主进程更新）
+        """
+        if self.job_detail_service is None or self.shard is not None:
+            return
         try:
-            self.job_detail_service.update_process(self.job_id, "enter_RunService")
+            self.job_detail_service.update_process(self.job_id, process)
         except Exception as e:
             raise BasicException(ErrorCode.UPDATE_DATABASE_ERROR, extra=e)
 
+    def plan_start_delays(self, enabled_indices):
+        """
+        将启用账号的启动时间均匀分散在 Config.MAX_START_DELAY 内；
+        存在运行计划时按计划中的启动时刻执行（由 start_run_plan 在开始调度时换算为实际延迟）
+        :param enabled_indices: USER_TOKEN_DICT keys 的索引列表
+        :return: [(account_key, refresh_token, delay, account_plan), ...]
+        """
+        if self.run_plan is not None:
+            return [
+                (account_plan.account_key, account_plan.refresh_token, account_plan.start_offset, account_plan)
+                for account_plan in self.run_plan.accounts
+            ]
+
         total = len(enabled_indices)
         if total == 0:
             return []
@@ -128,26 +256,132 @@ class RunService(object):
         # keys 顺序
         keys = list(Config.USER_TOKEN_DICT.keys())
 
-        thread_pool = ThreadPoolManager.get_instance(max_workers=10, thread_name_prefix="startup")
-        futures = []
-
+        plan = []
         for idx_pos, idx in enumerate(enabled_indices):
             # idx_pos in [0, total-1], idx 是 USER_TOKEN_DICT 的索引
             start = idx_pos * interval
             end = (idx_pos + 1) * interval
-            delay = random.uniform(start, end)
             account_key = keys[idx]
-            refresh_token = Config.USER_TOKEN_DICT[account_key]
+            plan.append((account_key, Config.USER_TOKEN_DICT[account_key], random.uniform(start, end), None))
+        return plan
+
+    def start_run_plan(self, start_plan):
+        """
+        token 预热结束、开始调度时记录计划开始时间，预热消耗的时间从时间线中扣除；
+        重试等待同样不超过计划的调用截止时刻
+        :return: 按压缩后的时间线换算启动延迟的 start_plan
+        """
+        if self.run_plan is None:
+            return start_plan
+        self.run_plan.start()
+        RetryPolicy.get_instance().set_deadline(self.run_plan.deadline_at)
+        if self.run_plan.scale < 0.9:
+            self.logger.warning(f"开始调度前已消耗 {(1 - self.run_plan.scale) * 100:.0f}% 的调用窗口，时间线按比例压缩")
+        return [
+            (account_key, refresh_token, max(0.0, self.run_plan.seconds_until(account_plan.start_offset)), account_plan)
+            for account_key, refresh_token, _, account_plan in start_plan
+        ]
+
+    @traced()
+    def prewarm_tokens(self, start_plan, call_api, token_refresher):
+        """
+        启动前以有限并发预热全部账号的 token，并登记到后台刷新器
+        单个账号预热失败不影响其他账号，该账号启动后按原流程获取 token
+        """
+        self.logger.info(f"token 预热开始，共 {len(start_plan)} 个账号")
+
+        def prewarm(account_key, refresh_token):
+            account_context = AccountContext(account_key=account_key, refresh_token=refresh_token)
+            account_token = current_account.set(account_key)
+            try:
+                call_api.prewarm_token(account_context)
+            finally:
+                current_account.reset(account_token)
+            token_refresher.register(account_key, lambda: call_api.request_token(account_context))
+
+        with ThreadPoolExecutor(max_workers=Config.TOKEN_PREWARM_CONCURRENCY, thread_name_prefix="prewarm") as executor:
+            futures = {
+                executor.submit(prewarm, account_key, refresh_token): account_key
+                for account_key, refresh_token, _, _ in start_plan
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.logger.error(f"[Prewarm] 账号 {futures[future]} token 预热失败: {e}")
+        self.logger.info("token 预热完成")
+
+    @traced()
+    async def prewarm_tokens_async(self, start_plan, call_api, token_refresher):
+        """
+        prewarm_tokens 的异步版本，以信号量限制并发
+        """
+        self.logger.info(f"token 预热开始，共 {len(start_plan)} 个账号")
+        semaphore = asyncio.Semaphore(Config.TOKEN_PREWARM_CONCURRENCY)
+
+        async def prewarm(account_key, refresh_token):
+            async with semaphore:
+                try:
+                    account_context = AccountContext(account_key=account_key, refresh_token=refresh_token)
+                    current_account.set(account_key)
+                    await call_api.prewarm_token(account_context)
+                    token_refresher.register(account_key, lambda: call_api.request_token(account_context))
+                except Exception as e:
+                    self.logger.error(f"[Prewarm] 账号 {account_key} token 预热失败: {e}")
 
+        await asyncio.gather(*(prewarm(account_key, refresh_token) for account_key, refresh_token, _, _ in start_plan))
+        self.logger.info("token 预热完成")
+
+    @traced()
+    def schedule_startup(self, enabled_indices, startup_func, *args, prewarm_api=None, **kwargs):
+        """
+        enabled_indices: list of indices (对应 USER_TOKEN_DICT keys 的顺序)
+        startup_func: 要启动账号时调用的函数，签名如 func(account_key, refresh_token, ...)
+        prewarm_api: 用于 token 预热与后台刷新的 CallAPI 实例，为空时不预热
+        args, kwargs: 额外传给 startup_func 的参数
+
+        调度所有账号在 Config.MAX_START_TIME 内启动，使用 threading.Timer。
+        """
+        self.logger.info("进入任务调用")
+        self.update_job_process("enter_RunService")
+
+        start_plan = self.plan_start_delays(enabled_indices)
+        if not start_plan:
+            return []
+
+        max_workers = 10
+        if self.run_plan is not None:
+            # 按计划执行时每个账号需独占线程等待计划时刻，否则排队账号会错过时间线
+            max_workers = max(max_workers, min(len(start_plan), Config.PLAN_MAX_THREADS))
+            if len(start_plan) > Config.PLAN_MAX_THREADS:
+                self.logger.warning("账号数超出 PLAN_MAX_THREADS，部分账号将延后启动，建议使用 async 执行模式")
+        if Config.ENABLE_ADAPTIVE_CONCURRENCY:
+            # 线程数不应成为瓶颈，实际并发由自适应限制器控制
+            max_workers = max(max_workers, min(len(start_plan), Config.GRAPH_CONCURRENCY_MAX))
+        # 每个并发线程（启动线程/预热线程，外加后台刷新线程）都能持有一个长连接，避免连接池满后丢弃连接
+        self.session.resize_pool(max(Config.HTTP_POOL_MAXSIZE, max_workers, Config.TOKEN_PREWARM_CONCURRENCY) + 1)
+        token_refresher = None
+        if Config.ENABLE_TOKEN_PREWARM and prewarm_api is not None:
+            token_refresher = TokenRefresher()
+            self.prewarm_tokens(start_plan, prewarm_api, token_refresher)
+            token_refresher.start()
+        start_plan = self.start_run_plan(start_plan)
+
+        thread_pool = ThreadPoolManager.get_instance(max_workers=max_workers, thread_name_prefix="startup")
+        MetricsRegistry.get_instance().thread_pool_queue_depth.set_function(thread_pool.queue_depth, "startup")
+        futures = []
+
+        for account_key, refresh_token, delay, account_plan in start_plan:
             # 随机选择 proxy 和 UA
             # proxy = random.choice(Config.PROXIES) if Config.PROXIES else None
             # user_agent = random.choice(Config.USER_AGENT_LIST) if Config.USER_AGENT_LIST else None
 
-            def delayed_start():
+            def delayed_start(account_key=account_key, refresh_token=refresh_token, delay=delay, account_plan=account_plan):
                 try:
                     account_context = AccountContext(
                         account_key = account_key,
                         refresh_token = refresh_token,
+                        plan = account_plan,
                         # proxy = proxy,
                         # user_agent = user_agent
                     )
@@ -156,7 +390,11 @@ class RunService(object):
                         f"[Future] Future account {account_key} with delay {delay:.2f}s"
                     )
                     time.sleep(delay)
-                    startup_func(account_context, *args, **kwargs)
+                    account_token = current_account.set(account_key)
+                    try:
+                        startup_func(account_context, *args, **kwargs)
+                    finally:
+                        current_account.reset(account_token)
                 except Exception as e:
                     self.logger.exception(f"[Startup] 启动账号 {account_key} 异常: {e}")
 
@@ -170,38 +408,245 @@ class RunService(object):
         # scheduler.start()
 
         wait(futures)
+        if token_refresher is not None:
+            token_refresher.stop()
+        RetryPolicy.get_instance().set_deadline(None)
 
         # for item in scheduled:
         #     timer = item[2]
         #     timer.join()
 
         self.logger.info("退出任务调用")
-        try:
-            self.logger.info("尝试更新数据库信息")
-            self.job_detail_service.update_process(self.job_id, "exit_RunService")
-        except Exception as e:
-            raise BasicException(ErrorCode.UPDATE_DATABASE_ERROR, extra=e)
+        self.logger.info("尝试更新数据库信息")
+        self.update_job_process("exit_RunService")
 
         return futures
 
+    @traced()
+    def schedule_startup_async(self, enabled_indices, call_api):
+        """
+        异步模式的账号调度：单个事件循环驱动全部账号，等待期间不占用线程
+        enabled_indices: list of indices (对应 USER_TOKEN_DICT keys 的顺序)
+        call_api: AsyncCallAPI 实例，在事件循环内打开连接池
+        """
+        self.logger.info("进入任务调用（异步模式）")
+        self.update_job_process("enter_RunService")
+
+        start_plan = self.plan_start_delays(enabled_indices)
+        if not start_plan:
+            return []
+
+        async def delayed_start(account_key, refresh_token, delay, account_plan):
+            try:
+                account_context = AccountContext(
+                    account_key = account_key,
+                    refresh_token = refresh_token,
+                    plan = account_plan,
+                )
+                logging.info(f"[Task] Task account {account_key} with delay {delay:.2f}s")
+                await asyncio.sleep(delay)
+                # 每个账号运行在独立的任务中，上下文变量不会相互影响
+                current_account.set(account_key)
+                await call_api.run(account_context)
+            except Exception as e:
+                self.logger.exception(f"[Startup] 启动账号 {account_key} 异常: {e}")
+
+        async def main():
+            async with call_api:
+                token_refresher = None
+                refresher_task = None
+                if Config.ENABLE_TOKEN_PREWARM:
+                    token_refresher = TokenRefresher()
+                    await self.prewarm_tokens_async(start_plan, call_api, token_refresher)
+                    refresher_task = asyncio.create_task(token_refresher.run_async())
+
+                results = await asyncio.gather(
+                    *(delayed_start(*item) for item in self.start_run_plan(start_plan))
+                )
+                if token_refresher is not None:
+                    token_refresher.stop()
+                    await refresher_task
+                return results
+
+        results = asyncio.run(main())
+        RetryPolicy.get_instance().set_deadline(None)
+
+        self.logger.info("退出任务调用（异步模式）")
+        self.logger.info("尝试更新数据库信息")
+        self.update_job_process("exit_RunService")
+
+        return results
+
 
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.logger.info("执行主进程清理工作")
+        if self.write_behind is not None:
+            # 提交队列中剩余的写入
+            from configuration.base_db_session import BaseDBSession
+            BaseDBSession.set_write_behind(None)
+            self.write_behind.close()
+            stats = self.write_behind.stats()
+            self.logger.info(
+                f"write-behind 统计：入队 {stats['enqueued']} 条，合并 {stats['coalesced']} 条，"
+                f"提交 {stats['flush_count']} 次，平均耗时 {stats['avg_flush_ms']}ms，最大耗时 {stats['max_flush_ms']}ms，"
+                f"失败 {stats['failed_rows']} 条"
+            )
+        breaker = CircuitBreaker.get_instance()
+        if self.endpoint_health_service is not None:
+            try:
+                self.endpoint_health_service.save(breaker.dirty_rows())
+            except Exception as e:
+                self.logger.error(f"接口熔断状态保存失败: {e}")
+        for api_index, tenant in breaker.open_endpoints():
+            self.logger.warning(f"接口熔断中 [{api_index}]({tenant}) {Config.API_LIST[api_index]}")
+        for api_index, stats in TrafficStats.get_instance().summary().items():
+            self.logger.info(
+                f"接口流量统计 [{api_index}] {Config.API_LIST[api_index]}：调用 {stats['calls']} 次，"
+                f"平均线上字节 {stats['avg_wire_bytes']}B，平均内存字节 {stats['avg_memory_bytes']}B"
+            )
+        if Config.ENABLE_ADAPTIVE_CONCURRENCY:
+            for name, stats in ConcurrencyController.get_instance().stats().items():
+                self.logger.info(
+                    f"自适应并发统计 [{name}]：请求 {stats['requests']} 次，被限流 {stats['throttled']} 次，"
+                    f"慢请求 {stats['slow']} 次，当前上限 {stats['limit']}，峰值 {stats['peak_limit']}，"
+                    f"最低 {stats['lowest_limit']}"
+                )
+        retry_stats = RetryPolicy.get_instance().stats()
+        self.logger.info(f"请求重试统计：共重试 {retry_stats['used']} 次（预算 {retry_stats['budget']} 次）")
+        for endpoint, count in retry_stats["endpoints"].items():
+            self.logger.info(f"请求重试统计 [{endpoint}]：{count} 次")
+        if Config.ENABLE_FAULT_INJECTION:
+            injected = FaultInjector.get_instance().stats()
+            self.logger.info(f"故障注入统计：{json.dumps(injected, ensure_ascii=False)}")
+        for host, stats in self.session.pool_stats().items():
+            self.logger.info(
+                f"HTTP 连接池统计 [{host}]：复用 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                f"新建连接 {stats['new_connections']} 个，丢弃连接 {stats['discarded']} 个"
+            )
+        self.export_metrics()
+        if Config.ENABLE_TRACING:
+            tracer = Tracer.get_instance()
+            try:
+                if self.shard is not None:
+                    tracer.write(self.shard_file(Config.TRACE_FILE), f"{Config.LOG_FILENAME} shard {self.shard}")
+                else:
+                    for shard in self.run_report.shards if self.is_orchestrator else []:
+                        tracer.merge_file(self.shard_file(Config.TRACE_FILE, shard))
+                    tracer.write(Config.TRACE_FILE)
+            except OSError as e:
+                self.logger.error(f"运行追踪写入文件失败: {e}")
+        if self.run_report is not None and self.shard is None:
+            self.finish_report()
+
+    def shard_file(self, path: str, shard: str = None) -> str:
+        """
+        分片子进程的输出文件（运行指标、追踪），由主进程汇总
+        """
+        return f"{path}.shard{self.shard if shard is None else shard}"
+
+    def export_metrics(self):
+        """
+        导出运行指标：摘要写入日志与 job_detail，完整指标写入 METRICS_FILE
+        分片模式下各分片的摘要汇总到 RunReport，由主进程一并写入 job_detail
+        """
+        metrics = MetricsRegistry.get_instance()
+        summary = metrics.summary()
+        if self.run_report is not None and not self.is_orchestrator:
+            self.run_report.metrics.append(dict(summary, shard=self.shard or Config.SHARD_INDEX))
+        if self.is_orchestrator:
+            summary["shards"] = self.run_report.metrics
+        summary = json.dumps(summary, ensure_ascii=False, separators=(",", ":"))
+        self.logger.info(f"运行指标摘要：{summary}")
+        if self.job_detail_service is not None and self.shard is None and Config.SHARD_INDEX is None:
+            try:
+                self.job_detail_service.update_metrics(self.job_id, summary)
+            except Exception as e:
+                self.logger.error(f"运行指标摘要写入数据库失败（可执行 Migrate 添加 metrics 列）: {e}")
+        if Config.METRICS_FILE:
+            try:
+                metrics.write(Config.METRICS_FILE if self.shard is None else self.shard_file(Config.METRICS_FILE))
+            except OSError as e:
+                self.logger.error(f"运行指标写入文件失败: {e}")
+        metrics.shutdown()
+
+    def run_shards(self, enabled_indices, start_time: float, end_time: float = None):
+        """
+        本机多进程分片：按账号键哈希将账号分配到 SHARD_PROCESSES 个子进程，
+        每个子进程拥有独立的解释器（GIL）、HTTP 连接池与线程池，运行结果汇总到 run_report
+        :param end_time: 同 run_accounts
+        """
+        prefix = "" if Config.SHARD_INDEX is None else f"{Config.SHARD_INDEX}-"
+        shards = [
+            (f"{prefix}{shard_no}", indices)
+            for shard_no, indices in enumerate(Utils.split_shards(enabled_indices, Config.SHARD_PROCESSES, salt="process:"))
+            if indices
+        ]
+        self.logger.info(f"本机分片运行：{len(enabled_indices)} 个账号分配到 {len(shards)} 个子进程")
+        self.update_job_process("enter_RunService")
+        config_snapshot = Config.snapshot()
+        # spawn 启动全新的解释器，不继承主进程的线程、连接与锁
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+            futures = {
+                executor.submit(run_shard, shard, indices, self.job_id, config_snapshot, start_time, end_time): shard
+                for shard, indices in shards
+            }
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    self.run_report.merge(RunReport.from_dict(future.result()))
+                except Exception as e:
+                    self.logger.exception(f"分片 {shard} 异常退出: {e}")
+                    self.run_report.failed_shards.append(shard)
+        self.update_job_process("exit_RunService")
+
+    def finish_report(self):
+        """
+        分片运行结束：多 runner 分片时写出本 runner 的结果文件，由 MergeShards 任务合并后通知；
+        否则直接按合并后的结果发送一条通知
+        """
+        report = self.run_report
+        self.logger.info(
+            f"分片运行结果：分片 {sorted(report.shards)}，账号 {report.accounts} 个，"
+            f"存在调用失败的账号 {report.failed_accounts} 个，异常退出的分片 {report.failed_shards}"
+        )
+        if Config.SHARD_INDEX is not None:
+            try:
+                with open(Config.SHARD_RESULT_FILE, "w", encoding="utf-8") as f:
+                    json.dump(report.to_dict(), f, ensure_ascii=False)
+                self.logger.info(f"分片结果已写入 {Config.SHARD_RESULT_FILE}")
+            except OSError as e:
+                self.logger.error(f"分片结果写入文件失败: {e}")
+            return
+        Utils.notify_report(report)
 
 
 
 
 
+@traced_methods
 class CallAPI(object):
 
-    def __init__(self, session, job_detail_service, account_service):
+    def __init__(self, session, job_detail_service, account_service, run_plan=None, account_snapshot=None, run_report=None):
         super().__init__()
         self.logger = logging.getLogger(self.__class__.__name__)
 
         self.session = session
         self.job_detail_service = job_detail_service
         self.account_service = account_service
+        self.run_plan = run_plan
+        self.account_snapshot = account_snapshot
+        # 分片模式下的运行结果汇总，为 None 时每个账号单独发送通知
+        self.run_report = run_report
+
+    def get_account_record(self, account_key):
+        """
+        读取账号记录，优先使用本次任务的账号快照
+        """
+        if self.account_snapshot is not None and account_key in self.account_snapshot:
+            return self.account_snapshot.get(account_key)
+        return self.account_service.get_by_env_name(account_key)
 
     def get_user_data(self, account_context: AccountContext):
         """
@@ -212,10 +657,10 @@ class CallAPI(object):
         user_agent = None
         proxy = None
         if Config.DATABASE_URL is None:
-            user_agent = Config.USER_AGENT_LIST[0] if Config.USER_AGENT_LIST[0] else None
-            proxy = Config.USER_AGENT_LIST if Config.USER_AGENT_LIST else None
+            user_agent = Config.USER_AGENT_LIST[0] if Config.USER_AGENT_LIST else None
+            proxy = Config.PROXIES[0] if Config.PROXIES else None
         else:
-            db_rec = self.account_service.get_by_env_name(account_context.account_key)
+            db_rec = self.get_account_record(account_context.account_key)
             user_agent = db_rec.user_agent
             proxy = db_rec.proxy
         account_context.user_agent = user_agent
@@ -244,6 +689,8 @@ class CallAPI(object):
             data=data,
             timeout=10,
             proxy=proxy,
+            # refresh_token 换取 token 可安全重发
+            retry=True,
             headers = {
                 "User-Agent": user_agent,
                 "Content-Type": "application/x-www-form-urlencoded",
@@ -258,7 +705,7 @@ class CallAPI(object):
         返回 JSON dict；若失败抛异常或返回 None
         """
         resp = self.session.get(
-            "https://graph.microsoft.com/v1.0/me",
+            Config.USER_INFO_URL,
             headers = {
                 "Authorization": f"Bearer {access_token}",
                 "User-Agent": user_agent,
@@ -268,58 +715,90 @@ class CallAPI(object):
         resp.raise_for_status()
         return resp.json()
 
+    def request_token(self, account_context: AccountContext):
+        """
+        以账号上下文请求 token 端点，供 TokenCache 刷新时调用
+        """
+        return self.get_ms_token(
+            Config.CLIENT_ID,
+            Config.CLIENT_SECRET,
+            account_context.refresh_token,
+            account_context.proxy,
+            account_context.user_agent
+        )
+
+    def ensure_token(self, account_context: AccountContext):
+        """
+        获取账号当前的 token 记录，优先取进程级缓存，缓存未命中时才读取数据库；
+        数据库中不存在的账号请求新 token 并插入
+        """
+        account_key = account_context.account_key
+        refresh_token = account_context.refresh_token
+        token_cache = TokenCache.get_instance()
+        db_url = Config.DATABASE_URL
+
+        entry = token_cache.get(account_key)
+        if entry is None:
+            db_rec = None
+            if db_url is not None:
+                db_rec = self.get_account_record(account_key)
+            if db_rec is None or not db_rec.access_token or db_rec.expires_at is None:
+                # 账号尚无 token；记录已存在（如批量预取时补齐的账号）时写穿透到数据库
+                entry = token_cache.refresh(account_key, lambda: self.request_token(account_context), write_through=db_rec is not None)
+            else:
+                entry = token_cache.put(account_key, db_rec.access_token, Utils.add_beijing_timezone(db_rec.expires_at))
+
+            # 存储本次获取的信息
+            if db_url is not None and db_rec is None:
+                self.logger.info("数据库模式，插入用户token信息")
+                from pojo.account import Account
+                new_account = Account(
+                    env_name = account_key,
+                    access_token = entry.access_token,
+                    refresh_token = refresh_token,
+                    expires_at = entry.expires_at,
+                    create_time = Utils.get_beijing_time()
+                )
+                self.account_service.insert(new_account)
+        return entry
+
+    def prewarm_token(self, account_context: AccountContext):
+        """
+        预热阶段：补充上下文并确保 token 在刷新余量之后仍然有效
+        """
+        self.get_user_data(account_context)
+        entry = self.ensure_token(account_context)
+        if entry.expires_within(Config.TOKEN_REFRESH_MARGIN):
+            entry = TokenCache.get_instance().refresh(
+                account_context.account_key,
+                lambda: self.request_token(account_context),
+                stale_token=entry.access_token
+            )
+        account_context.account_token = entry.access_token
+
     def get_access_and_userinfo(self, account_context: AccountContext):
         """
         account_key: "MS_TOKEN" 或 "MS_TOKEN_01" 等
         refresh_token: 初始 refresh_token（从 Config.USER_TOKEN_DICT 取）
         返回 (access_token, user_info_dict)
         """
-        client_id = Config.CLIENT_ID
-        client_secret = Config.CLIENT_SECRET
-
         account_key = account_context.account_key
-        refresh_token = account_context.refresh_token
-        proxy = account_context.proxy
         user_agent = account_context.user_agent
+        token_cache = TokenCache.get_instance()
 
-        access_token = None
-        expires_at = None
         user_info = None
 
-        db_rec = None
-        db_url = Config.DATABASE_URL
-        if db_url is not None:
-            db_rec = self.account_service.get_by_env_name(account_key)
-
         # 获取token
-        if db_url is None or db_rec is None:
-            token_data = self.get_ms_token(client_id, client_secret, refresh_token, proxy, user_agent)
-            access_token = token_data.get("access_token")
-            expires_at = Utils.get_beijing_time(int(token_data.get("expires_in")))
-        else:
-            access_token = db_rec.access_token
-            expires_at = Utils.add_beijing_timezone(db_rec.expires_at)
-
-        # 存储本次获取的信息
-        if db_url is not None and db_rec is None:
-            self.logger.info("数据库模式，插入用户token信息")
-            new_account = Account(
-                env_name = account_key,
-                access_token = access_token,
-                refresh_token = refresh_token,
-                expires_at = expires_at,
-                create_time = Utils.get_beijing_time()
-            )
-            self.account_service.insert(new_account)
+        entry = self.ensure_token(account_context)
 
         # 判断是否有有效 access_token
         valid_access = False
-        if access_token and expires_at:
+        if entry.access_token and entry.expires_at:
             # 若在未来且剩余时间>10秒，视为有效；否则视为过期
-            if expires_at > Utils.get_beijing_time(10):
+            if not entry.expires_within(10):
                 # 尝试获取用户信息
                 try:
-                    user_info = self.fetch_user_info(access_token, user_agent)
+                    user_info = self.fetch_user_info(entry.access_token, user_agent)
                     valid_access = True
                 except requests.exceptions.HTTPError as e:
                     response = e.response
@@ -327,73 +806,135 @@ class CallAPI(object):
                         raise BasicException(ErrorCode.INVOKE_API_ERROR, extra=e)
         if not valid_access:
             self.logger.info("access_token 失效，尝试刷新")
-            # 刷新
-            token_data = self.get_ms_token(client_id, client_secret, refresh_token, proxy, user_agent)
-            access_token = token_data.get("access_token")
-            expires_at = Utils.get_beijing_time(int(token_data.get("expires_in")))
+            # 刷新，并发刷新同一账号时共享一次请求，数据库模式下写穿透
+            entry = token_cache.refresh(account_key, lambda: self.request_token(account_context), stale_token=entry.access_token)
             self.logger.info("刷新成功")
-
-            # 更新数据库
-            if db_url is not None:
-                self.logger.info("数据库模式，更新用户token信息")
-                self.account_service.update(
-                    env_name = account_key,
-                    access_token = access_token,
-                    expires_at = expires_at
-                )
             # 重新获取用户信息
             try:
-                user_info = self.fetch_user_info(access_token, user_agent)
+                user_info = self.fetch_user_info(entry.access_token, user_agent)
             except Exception as e:
                 raise BasicException(ErrorCode.INVOKE_API_ERROR, extra=e)
 
-        return access_token, user_info
+        return entry.access_token, user_info
 
     def check_token_deadline(self, account_context: AccountContext) -> bool:
         """
         检查token是否过期并刷新
+        token 状态取自进程级缓存，其他线程已刷新时直接复用
         """
+        token_cache = TokenCache.get_instance()
+        entry = token_cache.get(account_context.account_key)
+        if entry is None and Config.DATABASE_URL is not None \
+                and token_cache.find_account(account_context.account_token) is None:
+            # 本进程未缓存该 token 时，按指纹索引回查数据库
+            db_rec = self.account_service.get_by_access_token(account_context.account_token)
+            if db_rec is not None and db_rec.expires_at is not None:
+                entry = token_cache.put(db_rec.env_name, db_rec.access_token, Utils.add_beijing_timezone(db_rec.expires_at))
+        if entry is not None and entry.access_token != account_context.account_token:
+            self.logger.info("token已被其他任务刷新")
+            account_context.account_token = entry.access_token
+            return True
         # 判断是否存在数据库
         if Config.DATABASE_URL is None:
             self.logger.info("未配置数据库模式下刷新token")
-            token_data = self.get_ms_token(
-                Config.CLIENT_ID,
-                Config.CLIENT_SECRET,
-                account_context.refresh_token,
-                account_context.proxy,
-                account_context.user_agent
-            )
-            account_context.account_token = token_data.get("access_token")
-            return True
         else:
             self.logger.info("数据库模式下刷新token")
-            db_rec = self.account_service.get_by_access_token(account_context.account_token)
-            if db_rec is None or Utils.add_beijing_timezone(db_rec.expires_at) > Utils.get_beijing_time():
-                self.logger.info("数据库中token未过期！")
+            if entry is not None and not entry.expires_within(0):
+                self.logger.info("缓存中token未过期！")
                 return False
+        entry = token_cache.refresh(
+            account_context.account_key,
+            lambda: self.request_token(account_context),
+            stale_token=account_context.account_token
+        )
+        account_context.account_token = entry.access_token
+        return True
+
+    def get_template(self, api_index, account_context: AccountContext):
+        """
+        账号对单个接口的请求模板，首次调用时生成，之后每轮复用
+        """
+        template = account_context.templates.get(api_index)
+        if template is None:
+            template = self.session.prepare_template(
+                "GET",
+                Config.API_LIST[api_index],
+                headers={"User-Agent": account_context.user_agent},
+                proxy=account_context.proxy,
+                timeout=10,
+                probe=Config.ENABLE_PROBE_MODE
+            )
+            account_context.templates[api_index] = template
+        return template
+
+    def call_api_once(self, api_index, account_context: AccountContext, err_set):
+        """
+        调用单个API并处理失败情况
+        """
+        breaker = CircuitBreaker.get_instance()
+        if not breaker.allow(api_index, account_context.account_key):
+            self.logger.info(f"第 {str(api_index)} 号api熔断中，跳过")
+            return
+        # 使用缓存中的最新 token，后台刷新后无需经历一次 401
+        entry = TokenCache.get_instance().get(account_context.account_key)
+        if entry is not None:
+            account_context.account_token = entry.access_token
+        try:
+            resp = self.session.send_template(
+                self.get_template(api_index, account_context),
+                account_context.account_token
+            )
+            TrafficStats.get_instance().record(api_index, resp.wire_bytes, resp.memory_bytes)
+
+            if resp.status_code == 200:
+                self.logger.info('第' + str(api_index) + "号api调用成功")
+                breaker.record_success(api_index, account_context.account_key)
             else:
-                token_data = self.get_ms_token(
-                    Config.CLIENT_ID,
-                    Config.CLIENT_SECRET,
-                    account_context.refresh_token,
-                    account_context.proxy,
-                    account_context.user_agent
-                )
-                account_token = token_data.get("access_token")
-                account_context.account_token = account_token
-                self.account_service.update_access_token(account_context.account_key, account_token)
-                return True
+                self.logger.info(f"第 {str(api_index)} 号api调用失败, Detail: {resp.json}")
+                if resp.status_code == 401:
+                    if self.check_token_deadline(account_context):
+                        self.logger.info("token过期导致失败，已刷新")
+                    else:
+                        err_set.add_error(api_index)
+                        raise ValueError("token刷新过程出错，function 'check_token_deadline' return false")
+                else:
+                    self.logger.error(f"API调用失败，且状态码超出预期，response:{resp.json}")
+                    err_set.add_error(api_index)
+                    breaker.record_failure(api_index, account_context.account_key)
+        except requests.RequestException as e:
+            # 重试后仍连接失败或超时，计入接口熔断
+            breaker.record_failure(api_index, account_context.account_key)
+            self.logger.error(f"API 调用失败 - {Config.API_LIST[api_index]}, Detail: [{e}]")
+        except Exception as e:
+            self.logger.error(f"核心逻辑错误：API 调用失败 - {Config.API_LIST[api_index]}, Detail: [{e}]")
+        finally:
+            breaker.release_trial(api_index, account_context.account_key)
 
-    def run_api(self, api_list, account_context: AccountContext, err_set):
+    def call_batch_once(self, envelope: BatchEnvelope, account_context: AccountContext, err_set):
         """
-        按照设定的轮次循环调用API
+        以一个 $batch 请求调用一组API，并按子请求结果逐项处理
+        401 的子请求在刷新 token 后、429 的子请求按 RetryPolicy 等待（遵循 Retry-After）后重新打包发送
         """
-        for a in range(len(api_list)):
-            if Config.ENABLE_API_DELAY:
-                time.sleep(random.randint(Config.API_DELAY_MIN, Config.API_DELAY_MAX))
-            try:
-                resp = self.session.get(
-                    Config.API_LIST[api_list[a]],
+        breaker = CircuitBreaker.get_instance()
+        allowed = [item for item in envelope.items if breaker.allow(item.api_index, account_context.account_key)]
+        if len(allowed) < len(envelope.items):
+            self.logger.info(f"{len(envelope.items) - len(allowed)} 个子请求熔断中，跳过")
+        if not allowed:
+            return
+        pending = allowed
+        retry_policy = self.session.retry_policy
+        throttle_attempt = 0
+        try:
+            for attempt in range(1, Config.MAX_RETRIES + 1):
+                # 使用缓存中的最新 token，后台刷新后无需经历一次 401
+                entry = TokenCache.get_instance().get(account_context.account_key)
+                if entry is not None:
+                    account_context.account_token = entry.access_token
+                resp = self.session.post(
+                    envelope.batch_url,
+                    json=BatchEnvelope.payload(pending),
+                    # $batch 中均为 GET 子请求，可安全重发
+                    retry=True,
                     headers={
                         "Authorization": account_context.account_token,
                         "User-Agent": account_context.user_agent,
@@ -401,22 +942,114 @@ class CallAPI(object):
                     proxy=account_context.proxy,
                     timeout=10
                 )
-
                 if resp.status_code == 200:
-                    self.logger.info('第' + str(api_list[a]) + "号api调用成功")
+                    results = BatchEnvelope.split_responses(resp.json())
+                elif resp.status_code == 401:
+                    # 整个 $batch 被拒绝时，每个子请求按相同状态处理
+                    results = {item.request_id: (resp.status_code, dict(resp.headers)) for item in pending}
                 else:
-                    self.logger.info(f"第 {str(api_list[a])} 号api调用失败, Detail: {resp.json}")
-                    if resp.status_code == 401:
-                        if self.check_token_deadline(account_context):
-                            self.logger.info("token过期导致失败，已刷新")
-                        else:
-                            err_set.add_error(api_list[a])
-                            raise ValueError("token刷新过程出错，function 'check_token_deadline' return false")
+                    # 整个 $batch 的 429/5xx 已由会话按 RetryPolicy 重试，不再重复发送
+                    self.logger.error(f"$batch 调用失败，状态码 {resp.status_code}，response:{resp.text}")
+                    for item in pending:
+                        err_set.add_error(item.api_index)
+                    return
+
+                unauthorized, throttled, wait_seconds = [], [], 0
+                for item in pending:
+                    status, headers = results.get(item.request_id, (0, {}))
+                    if 200 <= status < 300:
+                        self.logger.info('第' + str(item.api_index) + "号api调用成功")
+                        breaker.record_success(item.api_index, account_context.account_key)
+                    elif status == 401:
+                        unauthorized.append(item)
+                    elif status == 429:
+                        throttled.append(item)
+                        wait_seconds = max(wait_seconds, BatchEnvelope.retry_after(headers, Config.BASE_BACKOFF))
                     else:
-                        self.logger.error(f"API调用失败，且状态码超出预期，response:{resp.json}")
-                        err_set.add_error(api_list[a])
-            except Exception as e:
-                self.logger.error(f"核心逻辑错误：API 调用失败 - {Config.API_LIST[api_list[a]]}, Detail: [{e}]")
+                        self.logger.error(f"第 {str(item.api_index)} 号api调用失败，状态码 {status}")
+                        err_set.add_error(item.api_index)
+                        breaker.record_failure(item.api_index, account_context.account_key)
+
+                if unauthorized:
+                    self.logger.info(f"{len(unauthorized)} 个子请求 token 失效")
+                    if self.check_token_deadline(account_context):
+                        self.logger.info("token过期导致失败，已刷新")
+                    else:
+                        self.logger.error("token刷新过程出错，function 'check_token_deadline' return false")
+                        for item in unauthorized:
+                            err_set.add_error(item.api_index)
+                        unauthorized = []
+
+                delay = None
+                if throttled:
+                    # 子请求的 429 同样按 RetryPolicy 等待：不超过 RETRY_MAX_BACKOFF 与运行截止时刻，并消耗重试预算
+                    delay = retry_policy.next_delay(
+                        RetryPolicy.endpoint_of(envelope.batch_url), throttle_attempt, {"Retry-After": str(wait_seconds)}
+                    )
+                    throttle_attempt += 1
+                    if delay is None:
+                        self.logger.error(f"{len(throttled)} 个子请求被限流，已无重试次数或预算")
+                        for item in throttled:
+                            err_set.add_error(item.api_index)
+                        throttled = []
+
+                pending = unauthorized + throttled
+                if not pending or attempt == Config.MAX_RETRIES:
+                    break
+                if throttled:
+                    self.logger.warning(f"{len(throttled)} 个子请求被限流，{delay:.2f}s 后重试")
+                    time.sleep(delay)
+
+            for item in pending:
+                self.logger.error(f"第 {str(item.api_index)} 号api重试 {Config.MAX_RETRIES} 次后仍失败")
+                err_set.add_error(item.api_index)
+        except Exception as e:
+            self.logger.error(f"核心逻辑错误：$batch 调用失败 - {envelope.batch_url}, Detail: [{e}]")
+        finally:
+            for item in allowed:
+                breaker.release_trial(item.api_index, account_context.account_key)
+
+    def run_api(self, api_list, account_context: AccountContext, err_set):
+        """
+        按照设定的轮次循环调用API
+        """
+        if Config.ENABLE_GRAPH_BATCH:
+            # 打包为 $batch 请求，API 调用延迟作用于每个 $batch
+            for envelope in Utils.build_batch_envelopes(api_list):
+                if Config.ENABLE_API_DELAY:
+                    time.sleep(random.randint(Config.API_DELAY_MIN, Config.API_DELAY_MAX))
+                self.call_batch_once(envelope, account_context, err_set)
+            return
+        for a in range(len(api_list)):
+            if Config.ENABLE_API_DELAY:
+                time.sleep(random.randint(Config.API_DELAY_MIN, Config.API_DELAY_MAX))
+            self.call_api_once(api_list[a], account_context, err_set)
+
+    def run_planned_api(self, account_context: AccountContext, err_set):
+        """
+        按运行计划中的时间线调用API，超出截止时刻后放弃剩余调用
+        """
+        calls = account_context.plan.calls
+        current_round = None
+        done = 0
+        for offset, round_no, api_list in Utils.group_planned_calls(calls):
+            wait_seconds = self.run_plan.seconds_until(offset)
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+            if self.run_plan.is_past_deadline():
+                self.logger.warning(
+                    f"应用/账号[{account_context.account_key}]已超出运行截止时刻，放弃剩余 {len(calls) - done} 次调用"
+                )
+                break
+            if round_no != current_round:
+                current_round = round_no
+                self.logger.info(f"应用/账号[{account_context.account_key}]的第[{str(current_round)}]轮开始")
+            if Config.ENABLE_GRAPH_BATCH:
+                for envelope in Utils.build_batch_envelopes(api_list):
+                    self.call_batch_once(envelope, account_context, err_set)
+            else:
+                self.call_api_once(api_list[0], account_context, err_set)
+            done += len(api_list)
 
 
     def core(self, account_context: AccountContext):
@@ -426,25 +1059,31 @@ class CallAPI(object):
         err_set = APIErrorSet()
 
         self.logger.info('共' + str(Config.ROUNDS_PER_RUN) + '轮')
-        for c in range(1, Config.ROUNDS_PER_RUN + 1):
-            # 运行轮次循环
-            if Config.ENABLE_RANDOM_START_DELAY:
-                time.sleep(random.randint(
-                    Config.ROUNDS_PER_DELAY_MIN, Config.ROUNDS_PER_DELAY_MAX))
-            for a in range(1, int(Config.APP_NUM) + 1):
-                self.logger.info(f"应用/账号[{account_context.account_key}]的第[{str(c)}]轮开始")
-                if Config.ENABLE_RANDOM_API_ORDER:
-                    api_list = Utils.fix_list()
-                    self.logger.info(f"已开启随机顺序,共 {len(api_list)} 个api")
-                    self.run_api(api_list, account_context, err_set)
-                else:
-                    self.logger.info("原版顺序,共10个api")
-                    api_list = [5, 9, 8, 1, 20, 24, 23, 6, 21, 22]
-                    self.run_api(api_list, account_context, err_set)
-            self.logger.info("本轮结束，等待启动下一轮")
+        if account_context.plan is not None and self.run_plan is not None:
+            # 按运行计划执行，轮次与调用间隔已包含在时间线中
+            self.logger.info(f"按运行计划执行,共 {len(account_context.plan.calls)} 次调用")
+            self.run_planned_api(account_context, err_set)
+        else:
+            for c in range(1, Config.ROUNDS_PER_RUN + 1):
+                # 运行轮次循环
+                if Config.ENABLE_RANDOM_START_DELAY:
+                    time.sleep(random.randint(
+                        Config.ROUNDS_PER_DELAY_MIN, Config.ROUNDS_PER_DELAY_MAX))
+                for a in range(1, Utils.api_lists_per_round() + 1):
+                    self.logger.info(f"应用/账号[{account_context.account_key}]的第[{str(c)}]轮开始")
+                    if Config.ENABLE_RANDOM_API_ORDER:
+                        api_list = Utils.fix_list(account_context.account_key)
+                        self.logger.info(f"已开启随机顺序,共 {len(api_list)} 个api")
+                        self.run_api(api_list, account_context, err_set)
+                    else:
+                        self.logger.info("原版顺序,共10个api")
+                        api_list = [5, 9, 8, 1, 20, 24, 23, 6, 21, 22]
+                        self.run_api(api_list, account_context, err_set)
+                self.logger.info("本轮结束，等待启动下一轮")
 
 
         end_time = time.time()  # 统计时间结束
+        MetricsRegistry.get_instance().account_run_seconds.observe(end_time - begin_time)
         run_time = round(end_time - begin_time)
         hour = run_time // 3600
         minute = (run_time - 3600 * hour) // 60
@@ -452,7 +1091,9 @@ class CallAPI(object):
 
         run_times = [hour, minute, second]
 
-        if err_set.has_error:
+        if self.run_report is not None:
+            self.run_report.record(err_set, end_time - begin_time)
+        elif err_set.has_error:
             try:
                 Utils.send_message(1, run_times, err_set)
             except Exception as e:
@@ -494,6 +1135,107 @@ class CallAPI(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.logger.info("执行主进程清理工作")
 
+def run_accounts(run_service: RunService, enabled_indices, start_time: float, end_time: float = None):
+    """
+    在当前进程中运行给定账号
+    :param start_time: 任务开始时刻，用于从运行时间预算中扣除已消耗的时间
+    :param end_time: 本次运行的预算截止时刻（time.time），为空时为 start_time + RUN_TIME_BUDGET；租约分批运行时为本批分得的截止时刻
+    """
+    if run_service.run_report is not None:
+        run_service.run_report.shards.append(str(run_service.shard or Config.SHARD_INDEX))
+    run_service.prefetch_accounts(enabled_indices)
+    if Config.RUN_TIME_BUDGET is not None:
+        # 扣除初始化已消耗的时间后生成运行计划
+        end_time = end_time or start_time + Config.RUN_TIME_BUDGET
+        run_service.run_plan = RunPlanner().build(enabled_indices, end_time - time.time())
+
+    call_api = CallAPI(
+        session=run_service.session,
+        job_detail_service=run_service.job_detail_service,
+        account_service=run_service.accountService,
+        run_plan=run_service.run_plan,
+        account_snapshot=run_service.account_snapshot,
+        run_report=run_service.run_report
+    )
+    if Config.EXECUTION_MODE == "async":
+        from async_call_api import AsyncCallAPI
+        async_call_api = AsyncCallAPI(
+            job_detail_service=run_service.job_detail_service,
+            account_service=run_service.accountService,
+            run_plan=run_service.run_plan,
+            account_snapshot=run_service.account_snapshot,
+            run_report=run_service.run_report
+        )
+        return run_service.schedule_startup_async(enabled_indices, async_call_api)
+    return run_service.schedule_startup(enabled_indices, call_api.run, prewarm_api=call_api)
+
+
+def run_selected(run_service: RunService, enabled_indices, start_time: float, end_time: float = None):
+    """
+    运行给定账号：配置 SHARD_PROCESSES 时分配到多个子进程，否则在当前进程中运行
+    :param end_time: 同 run_accounts
+    """
+    if Config.SHARD_PROCESSES > 1:
+        run_service.run_shards(enabled_indices, start_time, end_time)
+    else:
+        run_accounts(run_service, enabled_indices, start_time, end_time)
+
+
+def run_leased(run_service: RunService, enabled_indices, start_time: float):
+    """
+    按数据库租约分批认领账号并运行，直到没有可认领的账号
+    多个 runner 共用同一数据库时各自认领不同的账号，吞吐随 runner 数量增长
+    配置 RUN_TIME_BUDGET 时剩余预算按本 runner 尚需运行的批数均分；剩余预算不足以生成运行计划时停止认领，
+    剩余账号留给其他 runner
+    """
+    from dao.account_lease_service import AccountLeaseService
+    keys = list(Config.USER_TOKEN_DICT.keys())
+    index_of = {keys[idx]: idx for idx in enabled_indices}
+    lease_manager = AccountLeaseManager(AccountLeaseService(), run_service.job_id)
+    lease_manager.register(list(index_of))
+    lease_manager.start()
+    try:
+        while True:
+            end_time = None
+            if Config.RUN_TIME_BUDGET is not None:
+                remaining = start_time + Config.RUN_TIME_BUDGET - time.time()
+                batches = max(1, math.ceil(lease_manager.pending() / lease_manager.batch_size))
+                # 每批都要预留请求超时与安全余量，均分后容纳不下运行计划时减少批数，余下的账号留给其他 runner
+                while batches > 1 and RunPlanner.call_window(remaining / batches) <= 0:
+                    batches -= 1
+                if RunPlanner.call_window(remaining / batches) <= 0:
+                    logging.warning(f"剩余运行预算 {remaining:.0f}s 不足以生成运行计划，停止认领账号，剩余账号留给其他 runner")
+                    break
+                end_time = time.time() + remaining / batches
+            claimed = lease_manager.claim()
+            if not claimed:
+                break
+            run_selected(run_service, [index_of[env_name] for env_name in claimed], start_time, end_time)
+            lease_manager.complete(claimed)
+    finally:
+        lease_manager.stop()
+        stats = lease_manager.stats()
+        logging.info(
+            f"账号租约统计：认领 {stats['claimed']} 个，完成 {stats['completed']} 个，"
+            f"续约 {stats['renewals']} 次，被回收 {stats['lost']} 个"
+        )
+
+
+def run_shard(shard: str, enabled_indices, job_id: str, config_snapshot: dict, start_time: float,
+              end_time: float = None) -> dict:
+    """
+    本机分片子进程入口（spawn 启动，须为模块级函数）
+    :return: RunReport.to_dict()
+    """
+    Config.restore(config_snapshot)
+    CLogger.setup_logger(shard)
+    with RunService(shard=shard, job_id=job_id) as run_service:
+        run_accounts(run_service, enabled_indices, start_time, end_time)
+    # 子进程由进程池结束，不执行 atexit，须先写出队列中的日志
+    CLogger.flush()
+    return run_service.run_report.to_dict()
+
+
 def entrance():
     time_formate = "%Y-%m-%d %H:%M:%S"
     start_time = time.time()
@@ -501,12 +1243,14 @@ def entrance():
 
     try:
         with RunService() as run_service:
-            call_api = CallAPI(
-                session=run_service.session,
-                job_detail_service=run_service.job_detail_service,
-                account_service=run_service.accountService
-            )
-            futures = run_service.schedule_startup(Utils.select_enabled_indices(), call_api.run)
+            enabled_indices = Utils.select_enabled_indices()
+            if Config.SHARD_INDEX is not None:
+                enabled_indices = Utils.split_shards(enabled_indices, Config.SHARD_COUNT)[Config.SHARD_INDEX]
+                logging.info(f"多 runner 分片：本 runner 负责第 {Config.SHARD_INDEX}/{Config.SHARD_COUNT} 个分片，共 {len(enabled_indices)} 个账号")
+            if Config.ENABLE_ACCOUNT_LEASE and run_service.accountService is not None:
+                run_leased(run_service, enabled_indices, start_time)
+            else:
+                run_selected(run_service, enabled_indices, start_time)
 
     except Exception as e:
         Utils.send_message(-100, None, e)
@@ -521,9 +1265,33 @@ def entrance():
     sys.exit(0)  # 强制程序退出
 
 
+def dry_run(output_file=None):
+    """
+    仅生成并输出运行计划，不发起任何请求
+    :param output_file: 完整时间线的输出文件（JSON），为空则只输出摘要
+    """
+    if Config.RUN_TIME_BUDGET is None:
+        raise BasicException(ErrorCode.RUN_PLAN_ERROR, extra="dry-run 需要配置 RUN_TIME_BUDGET")
+    run_plan = RunPlanner().build(Utils.select_enabled_indices(), Config.RUN_TIME_BUDGET)
+    print(json.dumps(run_plan.summary(), ensure_ascii=False, indent=2))
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(run_plan.to_dict(), f, ensure_ascii=False, indent=2)
+        logging.info(f"完整运行计划已写入 {output_file}")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true', help='仅输出运行计划，不发起请求')
+    parser.add_argument('--plan-output', default=None, help='dry-run 时完整时间线的输出文件')
+    args = parser.parse_args()
+
     # 日志初始化:
     CLogger.setup_logger()
     Config.load()
+    CLogger.apply_config()
+    if args.dry_run:
+        dry_run(args.plan_output)
+        sys.exit(0)
     # 进入主逻辑
     entrance()
@@ -1,7 +1,10 @@
+import hashlib
 from datetime import datetime, timezone, timedelta
 
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy import Column, String, Integer, DateTime, CHAR
+
+from pojo.frozen_record import FrozenRecord
 
 Base = declarative_base()
 
@@ -10,9 +13,23 @@ class Account(Base):
 
     env_name = Column(String(10), primary_key=True, autoincrement=False)
     access_token = Column(String(300), nullable=True)
+    access_token_hash = Column(CHAR(64), nullable=True, index=True)   # access_token 的 SHA-256 指纹，用于反查
     refresh_token = Column(String(300), nullable=True)
     expires_at = Column(DateTime)
     user_agent = Column(String(300))
     proxy = Column(String(300))
     update_time = Column(DateTime, default=lambda: datetime.now(timezone.utc) + timedelta(hours=8), onupdate=lambda: datetime.now(timezone.utc) + timedelta(hours=8))
-    create_time = Column(DateTime)
\ No newline at end of file
+    create_time = Column(DateTime)
+
+    @staticmethod
+    def fingerprint(access_token: str):
+        """access_token 的定长指纹（SHA-256 十六进制），与 MySQL SHA2(access_token, 256) 一致"""
+        if access_token is None:
+            return None
+        return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+class AccountRecord(FrozenRecord):
+    """AccountService 读接口返回的只读账号快照"""
+    __slots__ = tuple(column.name for column in Account.__table__.columns)
+    columns = tuple(Account.__table__.columns)
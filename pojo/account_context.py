@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional
 
+from pojo.run_plan import AccountPlan
+
 @dataclass
 class AccountContext:
     account_key: str
@@ -8,3 +10,5 @@ class AccountContext:
     account_token: Optional[str] = None
     proxy: Optional[str] = None
     user_agent: Optional[str] = None
+    plan: Optional[AccountPlan] = None
+    templates: dict = field(default_factory=dict, repr=False)   # api_index → 预解析的请求模板
@@ -0,0 +1,21 @@
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, String, DateTime, BigInteger
+
+from pojo.frozen_record import FrozenRecord
+
+Base = declarative_base()
+
+class AccountLease(Base):
+    __tablename__ = 'account_lease'
+
+    env_name = Column(String(20), primary_key=True, autoincrement=False)   # 账号 env_name
+    owner = Column(BigInteger, nullable=True)                               # 持有租约的任务 job_id，空闲时为空
+    lease_expires = Column(DateTime, nullable=True, index=True)             # 租约到期时间，到期后可被其他任务回收
+    completed_at = Column(DateTime, nullable=True)                          # 最近一次运行完成的时间
+    completed_by = Column(BigInteger, nullable=True)                        # 最近一次完成运行的任务 job_id
+
+
+class AccountLeaseRecord(FrozenRecord):
+    """AccountLeaseService 读接口返回的只读租约快照"""
+    __slots__ = tuple(column.name for column in AccountLease.__table__.columns)
+    columns = tuple(AccountLease.__table__.columns)
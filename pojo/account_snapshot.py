@@ -0,0 +1,24 @@
+class AccountSnapshot:
+    """
+    本次任务内的账号快照
+    任务开始时一次性批量读取全部启用账号，运行期间只读，避免每个账号重复查询数据库
+    """
+
+    def __init__(self, records: dict = None):
+        self._records = dict(records or {})
+
+    def get(self, env_name: str):
+        return self._records.get(env_name)
+
+    def put(self, env_name: str, record):
+        self._records[env_name] = record
+
+    def missing(self, env_names):
+        """返回快照中不存在的账号"""
+        return [env_name for env_name in env_names if env_name not in self._records]
+
+    def __contains__(self, env_name):
+        return env_name in self._records
+
+    def __len__(self):
+        return len(self._records)
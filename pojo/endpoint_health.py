@@ -0,0 +1,26 @@
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy.orm import declarative_base
+from sqlalchemy import Column, String, Integer, DateTime, SmallInteger
+
+from pojo.frozen_record import FrozenRecord
+
+Base = declarative_base()
+
+class EndpointHealth(Base):
+    __tablename__ = 'endpoint_health'
+
+    api_index = Column(SmallInteger, primary_key=True, autoincrement=False)   # Config.API_LIST 中的序号
+    tenant = Column(String(20), primary_key=True)                             # 账号 env_name，全局熔断时为 *
+    state = Column(String(10), nullable=False)                                # closed / open / half_open
+    consecutive_failures = Column(Integer, nullable=False, default=0)
+    total_failures = Column(Integer, nullable=False, default=0)
+    total_successes = Column(Integer, nullable=False, default=0)
+    opened_at = Column(DateTime)
+    update_time = Column(DateTime, default=lambda: datetime.now(timezone.utc) + timedelta(hours=8), onupdate=lambda: datetime.now(timezone.utc) + timedelta(hours=8))
+
+
+class EndpointHealthRecord(FrozenRecord):
+    """EndpointHealthService 读接口返回的只读快照"""
+    __slots__ = tuple(column.name for column in EndpointHealth.__table__.columns)
+    columns = tuple(EndpointHealth.__table__.columns)
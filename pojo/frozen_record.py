@@ -0,0 +1,47 @@
+class FrozenRecord:
+    """
+    只读行快照基类
+    以 __slots__ 存储字段，直接由查询返回的行元组构造，不经过 SQLAlchemy 的属性跟踪，构造后不可修改。
+    子类将 __slots__ 设为对应表的列名（与 select 的列顺序一致）。
+    """
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"{self.__class__.__name__} 不存在字段: {', '.join(fields)}")
+
+    @classmethod
+    def from_row(cls, row):
+        """由行元组构造，字段顺序与 __slots__ 一致"""
+        record = object.__new__(cls)
+        for name, value in zip(cls.__slots__, row):
+            object.__setattr__(record, name, value)
+        return record
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新快照"""
+        fields = self.to_dict()
+        fields.update(changes)
+        return self.__class__(**fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} 为只读快照，不能修改字段 {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} 为只读快照，不能删除字段 {name}")
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
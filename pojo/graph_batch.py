@@ -0,0 +1,49 @@
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class BatchItem:
+    request_id: str                 # 子请求 id，在同一个 $batch 内唯一
+    api_index: int                  # Config.API_LIST 中的序号
+    url: str                        # 相对版本根地址的路径，如 /me/drive
+
+
+@dataclass
+class BatchEnvelope:
+    """
+    一个 Graph JSON $batch 请求（同一版本根地址，最多 20 个子请求）
+    """
+    batch_url: str                  # 如 https://graph.microsoft.com/v1.0/$batch
+    items: List[BatchItem] = field(default_factory=list)
+
+    @staticmethod
+    def payload(items):
+        return {
+            "requests": [
+                {"id": item.request_id, "method": "GET", "url": item.url}
+                for item in items
+            ]
+        }
+
+    @staticmethod
+    def split_responses(body: dict):
+        """
+        拆分 $batch 响应
+        :return: {request_id: (status, headers)}，响应中缺失的子请求不出现在结果中
+        """
+        results = {}
+        for response in (body or {}).get("responses", []):
+            results[str(response.get("id"))] = (int(response.get("status", 0)), response.get("headers") or {})
+        return results
+
+    @staticmethod
+    def retry_after(headers: dict, default: float) -> float:
+        """子请求 429 时的等待秒数，取 Retry-After，缺失或非法时使用默认值"""
+        for key, value in headers.items():
+            if key.lower() == "retry-after":
+                try:
+                    return max(0.0, float(value))
+                except (TypeError, ValueError):
+                    break
+        return default
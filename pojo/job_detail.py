@@ -1,5 +1,7 @@
-from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, String, DateTime, SmallInteger, BigInteger
+from sqlalchemy.orm import declarative_base, deferred
+from sqlalchemy import Column, String, DateTime, SmallInteger, BigInteger, Text
+
+from pojo.frozen_record import FrozenRecord
 
 Base = declarative_base()
 
@@ -15,4 +17,12 @@ class JobDetail(Base):
     ip_address = Column(String(45))
     host_city = Column(String(20))
     host_timezone = Column(String(20))
-    isp = Column(String(100))
\ No newline at end of file
+    isp = Column(String(100))
+    # 运行指标摘要（JSON），仅由 update_metrics 写入；延迟加载，未执行 Migrate 的库缺少该列时查询与删除不受影响
+    metrics = deferred(Column(Text))
+
+class JobDetailRecord(FrozenRecord):
+    """JobDetailService 读接口返回的只读任务快照"""
+    # 不含 metrics 列，读取任务记录不依赖该列已迁移
+    columns = tuple(column for column in JobDetail.__table__.columns if column.name != "metrics")
+    __slots__ = tuple(column.name for column in columns)
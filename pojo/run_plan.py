@@ -0,0 +1,88 @@
+import time
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+
+@dataclass
+class PlannedCall:
+    offset: float                   # 相对任务开始时刻的秒数
+    round_no: int                   # 所属轮次（从 1 开始）
+    api_index: int                  # Config.API_LIST 中的序号
+
+
+@dataclass
+class AccountPlan:
+    account_key: str
+    refresh_token: str
+    start_offset: float             # 账号登陆（获取 token）的开始时刻
+    calls: List[PlannedCall] = field(default_factory=list)
+
+
+@dataclass
+class RunPlan:
+    """
+    一次任务的完整调用时间线
+    所有时间均为相对 started_at 的偏移秒数，started_at 在执行器开始调度时写入
+    """
+    budget: float                   # 可用时间预算
+    deadline: float                 # 最后一次调用的截止偏移，超出即放弃剩余调用
+    accounts: List[AccountPlan] = field(default_factory=list)
+    started_at: Optional[float] = None
+    created_at: float = field(default_factory=time.monotonic)
+    scale: float = 1.0              # 时间线压缩比例，扣除开始调度前已消耗的时间
+
+    @property
+    def total_calls(self):
+        return sum(len(account.calls) for account in self.accounts)
+
+    def start(self):
+        """
+        记录执行开始时刻（time.monotonic）
+        计划生成后到开始调度前消耗的时间（如 token 预热）同样计入预算，时间线按比例压缩到剩余窗口内
+        """
+        self.started_at = time.monotonic()
+        self.scale = max(0.0, 1 - (self.started_at - self.created_at) / self.deadline)
+
+    @property
+    def deadline_at(self) -> float:
+        """调用截止时刻（time.monotonic）"""
+        return self.started_at + self.deadline * self.scale
+
+    def seconds_until(self, offset: float) -> float:
+        """距离指定偏移时刻还需等待的秒数，已过时返回负数"""
+        return self.started_at + offset * self.scale - time.monotonic()
+
+    def is_past_deadline(self) -> bool:
+        return self.seconds_until(self.deadline) < 0
+
+    def summary(self, bucket_seconds: int = 60):
+        """
+        生成用于 dry-run 检查的统计摘要
+        :param bucket_seconds: 统计请求分布的时间桶大小
+        """
+        offsets = sorted(call.offset for account in self.accounts for call in account.calls)
+        buckets = [0] * (int(self.deadline // bucket_seconds) + 1)
+        for offset in offsets:
+            buckets[int(offset // bucket_seconds)] += 1
+        return {
+            "budget": round(self.budget, 2),
+            "deadline": round(self.deadline, 2),
+            "accounts": len(self.accounts),
+            "total_calls": len(offsets),
+            "first_call": round(offsets[0], 2) if offsets else None,
+            "last_call": round(offsets[-1], 2) if offsets else None,
+            "avg_calls_per_second": round(len(offsets) / self.deadline, 4) if self.deadline else None,
+            "bucket_seconds": bucket_seconds,
+            "max_calls_per_bucket": max(buckets) if offsets else 0,
+            "min_calls_per_bucket": min(buckets) if offsets else 0,
+        }
+
+    def to_dict(self):
+        data = asdict(self)
+        # refresh_token 不落盘
+        for account in data["accounts"]:
+            account.pop("refresh_token", None)
+        data.pop("started_at", None)
+        data.pop("created_at", None)
+        data.pop("scale", None)
+        return data
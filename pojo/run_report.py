@@ -0,0 +1,84 @@
+import threading
+from dataclasses import dataclass, field
+
+from pojo.api_error_set import APIErrorSet
+
+
+@dataclass
+class RunReport:
+    """
+    分片运行结果：分片模式下各账号不单独发送通知，失败情况汇总到此处
+    子进程/各 runner 的结果经 to_dict/from_dict 传回后合并，由主进程发送一条通知
+    """
+    shards: list = field(default_factory=list)              # 已合并的分片序号
+    accounts: int = 0                                       # 运行结束的账号数
+    failed_accounts: int = 0                                # 存在调用失败的账号数
+    errors: dict = field(default_factory=dict)              # api_index → 调用失败的账号数
+    max_run_seconds: float = 0                              # 单个账号的最长运行耗时（s）
+    metrics: list = field(default_factory=list)             # 各分片的运行指标摘要
+    failed_shards: list = field(default_factory=list)       # 异常退出的分片序号
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def record(self, err_set: APIErrorSet, run_seconds: float):
+        """登记一个账号的运行结果，线程安全"""
+        with self._lock:
+            self.accounts += 1
+            self.max_run_seconds = max(self.max_run_seconds, run_seconds)
+            if not err_set.has_error:
+                return
+            self.failed_accounts += 1
+            for api_index in err_set.to_list():
+                self.errors[api_index] = self.errors.get(api_index, 0) + 1
+
+    def merge(self, other: "RunReport"):
+        with self._lock:
+            self.shards.extend(other.shards)
+            self.accounts += other.accounts
+            self.failed_accounts += other.failed_accounts
+            for api_index, count in other.errors.items():
+                self.errors[api_index] = self.errors.get(api_index, 0) + count
+            self.max_run_seconds = max(self.max_run_seconds, other.max_run_seconds)
+            self.metrics.extend(other.metrics)
+            self.failed_shards.extend(other.failed_shards)
+
+    @property
+    def has_error(self):
+        return bool(self.errors)
+
+    def to_error_set(self) -> APIErrorSet:
+        """合并后的失败接口集合，用于发送通知"""
+        err_set = APIErrorSet()
+        for api_index in sorted(self.errors):
+            err_set.add_error(api_index)
+        return err_set
+
+    def run_times(self):
+        """
+        :return: 最长账号耗时的 [时, 分, 秒]
+        """
+        run_time = round(self.max_run_seconds)
+        return [run_time // 3600, run_time % 3600 // 60, run_time % 60]
+
+    def to_dict(self) -> dict:
+        return {
+            "shards": list(self.shards),
+            "accounts": self.accounts,
+            "failed_accounts": self.failed_accounts,
+            # JSON 的键只能是字符串
+            "errors": {str(api_index): count for api_index, count in self.errors.items()},
+            "max_run_seconds": self.max_run_seconds,
+            "metrics": list(self.metrics),
+            "failed_shards": list(self.failed_shards),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunReport":
+        return cls(
+            shards=list(data.get("shards", [])),
+            accounts=data.get("accounts", 0),
+            failed_accounts=data.get("failed_accounts", 0),
+            errors={int(api_index): count for api_index, count in data.get("errors", {}).items()},
+            max_run_seconds=data.get("max_run_seconds", 0),
+            metrics=list(data.get("metrics", [])),
+            failed_shards=list(data.get("failed_shards", [])),
+        )
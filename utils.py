@@ -11,16 +11,16 @@ import time
 import random
 import logging
 import os
-
-from sqlalchemy import make_url, create_engine
-from sqlalchemy.orm import sessionmaker
+import hashlib
 
 from config import Config
-from dao.job_detail_service import JobDetailService
 from errorInfo import ErrorCode
 from errorInfo import BasicException
+from configuration.circuit_breaker import CircuitBreaker
 from configuration.logger_config import CLogger
 from pojo.api_error_set import APIErrorSet
+from pojo.graph_batch import BatchEnvelope, BatchItem
+from pojo.run_report import RunReport
 from print_debug_info import PrintDebugInfo
 
 
@@ -29,14 +29,22 @@ class Utils:
     工具类
     """
     @staticmethod
-    def fix_list():
+    def fix_list(tenant: str = None):
+        """
+        :param tenant: 账号键，用于按账号跳过熔断中的接口
+        """
+        breaker = CircuitBreaker.get_instance()
         # 随机api序列
         fixed_api = [0, 1, 5, 6, 20, 21]
         # 保证抽取到outlook,onedrive的api
         ex_api = [2, 3, 4, 7, 8, 9, 10, 22, 23, 24, 25,
                   26, 27, 13, 14, 15, 16, 17, 18, 19, 11, 12]
+        total = len(fixed_api) + 6
+        # 跳过熔断中的接口，空缺由其他可用接口替补
+        fixed_api = [api_index for api_index in fixed_api if breaker.available(api_index, tenant)]
+        ex_api = [api_index for api_index in ex_api if breaker.available(api_index, tenant)]
         # 额外抽取填充的api
-        fixed_api.extend(random.sample(ex_api, 6))
+        fixed_api.extend(random.sample(ex_api, min(len(ex_api), total - len(fixed_api))))
         random.shuffle(fixed_api)
 
         # 临时添加调试功能
@@ -45,6 +53,69 @@ class Utils:
 
         return fixed_api
 
+    @staticmethod
+    def api_lists_per_round() -> int:
+        """
+        每个账号每轮调用的 API 列表数
+        """
+        return Config.API_LISTS_PER_ROUND or int(Config.APP_NUM)
+
+    @staticmethod
+    def build_round_api_lists(tenant: str = None):
+        """
+        生成一轮内各次调用的 API 序号列表，与 CallAPI.core 的轮内循环保持一致
+        :param tenant: 账号键，用于按账号跳过熔断中的接口
+        :return: [[api_index, ...], ...]
+        """
+        round_lists = []
+        for _ in range(Utils.api_lists_per_round()):
+            if Config.ENABLE_RANDOM_API_ORDER:
+                round_lists.append(Utils.fix_list(tenant))
+            else:
+                round_lists.append([5, 9, 8, 1, 20, 24, 23, 6, 21, 22])
+        return round_lists
+
+    @staticmethod
+    def build_batch_envelopes(api_list, batch_size: int = None):
+        """
+        将一组 API 序号按版本根地址（v1.0/beta）分组，打包为 Graph $batch 请求
+        :param api_list: Config.API_LIST 中的序号列表
+        :param batch_size: 单个 $batch 的子请求数上限，默认 Config.GRAPH_BATCH_SIZE
+        :return: [BatchEnvelope, ...]
+        """
+        batch_size = batch_size or Config.GRAPH_BATCH_SIZE
+        groups = {}
+        for pos, api_index in enumerate(api_list):
+            url = Config.API_LIST[api_index]
+            prefix = next((p for p in Config.API_PREFIXES if url.startswith(p)), None)
+            if prefix is None:
+                raise BasicException(ErrorCode.INVOKE_API_ERROR, extra=f"无法打包为 $batch 请求的接口: {url}")
+            groups.setdefault(prefix, []).append(BatchItem(str(pos), api_index, url[len(prefix):] or "/"))
+
+        envelopes = []
+        for prefix, items in groups.items():
+            for start in range(0, len(items), batch_size):
+                envelopes.append(BatchEnvelope(f"{prefix}/$batch", items[start:start + batch_size]))
+        return envelopes
+
+    @staticmethod
+    def group_planned_calls(calls):
+        """
+        将运行计划中的调用整理为执行步骤
+        开启 $batch 时同一轮内连续的调用按 GRAPH_BATCH_SIZE 合并为一步，在其中第一次调用的时刻发出
+        :param calls: [PlannedCall, ...]
+        :return: [(offset, round_no, [api_index, ...]), ...]
+        """
+        if not Config.ENABLE_GRAPH_BATCH:
+            return [(call.offset, call.round_no, [call.api_index]) for call in calls]
+        steps = []
+        for call in calls:
+            if steps and steps[-1][1] == call.round_no and len(steps[-1][2]) < Config.GRAPH_BATCH_SIZE:
+                steps[-1][2].append(call.api_index)
+            else:
+                steps.append((call.offset, call.round_no, [call.api_index]))
+        return steps
+
     @staticmethod
     def send_message(err_type: int, run_times = None, content: Union[str, APIErrorSet, Exception] = None):
         """
@@ -135,6 +206,52 @@ class Utils:
         response.raise_for_status()
 
 
+    @staticmethod
+    def notify_report(report: RunReport):
+        """
+        分片模式：按合并后的运行结果发送一条通知
+        """
+        if report.failed_shards:
+            Utils.send_message(-100, None, f"分片 {sorted(report.failed_shards)} 异常退出，结果未计入")
+        if not report.has_error:
+            return
+        try:
+            Utils.send_message(1, report.run_times(), report.to_error_set())
+        except Exception as e:
+            logging.error(f"{ErrorCode.SEND_NOTICE_ERROR}: {e}")
+
+    @staticmethod
+    def merge_shards(files) -> None:
+        """
+        多 runner 分片的汇总：合并各 runner 的结果文件，发送一条通知，指标摘要写入共用的任务记录
+        :param files: 各 runner 写出的 SHARD_RESULT_FILE
+        """
+        report = RunReport()
+        for path in files:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    report.merge(RunReport.from_dict(json.load(f)))
+            except (OSError, ValueError) as e:
+                logging.error(f"分片结果文件 {path} 读取失败: {e}")
+                report.failed_shards.append(os.path.basename(path))
+        logging.info(
+            f"分片结果合并完成：分片 {sorted(report.shards)}，账号 {report.accounts} 个，"
+            f"存在调用失败的账号 {report.failed_accounts} 个"
+        )
+        Utils.notify_report(report)
+
+        database_url = os.getenv("DATABASE_URL")
+        job_id = os.getenv("JOB_ID")
+        if database_url is None or job_id is None:
+            return
+        summary = json.dumps({"shards": report.metrics}, ensure_ascii=False, separators=(",", ":"))
+        # 数据库相关模块按需导入，本地模式不加载 SQLAlchemy
+        from dao.job_detail_service import JobDetailService
+        try:
+            JobDetailService(database_url).update_metrics(int(job_id), summary)
+        except Exception as e:
+            raise BasicException(ErrorCode.UPDATE_DATABASE_ERROR, extra=e)
+
     @staticmethod
     def post_process() -> None:
         """
@@ -155,6 +272,7 @@ class Utils:
             )
 
         logging.info("开始执行任务后处理，状态写入数据库")
+        from dao.job_detail_service import JobDetailService
         try:
             job_id = int(job_id)
             job_detail_service = JobDetailService(database_url)
@@ -163,6 +281,29 @@ class Utils:
             raise BasicException(ErrorCode.UPDATE_DATABASE_ERROR, extra=e)
         logging.info(f"后置处理已完成，更新 job_id={job_id} 的任务状态为 success")
 
+    @staticmethod
+    def migrate() -> None:
+        """
+        执行数据库迁移：account.access_token_hash 指纹列、索引与回填，endpoint_health 表，job_detail.metrics 列，account_lease 表
+        """
+        database_url = os.getenv("DATABASE_URL")
+        # 工作流中未配置的 secret 为空字符串
+        if not database_url:
+            logging.warning("未配置数据库，无需执行迁移")
+            return
+        from dao.account_lease_service import AccountLeaseService
+        from dao.account_service import AccountService
+        from dao.endpoint_health_service import EndpointHealthService
+        from dao.job_detail_service import JobDetailService
+        try:
+            AccountService(database_url).migrate_access_token_hash()
+            EndpointHealthService(database_url).create_table()
+            JobDetailService(database_url).migrate_metrics_column()
+            AccountLeaseService(database_url).create_table()
+        except Exception as e:
+            raise BasicException(ErrorCode.UPDATE_DATABASE_ERROR, extra=e)
+        logging.info("数据库迁移已完成")
+
     @staticmethod
     def write_env(keys, values):
         """
@@ -215,14 +356,39 @@ class Utils:
         索引对应 USER_TOKEN_DICT keys 的顺序，顺序随机。
         例如返回 [0,2,5] 表示选中字典中第 0、2、5 个 key。
         """
+        # 多 runner 分片时以共用的 JOB_ID 为种子，使各 runner 选出相同的账号集合
+        rng = random.Random(Config.JOB_ID) if Config.SHARD_COUNT > 1 and Config.JOB_ID else random
         if Config.ENABLE_NUM == -1:
             # 随机打乱全部索引顺序返回
             indices = list(range(Config.APP_NUM))
         else:
-            indices = random.sample(range(Config.APP_NUM), Config.ENABLE_NUM)
+            indices = rng.sample(range(Config.APP_NUM), Config.ENABLE_NUM)
         random.shuffle(indices)
         return indices
 
+    @staticmethod
+    def shard_of(account_key: str, shard_count: int, salt: str = "") -> int:
+        """
+        账号所属的分片序号，按账号键的哈希取模，不随运行与进程变化
+        :param salt: 多级分片时各级使用不同的盐，避免下一级分片与上一级的取模结果相关
+        """
+        # 不使用 CRC32：其低位在加盐前后线性相关，两级分片会落在同一组
+        digest = hashlib.blake2b(f"{salt}{account_key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % shard_count
+
+    @staticmethod
+    def split_shards(indices, shard_count: int, salt: str = ""):
+        """
+        将账号索引按账号键哈希划分为 shard_count 个分片，各分片内保持原有顺序
+        :param indices: USER_TOKEN_DICT keys 的索引列表
+        :return: [[index, ...], ...]，长度为 shard_count
+        """
+        keys = list(Config.USER_TOKEN_DICT.keys())
+        shards = [[] for _ in range(shard_count)]
+        for idx in indices:
+            shards[Utils.shard_of(keys[idx], shard_count, salt)].append(idx)
+        return shards
+
     @staticmethod
     def add_beijing_timezone(dt: datetime) -> datetime:
         """
@@ -261,7 +427,8 @@ class Utils:
 if __name__ == "__main__":
     CLogger.setup_logger()
     parser = argparse.ArgumentParser()
-    parser.add_argument('--task', choices=["PostProcess", 'task2'], required=True, help='任务名称')
+    parser.add_argument('--task', choices=["PostProcess", "Migrate", "MergeShards", 'task2'], required=True, help='任务名称')
+    parser.add_argument('--files', nargs='*', default=[], help='MergeShards：各 runner 的分片结果文件')
     args = parser.parse_args()
 
     # 任务全部完成的后处理
@@ -271,3 +438,16 @@ if __name__ == "__main__":
         except Exception as e:
             logging.error(e)
 
+    # 数据库迁移
+    if args.task == "Migrate":
+        try:
+            Utils.migrate()
+        except Exception as e:
+            logging.error(e)
+
+    # 多 runner 分片结果汇总
+    if args.task == "MergeShards":
+        try:
+            Utils.merge_shards(args.files)
+        except Exception as e:
+            logging.error(e)